@@ -1,48 +1,64 @@
 # -*- coding: utf-8 -*-
-
+"""
 # **WELLBOT: WELL.CA'S PHARMACY CHAT BOT**
 
 *   Includes four primary scenarios: Prescription Ordering, Prescription Management, Mediction Information Index, and Feedback/Improvement.
 
-* The user_registration function creates a new user and stores the information in a JSON file to be later pulled by the user_Login function
-* The four scenarios are connected by the main pharmacy_chatbot function that prompts the user to login or register then takes the user to the main welcome menu which calls upon the main scenario functions
+* Registration creates a new user in the UserStore (users table of wellbot.db, salted PBKDF2 password hashes) to be later checked at login
+* The business logic lives in the WellBotEngine class (no input()/print(), every method returns a dict), so scripted sessions can drive the engine in-process (`python benchmark.py engine`)
+* The conversation (login/register -> welcome menu -> each scenario's sub-menus) is the DIALOG state table: a session is a small JSON-serializable dict and each customer message is one step() call, so one process can multiplex many sessions (`python benchmark.py dialog`); pharmacy_chatbot runs one session on the terminal
+* `python Wellbot.py --serve` serves the same dialog to web customers over HTTP (/sessions) and WebSocket (/ws) from a stdlib asyncio server (ChatServer); `python benchmark.py chat` is the load generator
+* `python Wellbot.py --serve --processes N` pre-forks N workers on one listening socket; users, prescriptions and HTTP sessions live in one SQLite database (wellbot.db, WELLBOT_DB) shared by all of them, and the terminal bot and a single-process server use the same database (`python benchmark.py scaling`)
+* Hot paths (store loads, login, pricing, stock, OpenFDA, sentiment scoring, every engine operation and dialog step) are timed into per-operation latency histograms plus event counters (`metrics`); off unless WELLBOT_METRICS=1 or `--metrics-dump FILE`, exported as Prometheus text or JSON and at GET /metrics in server mode (`python benchmark.py metrics` measures the overhead)
+* A sampling profiler (`--profile FILE`, or `kill -USR2 <pid>` to toggle it in a running bot or server) writes folded stacks for flame graphs
 
 **Scenario 1: Prescription Ordering**
-* connected to the prescription JSON file
-* uses random to generate RX numbers  
+* connected to the prescription store (prescriptions table of wellbot.db; prescriptions.json/prescriptions.log from earlier versions are merged in on first use)
+* through the PrescriptionRepository: prescriptions are loaded once and indexed by number, medication, customer, sending pharmacy and fax_needed; writes go through to the store, and with the shared SQLite store each process picks up the others' writes before it reads
+* uses the PrescriptionNumberAllocator (block-leased sequence in rx_sequence) to generate unique, sortable RX numbers
 ---
 Includes:
 * Initiate Prescription Transfer (Incoming)
 > *functions:* generate_prescription_number
+> * `python Wellbot.py --import-transfers <export.csv|export.ndjson> [--processes N] [--sending-pharmacy NAME]` bulk imports a sending pharmacy's export: rows are validated and normalized on a process pool (medication name resolution, dosage parsing, whole-number refills), written in large batches straight into wellbot.db (a running bot or server sees them), and an interrupted import resumes from its checkpoint without duplicating rows (`python benchmark.py transfers`)
 * Submit New Prescription
-> *functions:* new_prescription, generate_random_prescription_data
+> *functions:* WellBotEngine.order_prescription, WellBotEngine.transfer_prescription, random_prescription_data
 * Get Drug Price
 > *functions:* get_drug_price,
-> * uses pandas dataframe to store drug pricing info
+> * uses the PricingEngine (numpy price arrays + name index, built once) to price one drug or a whole cart
+> * prices come from drug_prices.csv (or a Parquet file via WELLBOT_PRICING_CATALOG), converted once to memory-mapped .npy columns in .wellbot_cache/ and reloaded when the file changes
 
 
 ---
 
 **Scenario 2: Prescription Management**
-* connected to the prescription JSON file
+* connected to the PrescriptionRepository (WellBotEngine.find_prescriptions looks prescriptions up by any indexed field)
+* prescription details are rendered once per record version into text and JSON (WellBotEngine.prescription_view, ViewCache) and re-rendered only after the prescription changes
+* `python Wellbot.py --list-prescriptions [text|json]` streams every prescription a page at a time (WellBotEngine.list_prescriptions pages in number order) instead of building the whole listing (`python benchmark.py views`)
 ---
 Includes:
 * Refill Medication
-> *functions*: refill_prescription
+> *functions*: WellBotEngine.refill
 * Check Medication Availability
-> *functions*: check_availability
+> *functions*: WellBotEngine.check_stock
 
- > * connects to the stock pandas dataframe through the check_availability function to check if the medication the user entered is in stock. If it is the number of units available is displayed.
+ > * connects to the inventory service (SQLite inventory.db, seeded from STOCK_DATA) through WellBotEngine.check_stock to check if the medication the user entered is in stock. If it is the number of units available is displayed.
+ > * refills and new prescriptions reserve stock atomically (reserve/commit/release), so stock cannot be oversold
+ > * out-of-stock medicines get in-stock alternatives from the same therapeutic class (AlternativesIndex), ranked by stock level
 
 * Check Order Status
-> *functions*: order_status
+> *functions*: WellBotEngine.order_status
   
-  > * connects to the delivery_status dictionary and JSON file to show the status of the order (pending, completed etc..)
+  > * connects to the DeliveryTracker (delivery_events.log event history + delivery_status.json checkpoint, indexed by prescription number and by status) to show the status of the order (pending, completed etc..)
+  > * `python Wellbot.py --courier-feed <feed.csv|feed.ndjson>` applies bulk status updates; `--orders-with-status "On Hold"` lists the orders in a status
 
 **Scenario 3: Medication Information Index**
 * connects to the OpenFDA API for medication information
-* uses the fetch_medication_info function
+* uses the fetch_medication_info function (LRU/TTL memory cache + SQLite label_cache.db, including "not found" answers; OpenFDA errors are never cached, `python benchmark.py openfda` checks this against a stub server)
+* in server mode labels are fetched through the AsyncOpenFDAClient first (capped upstream concurrency, one upstream call per drug for concurrent sessions)
+* answers from the local drug_labels.db index when it has been built with `python Wellbot.py --import-labels <drug-label-*.json.zip>` (one label per set_id, a newer dump replaces older versions; a name with no exact match gets the best full-text match of the name)
 * provides drug information for the drug the user inputs
+* each label section answer is rendered once per label and reused until the label is refetched (WellBotEngine.label_section)
 ---
 Includes:
 * Dosage
@@ -51,568 +67,4315 @@ Includes:
 ---
 
 **Scenario 4: Feedback/Improvement**
-* connected to the improvements and ratings JSON file (stored information for further analysis_|)
-* uses VADER for sentiment analysis of reviews stored in the improvements JSON file  
+* connected to the improvements.ndjson and ratings.ndjson logs (one timestamped record per submission, with the username)
+* `python Wellbot.py --feedback-report` streams both logs for rolling rating averages, sentiment per time window and top negative terms
+* uses VADER for sentiment analysis of reviews stored in the improvements JSON file (one shared analyzer per process, LRU-cached results, analyze_sentiments for batches)
 * displays the polarity (postive,negative, neutral) after analysis
+* NLTK and the VADER lexicon are only loaded when a review is analyzed; the lexicon is looked up in ./nltk_data (WELLBOT_NLTK_DATA) and downloaded there only if it is missing
 ---
 Includes:
 * Need further assistance
 > * email and phone number of Well.ca pharmacy for assistance
 * Rate our service
-> * *functions:* store_ratings
+> * *functions:* store_rating
 * Review our service
 >* *functions*: store_improvement, analyze_sentiment
 """
 
 import random
-import pandas as pd
-import requests
+import importlib
 import json
-import nltk
-from nltk.sentiment.vader import SentimentIntensityAnalyzer
-nltk.download('vader_lexicon')
+import os
+import time
+import atexit
+import threading
+import hashlib
+import hmac
+import sqlite3
+import argparse
+import io
+import zipfile
+import bisect
+import shutil
+import mmap
+import contextlib
+import itertools
+import functools
+import heapq
+import re
+import sys
+import base64
+import secrets
+import signal
+import weakref
+from collections import Counter, OrderedDict, defaultdict, deque
+from datetime import datetime, timezone
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+# Stand-in for a module that imports it on first attribute access instead of at
+# startup. pandas, numpy and requests cost seconds to import and only some
+# scenarios use them. The import goes through importlib's per-module lock, so
+# threads that reach the module for the first time together all get the fully
+# initialized module (importlib.util.LazyLoader does not guarantee that before
+# Python 3.12).
+class LazyModule:
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attr):
+        module = self._module
+        if module is None:
+            module = self._module = importlib.import_module(self._name)
+        return getattr(module, attr)
+
+
+def lazy_import(name):
+    return sys.modules.get(name) or LazyModule(name)
+
+np = lazy_import("numpy")
+pd = lazy_import("pandas")
+requests = lazy_import("requests")
+asyncio = lazy_import("asyncio")
+
+# Local NLTK data directory for the VADER lexicon (WELLBOT_NLTK_DATA overrides it)
+NLTK_DATA_DIR = os.environ.get("WELLBOT_NLTK_DATA",
+                               os.path.join(os.path.dirname(os.path.abspath(__file__)), "nltk_data"))
 
 title = "WellBot: Well.ca's Pharmacy Chatbot"
 border = "=" * len(title)
-print(f"\n{border}\n{title}\n{border}\n")
 
-# Load prescriptions from JSON file
-def load_prescriptions():
-    try:
-        with open("prescriptions.json", "r") as f:
-            return json.load(f)
-    except (FileNotFoundError, json.JSONDecodeError):
-        return {}
 
-# Save prescriptions to JSON file
-def save_prescriptions(prescriptions):
-    with open("prescriptions.json", "w") as f:
-        json.dump(prescriptions, f, indent=4)
+# Upper bounds (seconds) of the latency histogram buckets
+METRIC_BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005,
+                  0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
 
-def user_registration():
-    username = input("Enter a username: ")
-    password = input("Enter a password: ")
 
-    # Load existing users from JSON file
-    try:
-        with open("users.json", "r") as f:
-            users = json.load(f)
-    except (FileNotFoundError, json.JSONDecodeError):
-        users = {}
+# Instrumentation for the hot paths: a latency histogram per operation and
+# event counters, exported as Prometheus text or JSON. Off unless
+# WELLBOT_METRICS=1 (or --metrics-dump); while off, a timed call costs one
+# attribute check and enabled can be flipped at any time.
+class Metrics:
+    def __init__(self, enabled=False, buckets=METRIC_BUCKETS):
+        self.enabled = enabled
+        self.buckets = buckets
+        self.dump_path = None
+        self._lock = threading.Lock()
+        self._timers = {}
+        self._events = Counter()
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._after_fork)
 
-    # Check if username already exists
-    if username in users:
-        print("Username already exists. Please choose a different username.")
-        return False
+    # A forked worker starts from empty metrics and dumps to its own file
+    def _after_fork(self):
+        self._lock = threading.Lock()
+        self.reset()
+        if self.dump_path:
+            self.dump_path = per_process_path(self.dump_path)
 
-    # Store the new user's credentials
-    users[username] = {"password": password, "name": username}
+    def observe(self, operation, seconds):
+        index = bisect.bisect_left(self.buckets, seconds)
+        with self._lock:
+            timer = self._timers.get(operation)
+            if timer is None:
+                timer = self._timers[operation] = [[0] * (len(self.buckets) + 1), 0.0]
+            timer[0][index] += 1
+            timer[1] += seconds
 
-    # Write the updated users to the JSON file
-    with open("users.json", "w") as f:
-        json.dump(users, f, indent=4)
+    def count(self, event, amount=1):
+        if self.enabled:
+            with self._lock:
+                self._events[event] += amount
 
-    print("Registration successful!")
-    return True
+    # Context manager timing a block: `with metrics.timer("drug_price"): ...`
+    def timer(self, operation):
+        return _Timer(self, operation) if self.enabled else _NO_TIMER
 
-# User Login
-def user_login():
-    username = input("Enter your username: ")
-    password = input("Enter your password: ")
+    # Decorator timing every call of a function
+    def timed(self, operation):
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return func(*args, **kwargs)
+                start = time.perf_counter()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    self.observe(operation, time.perf_counter() - start)
+            return wrapper
+        return decorator
 
-    # Load existing users from JSON file
-    try:
-        with open("users.json", "r") as f:
-            users = json.load(f)
-    except (FileNotFoundError, json.JSONDecodeError):
-        print("Error: Unable to load user data.")
-        return False
-
-    # Check if username and password match
-    if username in users and users[username]["password"] == password:
-        return True
-    else:
-        print("Invalid username or password.")
-        return False
-
-# Prescription Ordering
-def prescription_ordering():
-    global prescriptions, delivery_status
-    prescriptions= {}
-    def generate_prescription_number():
-        return f"RX{random.randint(1000, 9999)}"
-
-    def new_prescription(medication, dosage, instructions, refills, fax_needed, telephone_number=None):
-        prescription_number = generate_prescription_number()
-        prescription = {
-            'prescription_number': prescription_number,
-            'medication': medication,
-            'dosage': dosage,
-            'instructions': instructions,
-            'refills': refills,
-            'sending_pharmacy': 'N/A',
-            'fax_needed': fax_needed,
-            'telephone_number': telephone_number,
-        }
-        prescriptions[prescription_number] = prescription
-        save_prescriptions(prescriptions)
-        # Add a default delivery status for the new prescription
-        delivery_status[prescription_number] = 'Pending'
-
-    def generate_random_prescription_data():
-        medication = f"Medication_{random.randint(1, 100)}"
-        dosage = f"{random.randint(1, 20)}mg"
-        instructions = f"Take {random.randint(1, 3)} times daily"
-        refills = random.randint(0, 5)
-        return medication, dosage, instructions, refills
-
-    data = {
-    'Medication': ['Amoxicillin', 'Ibuprofen', 'Lisinopril', 'Metformin', 'Levothyroxine', 'Atorvastatin', 'Amlodipine', 'Omeprazole', 'Losartan', 'Aspirin'],
-    'Brand_Public': [10.0, 12.0, 15.0, 18.0, 20.0, 22.0, 24.0, 26.0, 28.0, 30.0],
-    'Brand_Private': [8.0, 10.0, 12.0, 14.0, 16.0, 18.0, 20.0, 22.0, 24.0, 26.0],
-    'Brand_Manufacturer_Rebate': [1.0, 1.5, 1.8, 2.0, 2.2, 2.4, 2.6, 2.8, 3.0, 3.2],
-    'Generic_Public': [5.0, 6.0, 7.0, 8.0, 9.0, 10.0, 11.0, 12.0, 13.0, 14.0],
-    'Generic_Private': [4.0, 5.0, 6.0, 7.0, 8.0, 9.0, 10.0, 11.0, 12.0, 13.0],
-    'Generic_Manufacturer_Rebate': [0.5, 0.7, 0.8, 0.9, 1.0, 1.1, 1.2, 1.3, 1.4, 1.5]
-}
+    def reset(self):
+        with self._lock:
+            self._timers.clear()
+            self._events.clear()
 
-    df = pd.DataFrame(data)  # Provided drug pricing data
+    def snapshot(self):
+        with self._lock:
+            timers = {operation: (list(counts), total) for operation, (counts, total) in self._timers.items()}
+            events = dict(self._events)
+        operations = {}
+        for operation, (counts, total) in sorted(timers.items()):
+            cumulative = list(itertools.accumulate(counts))
+            operations[operation] = {
+                'count': cumulative[-1], 'sum': total,
+                'buckets': dict(zip([*map(str, self.buckets), '+Inf'], cumulative)),
+            }
+        return {'enabled': self.enabled, 'pid': os.getpid(), 'operations': operations, 'events': events}
 
-    def get_drug_price(medication, category, medication_type):
-        col_name = f'{medication_type}_{category}'
-        try:
-            price = df.loc[df['Medication'].str.lower() == medication.lower(), col_name].values[0]
-            return price
-        except IndexError:
-            return None
+    def prometheus(self):
+        snapshot = self.snapshot()
+        lines = ["# HELP wellbot_operation_seconds Latency of instrumented WellBot operations",
+                 "# TYPE wellbot_operation_seconds histogram"]
+        for operation, timer in snapshot['operations'].items():
+            for bound, count in timer['buckets'].items():
+                lines.append(f'wellbot_operation_seconds_bucket{{operation="{operation}",le="{bound}"}} {count}')
+            lines.append(f'wellbot_operation_seconds_sum{{operation="{operation}"}} {timer["sum"]!r}')
+            lines.append(f'wellbot_operation_seconds_count{{operation="{operation}"}} {timer["count"]}')
+        lines += ["# HELP wellbot_events_total Counted WellBot events (cache hits, upstream retries, ...)",
+                  "# TYPE wellbot_events_total counter"]
+        lines += [f'wellbot_events_total{{event="{event}"}} {count}'
+                  for event, count in sorted(snapshot['events'].items())]
+        return "\n".join(lines) + "\n"
 
-    print("\nWelcome to the ordering prescriptions tab!")
+    # Write the metrics to path: JSON for a .json path, Prometheus text otherwise
+    def dump(self, path):
+        if path.endswith(".json"):
+            write_json_atomic(path, self.snapshot())
+        else:
+            with open(path, "w") as f:
+                f.write(self.prometheus())
 
-    while True:
-        print("1. Initiate Prescription Transfer (Incoming)")
-        print("2. Submit New Prescription")
-        print("3. Get Drug Price")
-        print("4. Exit")
-        choice = input("Select an option (1/2/3): ")
-        if choice == '1':
-            print("\nInitiate Prescription Transfer (Incoming)")
-            sending_pharmacy = input("Enter the name of the sending pharmacy: ")
-
-            # Generate a random prescription number for the incoming transfer
-            prescription_number = generate_prescription_number()
-
-            print(f"Generated Prescription Number: {prescription_number}")
-
-            fax_needed = True  # Fax is always needed for prescription transfer
-            telephone_number = input("Enter the telephone number of the sending pharmacy: ")
-
-            # Generate random prescription data for transfer
-            medication, dosage, instructions, refills = generate_random_prescription_data()
-            new_prescription(medication, dosage, instructions, refills, fax_needed, telephone_number)
-            print(f"Prescription {prescription_number} initiated for transfer from {sending_pharmacy}. Telephone number: {telephone_number}")
-
-        elif choice == '2':
-            medication = input("Enter the medication name: ")
-            dosage = input("Enter the dosage: ")
-            instructions = input("Enter the instructions: ")
-            refills = input("Enter the number of refills: ")
-
-            fax_needed = input("Fax of prescription from doctor's office needed? (y/n): ").lower() == 'y'
-            telephone_number = None
-            if fax_needed:
-                telephone_number = input("Enter the telephone number of the doctor's office: ")
-
-            new_prescription(medication, dosage, instructions, refills, fax_needed, telephone_number)
-            if fax_needed:
-                print("Prescription submitted successfully.")
-            else:
-                print("Prescription submission pending. Upload a picture of your prescription to your account.")
 
-        elif choice == '3':
-            medication = input("Enter the medication name: ").lower()
-            category = input("Select category (Public/Private Insurance): ").title()
-            medication_type = input("Select medication type (Brand/Generic): ").title()
+# path with the process id before the extension: metrics.json -> metrics.1234.json
+def per_process_path(path):
+    root, ext = os.path.splitext(path)
+    return f"{root}.{os.getpid()}{ext}"
 
-            manufacturer_rebate = input("Do you have a manufacturer rebate? (y/n): ")
-            if manufacturer_rebate.lower() == 'y':
-                has_rebate = True
-            else:
-                has_rebate = False
 
-            price = get_drug_price(medication, category, medication_type)
+class _Timer:
+    __slots__ = ("metrics", "operation", "start")
 
-            if has_rebate and price is not None:
-                manufacturer_rebate = df.loc[df['Medication'].str.lower() == medication, f'{medication_type}_Manufacturer_Rebate'].values[0]
-                price -= manufacturer_rebate
+    def __init__(self, metrics, operation):
+        self.metrics = metrics
+        self.operation = operation
 
-            if price is not None:
-                print(f"The price of {medication_type} {medication} under {category} Insurance is ${price:.2f}")
-            else:
-                print("Invalid input or medication not found.")
-        elif choice == '4':
-            break  # Exit the loop and return to the main menu
-        else:
-            print("Invalid choice. Please select 1, 2, 3 or 4.")
-
-        another_action = input("Do you want to perform another action? (y/n): ")
-        if another_action.lower() != "y":
-            print("\nPrescription Database:")
-            for prescription_number, prescription in prescriptions.items():
-                print(f"Prescription Number: {prescription_number}")
-                print(f"Medication: {prescription['medication']}")
-                print(f"Dosage: {prescription['dosage']}")
-                print(f"Instructions: {prescription['instructions']}")
-                print(f"Refills: {prescription['refills']}")
-                if 'sending_pharmacy' in prescription:
-                    print(f"Sending Pharmacy: {prescription['sending_pharmacy']}")
-                if 'fax_needed' in prescription:
-                    print(f"Fax Needed: {'Yes' if prescription['fax_needed'] else 'No'}")
-                if prescription.get('fax_needed') and 'telephone_number' in prescription:
-                    print(f"Telephone Number: {prescription['telephone_number']}")
-                print("-" * 20)
-            break
-
-# Prescription Management
-def prescription_management():
-
-    # The stock dict. match a medicine with its current stock
-    stock_df = pd.DataFrame({
-    'Medication': ['Amoxicillin', 'Ibuprofen', 'Lisinopril', 'Metformin', 'Levothyroxine', 'Atorvastatin', 'Amlodipine', 'Omeprazole', 'Losartan'],
-    'Stock': [100, 0, 150, 120, 80, 90, 110, 130, 140]  # Set Ibuprofen to 0 for demonstration
-})
+    def __enter__(self):
+        self.start = time.perf_counter()
 
+    def __exit__(self, *exc_info):
+        self.metrics.observe(self.operation, time.perf_counter() - self.start)
 
-    # Create a function to ask for refills of medicines (use prescription_refill dict.)
-    def refill_prescription():
-        prescriptions = load_prescriptions()
-        orders = []
-        while True:
-            prescription_number = input("Please enter your prescription number: ")
-            while prescription_number not in prescriptions:
-                prescription_number = input("Invalid prescription number. Please try again or enter 'x' to exit WellBot: ")
-                if prescription_number.lower() == 'x':
-                    print("Thank you for using WellBot!")
-                    return
-                continue
-            name = input("Please enter your full name: ")
-            medicine = prescriptions[prescription_number]
-            order = {
-                "prescription_number": prescription_number,
-                "customer": name,
-                "medicine": medicine
-            }
-            orders.append(order)
-            print(f"\nOrder Summary:\nPrescription Number: {prescription_number}\nCustomer: {name}\nMedicine: {medicine}")
-            print("\nOrder placed! We will send you an email with the delivery information.")
-            choice = input("\nWould you like to place another order? (y/n): ")
-            if choice.lower() != 'y':
-                break
 
-    # Create a function to check if certain medicine is in stock (use stock dict.)
-    def check_availability(stock_df):
-        while True:
-            medicine_name = input("Please enter the name of the medicine you want to check: ").capitalize()
-            if medicine_name == "X":
-              print("Exiting WellBot. Have a great day!")
-              break
-            if medicine_name not in   stock_df['Medication'].values:
-              print(f"Sorry, we don't have {medicine_name} in our inventory. Please try again or enter 'x' to exit WellBot:")
-              continue
-            available_stock = stock_df.loc[stock_df['Medication'] == medicine_name, 'Stock'].values[0]
-
-            if available_stock > 0:
-                print(f"{medicine_name} is available, we have {available_stock} units in stock.")
-            else:
-                print(f"Sorry, {medicine_name} is currently out of stock.")
-                # Recommend other available drugs using pandas
-                available_meds = stock_df[stock_df['Stock'] > 0]['Medication'].tolist()
-                if available_meds:
-                  print("Here are some other available medications:")
-                  for med in available_meds:
-                    print(f"- {med}")
-                else:
-                   print("Unfortunately, we're currently out of stock for all medications.")
-            choice = input("\nWould you like to check another medicine? (y/n): ")
-            if choice.lower() != 'y':
-                print("Thank you for using WellBot!")
-                break
+class _NoTimer:
+    __slots__ = ()
 
-     # Create a function to inform about the order status of presciption number (use delivery_status dict.)
-    def order_status():
-        global delivery_status
-        prescriptions = load_prescriptions()
+    def __enter__(self):
+        pass
 
-        while True:
-            prescription_number = input("Please enter your prescription number: ")
-            if prescription_number in prescriptions:
-              status = delivery_status.get(prescription_number, "Pending Delivery")
-              print(f"\nThe order status for prescription number {prescription_number} is: {status}")
-              prescription = prescriptions[prescription_number]
-              print(f"\nPrescription Details:")
-              print(f"Medication: {prescription['medication']}")
-              print(f"Dosage: {prescription['dosage']}")
-              print(f"Instructions: {prescription['instructions']}")
-              print(f"Refills: {prescription['refills']}")
-              if 'sending_pharmacy' in prescription:
-                print(f"Sending Pharmacy: {prescription['sending_pharmacy']}")
-              if 'fax_needed' in prescription:
-                print(f"Fax Needed: {'Yes' if prescription['fax_needed'] else 'No'}")
-              if prescription.get('fax_needed') and 'telephone_number' in prescription:
-                print(f"Telephone Number: {prescription['telephone_number']}")
-
-              if status in ['Canceled', 'On Hold', 'Rescheduled']:
-                print('For further assistance, please contact our call center: 514 123 4567')
-            else:
-              print("Invalid prescription number. Please try again or enter 'x' to exit WellBot.")
-              if prescription_number.lower() == 'x':
-                print("Thank you for using WellBot!")
-                return
-            choice = input("\nWould you like to check another order? (y/n): ")
-            if choice.lower() != 'y':
-              break
+    def __exit__(self, *exc_info):
+        pass
 
-    while True:
-        print("\nPlease select an option: ")
-        print("1. Refill Medication")
-        print("2. Check Medication Availability")
-        print("3. Check Order Status")
-        print("4. Exit")
-
-        option = input("Select the number: ")
-
-        if option == '1':
-            refill_prescription()
-        elif option == '2':
-            check_availability(stock_df)
-        elif option == '3':
-            order_status()
-        elif option == '4':
-            break
-        else:
-            print("\nInvalid option. Please choose a valid option.")
 
-# Medication Information
-def medication_information():
-    def fetch_medication_info(medication_name):
-        api_url = f"https://api.fda.gov/drug/label.json?search=openfda.brand_name:{medication_name}&limit=1"
-        response = requests.get(api_url)
+_NO_TIMER = _NoTimer()
 
-        if response.status_code == 200:
-            data = response.json()
-            if "results" in data and data["results"]:
-                medication_info = data["results"][0]
-                return medication_info
-        return None
-    while True:
-      medication_name = input("Enter the medication name: ")
-      medication_info = fetch_medication_info(medication_name)
-      if medication_info:
-        print(f"Medication Name: {medication_info['openfda']['brand_name'][0]}")
-        print(f"Manufacturer: {medication_info['openfda']['manufacturer_name'][0]}")
+metrics = Metrics(enabled=os.environ.get("WELLBOT_METRICS") == "1")
 
-        while True:
-            print("\nHello and welcome, how can I help you today?")
-            print("\nSelect the type of information you'd like to know:")
-            print("1. Dosage Information")
-            print("2. Allergy Information")
-            print("3. General Information/Interactions")
-            print("4. Go back to Medication Selection")
-            print("5. Exit")
-
-            info_choice = input("Enter your choice: ")
-
-            if info_choice == "1":
-                if "dosage_and_administration" in medication_info:
-                    print("Dosage and Administration:")
-                    for dosage in medication_info["dosage_and_administration"]:
-                        print(f"  - {dosage}")
-                else:
-                    print("Dosage information not available.")
 
-            elif info_choice == "2":
-                if "warnings" in medication_info:
-                    print("Allergy Information:")
-                    for warning in medication_info["warnings"]:
-                        print(f"  - {warning}")
-                else:
-                    print("Allergy information not available.")
-
-            elif info_choice == "3":
-                # Display general information or interactions
-                if "indications_and_usage" in medication_info:
-                    print("General Information:")
-                    for indication in medication_info["indications_and_usage"]:
-                        print(f"  - {indication}")
-                else:
-                    print("General information not available.")
+# Sampling profiler: while running, a background thread records the stack of
+# every other thread each interval seconds. stop() writes the samples as folded
+# stacks ("file:function;...;file:function count", the input format of
+# flamegraph.pl and speedscope). SIGUSR2 toggles it in a running bot or server.
+class SamplingProfiler:
+    def __init__(self, interval=0.005, path=None):
+        self.interval = interval
+        self.path = path
+        self._stacks = Counter()
+        self._thread = None
+        self._stop = threading.Event()
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._after_fork)
 
-                if "drug_interactions" in medication_info:
-                    print("\nDrug Interactions:")
-                    for interaction in medication_info["drug_interactions"]:
-                        print(f"  - {interaction}")
-                else:
-                    print("Drug interactions information not available.")
+    # The sampling thread does not survive a fork: a forked worker keeps
+    # profiling with its own thread, into its own file
+    def _after_fork(self):
+        if self._thread is not None:
+            self._thread = None
+            if self.path:
+                self.path = per_process_path(self.path)
+            self.start()
 
-            elif info_choice == "4":
-                break  # Exit the medication information loop and return to main menu
+    @property
+    def running(self):
+        return self._thread is not None
 
-            elif info_choice == "5":
-                return False
-            else:
-                print("Invalid choice.")
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stacks.clear()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="wellbot-profiler", daemon=True)
+        self._thread.start()
 
-            more_info = input("Would you like more info? (yes/no): ")
-      if more_info.lower() == "no":
-                    break
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                    frame = frame.f_back
+                self._stacks[";".join(reversed(stack))] += 1
 
-    else:
-        print("Medication not found.")
-        return False
-
-
-# Feedback
-def feedback_improvement():
-    # Sentiment Analysis using VADER
-    def analyze_sentiment(feedback):
-        sia = SentimentIntensityAnalyzer()
-        sentiment_scores = sia.polarity_scores(feedback)
-
-        # Categorize sentiment based on compound score
-        if sentiment_scores['compound'] >= 0.05:
-            return "Positive"
-        elif sentiment_scores['compound'] <= -0.05:
-            return "Negative"
+    def folded(self):
+        return "".join(f"{stack} {count}\n" for stack, count in self._stacks.most_common())
+
+    # Stop sampling and write the profile; returns its path
+    def stop(self):
+        if self._thread is None:
+            return None
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        path = self.path or f"wellbot_profile.{os.getpid()}.folded"
+        with open(path, "w") as f:
+            f.write(self.folded())
+        return path
+
+    def toggle(self):
+        if self.running:
+            path = self.stop()
+            print(f"\n[profiler] wrote {path}", file=sys.stderr, flush=True)
         else:
-            return "Neutral"
+            self.start()
+            print("\n[profiler] sampling started", file=sys.stderr, flush=True)
+
+
+profiler = SamplingProfiler()
 
-    def store_improvement(suggestion, sentiment):
-        # Load existing improvements from JSON file
+# Toggle the profiler with `kill -USR2 <pid>` (Unix only)
+def install_profiler_signal():
+    if hasattr(signal, "SIGUSR2"):
+        signal.signal(signal.SIGUSR2, lambda signum, frame: profiler.toggle())
+
+# Append-only JSON lines log shared by the persistent stores.
+# Every record is one line; fsync happens in batches (every fsync_every records
+# or fsync_interval seconds) and replay stops at a torn last line from a crash.
+class AppendLog:
+    def __init__(self, path, fsync_every=64, fsync_interval=1.0):
+        self.path = path
+        self.fsync_every = fsync_every
+        self.fsync_interval = fsync_interval
+        self._lock = threading.Lock()
+        self._file = None
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+        atexit.register(self.close)
+
+    # Yield every complete record, truncating a torn tail so later appends stay readable
+    def replay(self):
         try:
-            with open("improvements.json", "r") as f:
-                improvements = json.load(f)
-        except (FileNotFoundError, json.JSONDecodeError):
-            improvements = []
+            f = open(self.path, "rb")
+        except FileNotFoundError:
+            return
+        good_offset = 0
+        with f:
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    break
+                good_offset += len(line)
+                yield record
+            torn = f.tell() != good_offset
+        if torn:
+            with self._lock:
+                with open(self.path, "r+b") as f:
+                    f.truncate(good_offset)
 
-        # Add the new suggestion and sentiment
-        feedback_data = {
-            "suggestion": suggestion,
-            "sentiment": sentiment
-        }
-        improvements.append(feedback_data)
+    def append(self, record):
+        self.append_many([record])
+
+    def append_many(self, records):
+        data = "".join(json.dumps(record) + "\n" for record in records).encode("utf-8")
+        return self.append_encoded(data, len(records))
+
+    # Append already encoded JSON lines (count records); returns the bytes written
+    def append_encoded(self, data, count):
+        with self._lock:
+            if self._file is None:
+                self._file = open(self.path, "ab")
+            self._file.write(data)
+            self._file.flush()
+            self._unsynced += count
+            if (self._unsynced >= self.fsync_every
+                    or time.monotonic() - self._last_sync >= self.fsync_interval):
+                self._sync()
+        return len(data)
 
-        # Write the updated improvements to the JSON file
-        with open("improvements.json", "w") as f:
-            json.dump(improvements, f, indent=4)
+    def sync(self):
+        with self._lock:
+            self._sync()
 
-    def store_rating(rating):
-        # Load existing ratings from JSON file
+    def _sync(self):
+        if self._file is not None and self._unsynced:
+            os.fsync(self._file.fileno())
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+    # Move the current log aside so a snapshot can be written from it
+    def rotate(self, rotated_path):
+        with self._lock:
+            self._sync()
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            if os.path.exists(self.path):
+                os.replace(self.path, rotated_path)
+
+    def close(self):
+        with self._lock:
+            self._sync()
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+# Write a JSON document to a temp file and atomically swap it into place
+def write_json_atomic(path, data):
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f, indent=4)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+# Apply func (a module-level function taking a list) to consecutive chunks of
+# items and yield the results of each chunk, in order. With processes > 1 the
+# chunks run on a process pool with only a couple per worker in flight, so a
+# stream is never read ahead in full.
+def map_chunks(func, items, processes=None, chunksize=2000):
+    items = iter(items)
+    chunks = iter(lambda: list(itertools.islice(items, chunksize)), [])
+    if not processes or processes <= 1:
+        for chunk in chunks:
+            yield func(chunk)
+        return
+
+    from concurrent.futures import ProcessPoolExecutor
+
+    with ProcessPoolExecutor(processes) as pool:
+        pending = deque(pool.submit(func, chunk) for chunk in itertools.islice(chunks, processes * 2))
+        while pending:
+            result = pending.popleft().result()
+            for chunk in itertools.islice(chunks, 1):
+                pending.append(pool.submit(func, chunk))
+            yield result
+
+
+# Key/value storage engine used for prescriptions and users.
+# The JSON snapshot holds the full table, the log holds one record per
+# mutation since that snapshot. Startup replays snapshot + log into memory and
+# a background thread folds the log back into a new snapshot once it grows
+# past the size of the snapshot, so each write is a single appended line.
+class LogStore:
+    def __init__(self, snapshot_path, log_path, compact_min_records=1000):
+        self.snapshot_path = snapshot_path
+        self.log_path = log_path
+        self.compact_min_records = compact_min_records
+        self.log = AppendLog(log_path)
+        self._lock = threading.Lock()
+        self._data = None
+        self._log_records = 0
+        self._compact_lock = threading.Lock()
+        self._compactor = None
+
+    def _ensure_loaded(self):
+        if self._data is not None:
+            return
+        with self._lock:
+            if self._data is not None:
+                return
+            self._data, self._log_records = self._load()
+
+    # Snapshot + log replay; returns (data, log records replayed)
+    @metrics.timed("store_load")
+    def _load(self):
         try:
-            with open("ratings.json", "r") as f:
-                ratings = json.load(f)
+            with open(self.snapshot_path, "r") as f:
+                data = json.load(f)
         except (FileNotFoundError, json.JSONDecodeError):
-            ratings = []
+            data = {}
+        # A log left behind by an interrupted compaction is replayed first
+        rotated_path = f"{self.log_path}.old"
+        for record in AppendLog(rotated_path).replay():
+            self._apply(data, record)
+        records = 0
+        for record in self.log.replay():
+            self._apply(data, record)
+            records += 1
+        if os.path.exists(rotated_path):
+            # Finish the interrupted compaction before the next rotation reuses the name
+            write_json_atomic(self.snapshot_path, data)
+            os.remove(rotated_path)
+        return data, records
 
-        # Add the new rating
-        ratings.append(rating)
+    @staticmethod
+    def _apply(data, record):
+        if record["op"] == "put":
+            data[record["key"]] = record["value"]
+        elif record["op"] == "delete":
+            data.pop(record["key"], None)
 
-        # Write the updated ratings to the JSON file
-        with open("ratings.json", "w") as f:
-            json.dump(ratings, f, indent=4)
-    print("Thank you for providing feedback!")
-    while True:
-        print("\nFeedback/Improvement Options:")
-        print("1. Need further assistance (email/call pharmacy support)")
-        print("2. Rate our service (1-10)")
-        print("3. Review our service")
-        print("4. Exit")
-
-
-        feedback_choice = input("Enter your choice: ")
-
-        if feedback_choice == "1":
-            # Implement the email/call functionality here
-            print("You selected: Need further assistance.")
-            print("For further assistance call us toll-free at 1-866-640-3800 or send an email to pharmacysupport@well.ca")
-            print('Monday-Friday: 9am - 10pm EST')
-            print('Saturday: 9am - 4pm EST')
-            print('Sunday: 10am - 5pm EST')
-            break
-        elif feedback_choice == "2":
-            rating = input("How would you rate our service (1-10)? ")
-            store_rating(rating)
-            # You can process the rating and take actions accordingly
-            print(f"You rated our service: {rating}")
-            break
-
-        elif feedback_choice == "3":
-            improvement = input("How was your experience using our service? ")
-            sentiment = analyze_sentiment(improvement)
-            print(f"Feedback sentiment: {sentiment}")
-            # Store the improvement suggestion in a JSON file
-            store_improvement(improvement,sentiment)
-            print("Thank you for your input!")
-            break
-
-        elif feedback_choice == "4":
-            return False
-            break  # Return to the welcome menu
+    def load(self):
+        self._ensure_loaded()
+        with self._lock:
+            return dict(self._data)
+
+    def get(self, key):
+        self._ensure_loaded()
+        return self._data.get(key)
+
+    def __contains__(self, key):
+        self._ensure_loaded()
+        return key in self._data
+
+    def __len__(self):
+        self._ensure_loaded()
+        return len(self._data)
+
+    def put(self, key, value):
+        self.put_many({key: value})
+
+    def put_many(self, items):
+        self._ensure_loaded()
+        records = [{"op": "put", "key": key, "value": value} for key, value in items.items()]
+        with self._lock:
+            self.log.append_many(records)
+            self._data.update(items)
+            self._log_records += len(records)
+        self._maybe_compact()
+
+    # Insert only if the key is new; returns False when it already exists
+    def put_if_absent(self, key, value):
+        self._ensure_loaded()
+        with self._lock:
+            if key in self._data:
+                return False
+            self.log.append({"op": "put", "key": key, "value": value})
+            self._data[key] = value
+            self._log_records += 1
+        self._maybe_compact()
+        return True
+
+    def delete(self, key):
+        self._ensure_loaded()
+        with self._lock:
+            self.log.append({"op": "delete", "key": key})
+            self._data.pop(key, None)
+            self._log_records += 1
+        self._maybe_compact()
+
+    # Replace the whole table (used for bulk rewrites, not the per-order path)
+    def replace_all(self, items):
+        self._ensure_loaded()
+        rotated_path = f"{self.log_path}.old"
+        with self._compact_lock, self._lock:
+            self.log.rotate(rotated_path)
+            self._data = dict(items)
+            self._log_records = 0
+            write_json_atomic(self.snapshot_path, self._data)
+            if os.path.exists(rotated_path):
+                os.remove(rotated_path)
+
+    def _maybe_compact(self):
+        if self._log_records < max(self.compact_min_records, len(self._data)):
+            return
+        if self._compactor is not None and self._compactor.is_alive():
+            return
+        self._compactor = threading.Thread(target=self.compact, daemon=True)
+        self._compactor.start()
+
+    def compact(self):
+        rotated_path = f"{self.log_path}.old"
+        with self._compact_lock:
+            with self._lock:
+                self.log.rotate(rotated_path)
+                snapshot = dict(self._data)
+                self._log_records = 0
+            write_json_atomic(self.snapshot_path, snapshot)
+            if os.path.exists(rotated_path):
+                os.remove(rotated_path)
+
+    # Wait for a running compaction and flush the log
+    def close(self):
+        if self._compactor is not None:
+            self._compactor.join()
+        self.log.close()
+
+
+# SQLite connection in WAL mode (readers never block the writer, and every
+# process sees a commit as soon as it lands). Autocommit, so transactions are
+# explicit BEGIN IMMEDIATE blocks.
+def connect_sqlite(path):
+    db = sqlite3.connect(path, timeout=30, isolation_level=None)
+    db.execute("PRAGMA journal_mode=WAL")
+    db.execute("PRAGMA synchronous=NORMAL")
+    return db
+
+@contextlib.contextmanager
+def sqlite_transaction(db):
+    db.execute("BEGIN IMMEDIATE")
+    try:
+        yield db
+    except BaseException:
+        db.execute("ROLLBACK")
+        raise
+    db.execute("COMMIT")
+
+
+# Key-value table in a SQLite database shared by worker processes.
+# Same interface as LogStore, but reads go to the database instead of an
+# in-memory copy, so every process sees the others' writes once they commit.
+# Writes are single transactions. Several stores can share one file, one table each.
+# The table is created on first use. legacy is a LogStore from before the data
+# moved into the database: whatever its files still hold is merged in then
+# (rows already in the table win) and the files are renamed to *.imported.
+class SQLiteStore:
+    def __init__(self, path, table, legacy=None):
+        if not re.fullmatch(r"[A-Za-z_]\w*", table):
+            raise ValueError(f"Invalid table name: {table!r}")
+        self.path = path
+        self.table = table
+        self.legacy = legacy
+        self._local = threading.local()
+        self._ready = False
+        self._ready_lock = threading.Lock()
+
+    def _connection(self):
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = self._local.db = connect_sqlite(self.path)
+            if not self._ready:
+                with self._ready_lock:
+                    if not self._ready:
+                        self._create(db)
+                        self._ready = True
+        return db
+
+    def _create(self, db):
+        with sqlite_transaction(db):
+            db.execute(f"CREATE TABLE IF NOT EXISTS {self.table} ("
+                       "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+                       "version INTEGER NOT NULL DEFAULT 1, updated REAL NOT NULL)")
+            db.execute(f"CREATE INDEX IF NOT EXISTS {self.table}_updated ON {self.table} (updated)")
+        if self.legacy is None:
+            return
+        legacy = self.legacy
+        paths = [path for path in (legacy.snapshot_path, legacy.log_path, f"{legacy.log_path}.old")
+                 if os.path.exists(path)]
+        if not paths:
+            return
+        items = legacy.load()
+        with sqlite_transaction(db):
+            now = time.time()
+            db.executemany(f"INSERT OR IGNORE INTO {self.table} (key, value, updated) VALUES (?, ?, ?)",
+                           [(key, json.dumps(value), now) for key, value in items.items()])
+        legacy.close()
+        for path in paths:
+            if os.path.exists(path):
+                os.replace(path, f"{path}.imported")
+
+    def _transaction(self):
+        return sqlite_transaction(self._connection())
+
+    def load(self):
+        rows = self._connection().execute(f"SELECT key, value FROM {self.table}")
+        return {key: json.loads(value) for key, value in rows}
+
+    def get(self, key, default=None):
+        row = self._connection().execute(f"SELECT value FROM {self.table} WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else default
+
+    # (value, version), or (None, 0) for a missing key
+    def get_versioned(self, key):
+        row = self._connection().execute(
+            f"SELECT value, version FROM {self.table} WHERE key = ?", (key,)).fetchone()
+        return (json.loads(row[0]), row[1]) if row else (None, 0)
+
+    def __contains__(self, key):
+        return self._connection().execute(
+            f"SELECT 1 FROM {self.table} WHERE key = ?", (key,)).fetchone() is not None
+
+    def __len__(self):
+        return self._connection().execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+
+    # Item access, so the store can stand in for a plain dict
+    def __getitem__(self, key):
+        value = self.get(key, CACHE_MISS)
+        if value is CACHE_MISS:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        self.put(key, value)
+
+    def put(self, key, value):
+        self.put_many({key: value})
+
+    def put_many(self, items):
+        with self._transaction() as db:
+            # Stamped inside the write lock, so updated follows commit order (see changes)
+            now = time.time()
+            db.executemany(f"INSERT INTO {self.table} (key, value, updated) VALUES (?, ?, ?) "
+                           "ON CONFLICT (key) DO UPDATE SET value = excluded.value, "
+                           "version = version + 1, updated = excluded.updated",
+                           [(key, json.dumps(value), now) for key, value in items.items()])
+
+    # Insert only if the key is new; returns False when it already exists
+    def put_if_absent(self, key, value):
+        with self._transaction() as db:
+            cursor = db.execute(f"INSERT OR IGNORE INTO {self.table} (key, value, updated) VALUES (?, ?, ?)",
+                                (key, json.dumps(value), time.time()))
+        return cursor.rowcount == 1
+
+    # Optimistic update: write only if the row is still at version (0 = must not
+    # exist yet). Returns False when another writer got there first.
+    def put_if_version(self, key, value, version):
+        if version == 0:
+            return self.put_if_absent(key, value)
+        with self._transaction() as db:
+            cursor = db.execute(f"UPDATE {self.table} SET value = ?, version = version + 1, updated = ? "
+                                "WHERE key = ? AND version = ?", (json.dumps(value), time.time(), key, version))
+        return cursor.rowcount == 1
 
+    def delete(self, key):
+        with self._transaction() as db:
+            db.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+
+    # Rows written since a mark from an earlier call (None = every row), and the
+    # new mark. Rows stamped exactly at the mark are returned again, since a
+    # writer with the same timestamp may commit after this read; callers skip
+    # the ones they already have. PRAGMA data_version only moves when another
+    # connection commits, so asking when nothing changed costs no table read.
+    # Deletes are not reported.
+    def changes(self, since=None):
+        db = self._connection()
+        data_version = db.execute("PRAGMA data_version").fetchone()[0]
+        if since is not None and data_version == getattr(self._local, "data_version", None):
+            return since, {}
+        self._local.data_version = data_version
+        rows = db.execute(f"SELECT key, value, updated FROM {self.table} WHERE updated >= ?",
+                          (since if since is not None else float("-inf"),)).fetchall()
+        mark = max((row[2] for row in rows), default=since if since is not None else 0.0)
+        return mark, {key: json.loads(value) for key, value, _ in rows}
+
+    # Drop entries not written since cutoff (a time.time() value); returns how many
+    def delete_stale(self, cutoff):
+        with self._transaction() as db:
+            return db.execute(f"DELETE FROM {self.table} WHERE updated < ?", (cutoff,)).rowcount
+
+    def replace_all(self, items):
+        with self._transaction() as db:
+            db.execute(f"DELETE FROM {self.table}")
+            db.executemany(f"INSERT INTO {self.table} (key, value, updated) VALUES (?, ?, ?)",
+                           [(key, json.dumps(value), time.time()) for key, value in items.items()])
+
+    # Close this thread's connection
+    def close(self):
+        db = getattr(self._local, "db", None)
+        if db is not None:
+            db.close()
+            self._local.db = None
+
+
+# Prescription storage: prescriptions.json snapshot + prescriptions.log
+class PrescriptionStore(LogStore):
+    def __init__(self, snapshot_path="prescriptions.json", log_path="prescriptions.log",
+                 compact_min_records=1000):
+        super().__init__(snapshot_path, log_path, compact_min_records)
+
+
+# Database holding users and prescriptions for the terminal bot, the server and
+# every worker of `--serve --processes N` alike (WELLBOT_DB overrides the path)
+SHARED_DB_PATH = os.environ.get("WELLBOT_DB", "wellbot.db")
+
+# prescriptions.json/prescriptions.log from earlier versions are merged in on first use
+prescription_store = SQLiteStore(SHARED_DB_PATH, "prescriptions", legacy=PrescriptionStore())
+
+# Record versions come from one process-wide counter, so a version never means
+# the same thing in two repositories (rendered views are cached by version)
+RECORD_VERSIONS = itertools.count(1)
+
+
+# Prescriptions held in memory with secondary indexes, over a backing store
+# (PrescriptionStore, or a SQLiteStore shared by worker processes).
+# The store is read once; after that, lookups by prescription number and by
+# any INDEXED_FIELDS value are dict reads. Writes go to the store first and
+# then to the cache. A store with a change feed (SQLiteStore.changes) is asked
+# for other processes' writes before each read.
+class PrescriptionRepository:
+    INDEXED_FIELDS = ('medication', 'customer', 'sending_pharmacy', 'fax_needed')
+
+    def __init__(self, store):
+        self.store = store
+        self._lock = threading.RLock()
+        self._records = None
+        self._indexes = {field: defaultdict(set) for field in self.INDEXED_FIELDS}
+        self._mark = None
+        # Per-record version (a new one on every change) and the prescription
+        # numbers in order, for paging
+        self._versions = {}
+        self._numbers = []
+
+    # Medication and pharmacy names match regardless of case
+    @staticmethod
+    def _index_key(value):
+        return value.casefold() if isinstance(value, str) else value
+
+    def _ensure_loaded(self):
+        if self._records is not None:
+            return
+        with self._lock:
+            if self._records is not None:
+                return
+            with metrics.timer("prescription_index_load"):
+                if hasattr(self.store, "changes"):
+                    self._mark, loaded = self.store.changes()
+                else:
+                    loaded = self.store.load()
+                records = {}
+                self._apply(records, loaded)
+                self._numbers = sorted(records)
+            self._records = records
+
+    # Fold items into records and the indexes; returns the numbers that are new
+    def _apply(self, records, items):
+        indexes = self._indexes
+        versions = self._versions
+        added = []
+        for prescription_number, prescription in items.items():
+            previous = records.get(prescription_number)
+            if previous is None:
+                added.append(prescription_number)
+            for field, index in indexes.items():
+                if previous is not None and field in previous:
+                    numbers = index[self._index_key(previous[field])]
+                    numbers.discard(prescription_number)
+                    if not numbers:
+                        del index[self._index_key(previous[field])]
+                if field in prescription:
+                    index[self._index_key(prescription[field])].add(prescription_number)
+            records[prescription_number] = prescription
+            versions[prescription_number] = next(RECORD_VERSIONS)
+        return added
+
+    # Keep the ordered number list current; new numbers are nearly always the highest
+    def _add_numbers(self, added):
+        if not added:
+            return
+        added.sort()
+        numbers = self._numbers
+        if not numbers or added[0] > numbers[-1]:
+            numbers.extend(added)
+        elif len(added) < 64:
+            for prescription_number in added:
+                bisect.insort(numbers, prescription_number)
         else:
-            print("Invalid choice.")
+            self._numbers = list(heapq.merge(numbers, added))
 
-    return True
-# Main pharmacy chatbot function
-def pharmacy_chatbot():
-    print("Welcome to the Pharmacy Chatbot!")
-    while True:
-        print("\n1. Login")
-        print("2. Register")
-        print("3. Exit")
-        choice = input("Enter your choice: ")
-
-        if choice == "1":
-            if user_login():
-                username = input("Enter your username again for verification: ")
-                break
+    def _refresh(self):
+        if self._records is None:
+            self._ensure_loaded()
+        elif self._mark is not None:
+            with self._lock:
+                self._mark, changed = self.store.changes(self._mark)
+                # Rows stamped at the mark come back on the next call too (a writer
+                # with the same timestamp may commit after the read); an unchanged
+                # row keeps its version, so its cached views stay valid
+                records = self._records
+                changed = {number: prescription for number, prescription in changed.items()
+                           if records.get(number) != prescription}
+                if changed:
+                    metrics.count("prescription_changes_from_other_processes", len(changed))
+                    self._add_numbers(self._apply(self._records, changed))
+
+    def get(self, prescription_number, default=None):
+        self._refresh()
+        return self._records.get(prescription_number, default)
+
+    # (prescription, version), or (None, 0) for an unknown number. The version
+    # is read before the record (writers store the record first), so a racing
+    # write can only pair a newer record with an older version, never the reverse
+    def get_versioned(self, prescription_number):
+        self._refresh()
+        version = self._versions.get(prescription_number, 0)
+        prescription = self._records.get(prescription_number)
+        return (prescription, version) if prescription is not None else (None, 0)
+
+    def __contains__(self, prescription_number):
+        self._refresh()
+        return prescription_number in self._records
+
+    def __len__(self):
+        self._refresh()
+        return len(self._records)
+
+    def load(self):
+        self._refresh()
+        with self._lock:
+            return dict(self._records)
+
+    # Prescription numbers matching every field=value given, e.g.
+    # find(customer="alice", fax_needed=True)
+    def find(self, **criteria):
+        unknown = set(criteria) - set(self.INDEXED_FIELDS)
+        if unknown:
+            raise ValueError(f"Not an indexed field: {', '.join(sorted(unknown))}")
+        self._refresh()
+        with self._lock:
+            matches = [self._indexes[field].get(self._index_key(value), set())
+                       for field, value in criteria.items()]
+            if not matches:
+                return list(self._numbers)
+            return sorted(set.intersection(*sorted(matches, key=len)))
+
+    # One page of (prescription_number, prescription, version) in number order,
+    # starting after the number `after`, optionally filtered like find().
+    # Returns (rows, the number to pass as `after` for the next page or None).
+    def page(self, after=None, limit=50, **criteria):
+        numbers = self.find(**criteria) if criteria else None
+        with self._lock:
+            if numbers is None:
+                self._refresh()
+                numbers = self._numbers
+            start = bisect.bisect_right(numbers, after) if after is not None else 0
+            chunk = numbers[start:start + limit]
+            rows = [(number, self._records[number], self._versions[number]) for number in chunk]
+        following = chunk[-1] if chunk and start + limit < len(numbers) else None
+        return rows, following
+
+    # Distinct values of an indexed field with how many prescriptions have each
+    def counts(self, field):
+        if field not in self.INDEXED_FIELDS:
+            raise ValueError(f"Not an indexed field: {field}")
+        self._refresh()
+        with self._lock:
+            return {key: len(numbers) for key, numbers in self._indexes[field].items()}
+
+    def put(self, prescription_number, prescription):
+        self.put_many({prescription_number: prescription})
+
+    def put_many(self, items):
+        self._refresh()
+        with self._lock:
+            self.store.put_many(items)
+            self._add_numbers(self._apply(self._records, items))
+
+    # Insert only if the number is new; returns False when it already exists
+    def put_if_absent(self, prescription_number, prescription):
+        self._refresh()
+        with self._lock:
+            if not self.store.put_if_absent(prescription_number, prescription):
+                return False
+            self._add_numbers(self._apply(self._records, {prescription_number: prescription}))
+        return True
+
+    def close(self):
+        self.store.close()
+
+
+prescription_repository = PrescriptionRepository(prescription_store)
+
+# Load prescriptions from the prescription repository
+def load_prescriptions():
+    return prescription_repository.load()
+
+# Save prescriptions through the prescription repository (one log record per prescription)
+def save_prescriptions(prescriptions):
+    prescription_repository.put_many(prescriptions)
+
+# Password hashing cost (PBKDF2-HMAC-SHA256 iterations).
+# Tune with WELLBOT_KDF_ITERATIONS; calibrate_kdf_iterations picks a value for a latency target.
+USER_KDF_ITERATIONS = int(os.environ.get("WELLBOT_KDF_ITERATIONS", 200_000))
+
+def hash_password(password, salt=None, iterations=None):
+    if salt is None:
+        salt = os.urandom(16)
+    if iterations is None:
+        iterations = USER_KDF_ITERATIONS
+    digest = hashlib.pbkdf2_hmac("sha256", password.encode("utf-8"), salt, iterations)
+    return {"salt": salt.hex(), "hash": digest.hex(), "iterations": iterations}
+
+# Measure the KDF and return the iteration count that takes about target_seconds
+def calibrate_kdf_iterations(target_seconds=0.05, sample_iterations=20_000):
+    start = time.perf_counter()
+    hashlib.pbkdf2_hmac("sha256", b"calibration", b"0" * 16, sample_iterations)
+    elapsed = time.perf_counter() - start
+    return max(1_000, int(sample_iterations * target_seconds / elapsed))
+
+
+# In-memory user index loaded once per process.
+# Records live in users.json (snapshot) + users.log (one line per registration)
+# unless store= says otherwise, and only salted password hashes are stored. Plain-text passwords left in an
+# older users.json are still accepted once and re-hashed on that login.
+# The shared user_store keeps them in a SQLiteStore in wellbot.db.
+class UserStore:
+    def __init__(self, snapshot_path="users.json", log_path="users.log", iterations=None, store=None):
+        self.store = store if store is not None else LogStore(snapshot_path, log_path)
+        self.iterations = iterations
+
+    def __contains__(self, username):
+        return username in self.store
+
+    def __len__(self):
+        return len(self.store)
+
+    def register(self, username, password):
+        user = {"name": username, **hash_password(password, iterations=self.iterations)}
+        return self.store.put_if_absent(username, user)
+
+    @metrics.timed("password_verify")
+    def verify(self, username, password):
+        user = self.store.get(username)
+        if user is None:
+            # Do the same KDF work as for a real account, so the response time
+            # does not tell whether the username exists
+            hash_password(password, iterations=self.iterations)
+            return False
+        if "hash" not in user:
+            if not hmac.compare_digest(user.get("password", "").encode("utf-8"), password.encode("utf-8")):
+                return False
+            self.store.put(username, {"name": user.get("name", username),
+                                      **hash_password(password, iterations=self.iterations)})
+            return True
+        digest = hashlib.pbkdf2_hmac("sha256", password.encode("utf-8"),
+                                     bytes.fromhex(user["salt"]), user["iterations"])
+        return hmac.compare_digest(digest.hex(), user["hash"])
+
+
+# users.json/users.log from earlier versions are merged in on first use
+user_store = UserStore(store=SQLiteStore(SHARED_DB_PATH, "users", legacy=LogStore("users.json", "users.log")))
+
+# The stock dict. match a medicine with its current stock
+STOCK_DATA = {
+    'Medication': ['Amoxicillin', 'Ibuprofen', 'Lisinopril', 'Metformin', 'Levothyroxine', 'Atorvastatin', 'Amlodipine', 'Omeprazole', 'Losartan'],
+    'Stock': [100, 0, 150, 120, 80, 90, 110, 130, 140]  # Set Ibuprofen to 0 for demonstration
+}
+
+# Therapeutic class of each medication we price or stock; only drugs in the same
+# class are offered as alternatives when something is out of stock
+THERAPEUTIC_CLASSES = {
+    'Amoxicillin': 'Penicillin antibiotic',
+    'Ibuprofen': 'NSAID analgesic',
+    'Aspirin': 'NSAID analgesic',
+    'Lisinopril': 'Antihypertensive',
+    'Losartan': 'Antihypertensive',
+    'Amlodipine': 'Antihypertensive',
+    'Metformin': 'Antidiabetic',
+    'Levothyroxine': 'Thyroid hormone',
+    'Atorvastatin': 'Statin',
+    'Omeprazole': 'Proton pump inhibitor',
+}
+
+# Common brand names for the generics we carry
+BRAND_ALIASES = {
+    'Amoxil': 'Amoxicillin',
+    'Advil': 'Ibuprofen',
+    'Motrin': 'Ibuprofen',
+    'Zestril': 'Lisinopril',
+    'Prinivil': 'Lisinopril',
+    'Glucophage': 'Metformin',
+    'Synthroid': 'Levothyroxine',
+    'Eltroxin': 'Levothyroxine',
+    'Lipitor': 'Atorvastatin',
+    'Norvasc': 'Amlodipine',
+    'Prilosec': 'Omeprazole',
+    'Losec': 'Omeprazole',
+    'Cozaar': 'Losartan',
+    'Bayer': 'Aspirin',
+}
+
+
+# Edit distance between two strings. With max_distance only the diagonal band
+# that can stay within it is computed, and anything further returns max_distance + 1.
+def edit_distance(a, b, max_distance=None):
+    limit = max_distance if max_distance is not None else len(a) + len(b)
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    too_far = limit + 1
+    previous = [j if j <= limit else too_far for j in range(len(b) + 1)]
+    for i, char_a in enumerate(a, 1):
+        low = max(1, i - limit)
+        high = min(len(b), i + limit)
+        current = [too_far] * (len(b) + 1)
+        current[0] = i if i <= limit else too_far
+        best = current[0]
+        for j in range(low, high + 1):
+            value = previous[j - 1] + (char_a != b[j - 1])
+            if previous[j] + 1 < value:
+                value = previous[j] + 1
+            if current[j - 1] + 1 < value:
+                value = current[j - 1] + 1
+            if value > too_far:
+                value = too_far
+            current[j] = value
+            if value < best:
+                best = value
+        if best > limit:
+            return too_far
+        previous = current
+    return previous[-1]
+
+
+# Typo-tolerant medication name index.
+# Every known name (plus brand aliases) is stored with all of its single-character
+# deletions. A query walks its own deletions (up to max_distance deep) and each
+# hit gives an upper bound on the edit distance, so only a handful of candidates
+# ever need a real edit distance check and a lookup touches a few dozen dict
+# entries no matter how many names are indexed. That walk finds every name
+# within distance 1, but not distance-2 names that would need two deletions on
+# the indexed side (two substitutions, or letters missing from the query); when
+# it comes up short of k names, those are looked up from the query's one-letter
+# substitutions and insertions, a few hundred more dict entries. A sorted key
+# list answers prefix lookups with bisect.
+class NameIndex:
+    def __init__(self, names=(), aliases=None, max_distance=2):
+        self.max_distance = max_distance
+        self.canonical = {}
+        # deletion -> the names it comes from: a 1-tuple for the vast majority
+        # that come from one name, which keeps the build clear of a million lists
+        self.deletes = {}
+        # letter -> letters that follow it in some name (" " -> first letters)
+        self.followers = defaultdict(set)
+        for name in names:
+            self._add(name)
+        for alias, name in (aliases or {}).items():
+            self._add(alias, name)
+        self.sorted_keys = sorted(self.canonical)
+
+    @staticmethod
+    def normalize(name):
+        return " ".join(name.lower().split())
+
+    @staticmethod
+    def _deletions(key):
+        return {key[:i] + key[i + 1:] for i in range(len(key))}
+
+    # Index name without touching sorted_keys; returns its key, or None if already known
+    def _add(self, name, canonical=None):
+        key = self.normalize(name)
+        if key in self.canonical:
+            return None
+        self.canonical[key] = canonical or name
+        deletes = self.deletes
+        for variant in self._deletions(key):
+            keys = deletes.get(variant)
+            if keys is None:
+                deletes[variant] = (key,)
+            elif type(keys) is tuple:
+                deletes[variant] = [*keys, key]
             else:
-                continue
-        elif choice == "2":
-            if user_registration():
-                username = input("Enter your username again for verification: ")
+                keys.append(key)
+        followers = self.followers
+        for previous, char in zip(" " + key, key):
+            followers[previous].add(char)
+        return key
+
+    def add(self, name, canonical=None):
+        key = self._add(name, canonical)
+        if key is not None:
+            bisect.insort(self.sorted_keys, key)
+
+    # Up to about `wanted` indexed names, not in known, at edit distance 2 from
+    # query that the deletion walk in suggest cannot reach: two letters
+    # inserted, a substitution plus an insertion, or two substitutions. The
+    # leftmost edit is tried with each letter that may follow the one before it.
+    def _second_edits(self, query, known, wanted):
+        get = self.deletes.get
+        found = set()
+        for i in range(len(query) + 1):
+            head, tail = query[:i], query[i:]
+            rest = tail[1:]
+            # The second substitution, at a later position, is deleted on both sides
+            rest_deletions = [rest[:j] + rest[j + 1:] for j in range(len(rest))]
+            for char in self.followers.get(head[-1:] or " ", ()):
+                stem = head + char
+                for key in get(stem + tail, ()):
+                    if key not in known:
+                        found.add(key)
+                if not tail or char == tail[0]:
+                    continue
+                for key in get(stem + rest, ()):
+                    if key not in known:
+                        found.add(key)
+                for variant in rest_deletions:
+                    # Sharing this deletion only bounds the distance by 3; two
+                    # substitutions keep the length and change exactly two letters
+                    for key in get(stem + variant, ()):
+                        if (len(key) == len(query) and key not in known
+                                and sum(a != b for a, b in zip(key, query)) <= 2):
+                            found.add(key)
+            if len(found) >= wanted:
                 break
-            else:
-                continue
-        elif choice == "3":
-            print("Thank you for using the pharmacy chatbot. Goodbye!")
-            exit()
-        else:
-            print("Invalid choice. Please choose a valid option.")
+        return found
 
-    print(f"Welcome, {username}!")
-    while True:
-        print("\nWelcome menu options:")
-        print("1. Medication Order")
-        print("2. Prescription Management")
-        print("3. Medication Information Index")
-        print("4. Feedback/Improvement")
-        print("5. Exit")
-
-        choice = input("Enter your choice: ")
-
-        if choice == "1":
-            prescription_ordering()
-        elif choice == "2":
-            prescription_management()
-        elif choice == "3":
-            medication_information()
-        elif choice == "4":
-            feedback_improvement()
-        elif choice == "5":
-            print("Thank you for using the pharmacy chatbot. Goodbye!")
-            exit()
-            break
-        else:
-            print("Invalid choice. Please choose a valid option.")
+    # Canonical name for an exact (case-insensitive) name or alias, else None
+    def resolve(self, name):
+        return self.canonical.get(self.normalize(name))
+
+    # Canonical names whose name or alias starts with prefix
+    def complete(self, prefix, k=5):
+        prefix = self.normalize(prefix)
+        results = []
+        i = bisect.bisect_left(self.sorted_keys, prefix)
+        while i < len(self.sorted_keys) and len(results) < k:
+            key = self.sorted_keys[i]
+            if not key.startswith(prefix):
+                break
+            if self.canonical[key] not in results:
+                results.append(self.canonical[key])
+            i += 1
+        return results
+
+    # Top-k canonical names closest to name, best first
+    def suggest(self, name, k=5):
+        query = self.normalize(name)
+
+        # Fewest deletions (query side + indexed side) that make each candidate match
+        bounds = {}
+        frontier = {query}
+        for depth in range(self.max_distance + 1):
+            for variant in frontier:
+                if variant in self.canonical and bounds.get(variant, depth + 1) > depth:
+                    bounds[variant] = depth
+                for key in self.deletes.get(variant, ()):
+                    if bounds.get(key, depth + 2) > depth + 1:
+                        bounds[key] = depth + 1
+            if depth < self.max_distance:
+                frontier = {deeper for variant in frontier for deeper in self._deletions(variant)}
+
+        by_bound = defaultdict(list)
+        for key, bound in bounds.items():
+            by_bound[bound].append(key)
+
+        # Deletions on one side only give the exact distance; otherwise check it
+        scored = []
+        for bound in sorted(by_bound):
+            if len(scored) >= k:
+                break
+            for key in by_bound[bound]:
+                distance = bound if bound <= 1 else edit_distance(query, key, self.max_distance)
+                if distance <= self.max_distance:
+                    scored.append((distance, len(key), key))
+        if len(scored) < k and self.max_distance >= 2:
+            scored.extend((2, len(key), key) for key in self._second_edits(query, bounds, k - len(scored)))
+        scored.sort()
+
+        results = []
+        for _, _, key in scored:
+            if self.canonical[key] not in results:
+                results.append(self.canonical[key])
+                if len(results) == k:
+                    break
+        return results or self.complete(query, k)
+
+
+_name_index = None
+_name_index_engine = None
+
+# Shared name index over the pricing catalog, the stock list and brand aliases
+# (rebuilt when the pricing catalog is reloaded)
+def get_name_index():
+    global _name_index, _name_index_engine
+    engine = get_pricing_engine()
+    if _name_index is None or _name_index_engine is not engine:
+        names = [str(name) for name in engine.names] + STOCK_DATA['Medication']
+        _name_index = NameIndex(names, BRAND_ALIASES)
+        _name_index_engine = engine
+    return _name_index
+
+
+PRICE_CATEGORIES = ('Public', 'Private')
+MEDICATION_TYPES = ('Brand', 'Generic')
+PRICING_COLUMNS = ('Brand_Public', 'Brand_Private', 'Brand_Manufacturer_Rebate',
+                   'Generic_Public', 'Generic_Private', 'Generic_Manufacturer_Rebate')
+
+# Pricing catalog file (CSV or Parquet with a Medication column plus PRICING_COLUMNS),
+# next to this file unless WELLBOT_PRICING_CATALOG points elsewhere
+PRICING_CATALOG = os.environ.get("WELLBOT_PRICING_CATALOG",
+                                 os.path.join(os.path.dirname(os.path.abspath(__file__)), "drug_prices.csv"))
+
+
+# Drug pricing engine.
+# Prices live in a (medication x type x category) array and rebates in a
+# (medication x type) array. Names are found by binary search over a sorted
+# array of normalized names, so the engine can run directly on memory-mapped
+# arrays without building per-row Python objects; one lookup is a
+# searchsorted plus an array index and a whole cart is priced with a single
+# fancy-indexing expression.
+class PricingEngine:
+    def __init__(self, names, keys, key_rows, prices, rebates):
+        self.names = names
+        self.keys = keys
+        self.key_rows = key_rows
+        self.prices = prices
+        self.rebates = rebates
+
+    # Build the arrays in memory from a {column: values} table or DataFrame
+    @classmethod
+    def from_table(cls, table):
+        names = [str(name) for name in table['Medication']]
+        normalized = np.array([NameIndex.normalize(name) for name in names], dtype=str)
+        key_rows = np.argsort(normalized, kind="stable")
+        prices = np.stack([
+            np.stack([np.asarray(table[f'{medication_type}_{category}'], dtype=np.float64)
+                      for category in PRICE_CATEGORIES], axis=-1)
+            for medication_type in MEDICATION_TYPES], axis=1)
+        rebates = np.stack([np.asarray(table[f'{medication_type}_Manufacturer_Rebate'], dtype=np.float64)
+                            for medication_type in MEDICATION_TYPES], axis=1)
+        return cls(np.array(names, dtype=str), normalized[key_rows], key_rows, prices, rebates)
+
+    # An engine that prices nothing, for when there is no catalog file
+    @classmethod
+    def empty(cls):
+        return cls.from_table({'Medication': [], **{column: [] for column in PRICING_COLUMNS}})
+
+    def __len__(self):
+        return len(self.names)
+
+    def _rows(self, medications):
+        normalized = [NameIndex.normalize(medication) for medication in medications]
+        # Keys are cast to the catalog's string width so the search runs on the
+        # mapped array as is; a longer name would be cut short, and matches nothing
+        width = self.keys.dtype.itemsize // np.dtype('U1').itemsize
+        fits = np.fromiter((len(key) <= width for key in normalized), dtype=bool, count=len(normalized))
+        keys = np.array(normalized, dtype=self.keys.dtype)
+        positions = np.searchsorted(self.keys, keys)
+        positions = np.minimum(positions, len(self.keys) - 1)
+        found = fits & (self.keys[positions] == keys)
+        return np.where(found, self.key_rows[positions], -1)
+
+    def row(self, medication):
+        if not len(self.keys):
+            return -1
+        key = NameIndex.normalize(medication)
+        # bisect only reads the ~log2(n) entries it compares, so a lookup pages in
+        # a handful of pages of the mapped file instead of the whole key column
+        position = bisect.bisect_left(self.keys, key)
+        if position < len(self.keys) and self.keys[position] == key:
+            return int(self.key_rows[position])
+        return -1
+
+    @staticmethod
+    def _position(options, value):
+        # Accept "Public", "public insurance", "GENERIC", ...
+        words = str(value).split()
+        word = words[0].title() if words else ''
+        return options.index(word) if word in options else -1
+
+    # Price of one medication, or None for an unknown medication/category/type
+    def price(self, medication, category, medication_type, rebate=False):
+        row = self.row(medication)
+        category_pos = self._position(PRICE_CATEGORIES, category)
+        type_pos = self._position(MEDICATION_TYPES, medication_type)
+        if row < 0 or category_pos < 0 or type_pos < 0:
+            return None
+        price = self.prices[row, type_pos, category_pos]
+        if rebate:
+            price -= self.rebates[row, type_pos]
+        return float(price)
+
+    # Vectorized pricing: every argument is a sequence (or a single value applied
+    # to all medications). Returns a float array with NaN for anything unknown.
+    def price_many(self, medications, categories, medication_types, rebates=False):
+        medications = list(medications)
+        count = len(medications)
+        if not count or not len(self.keys):
+            return np.full(count, np.nan)
+        rows = self._rows(medications)
+
+        def positions(options, values):
+            if isinstance(values, str):
+                return np.full(count, self._position(options, values), dtype=np.int64)
+            return np.fromiter((self._position(options, value) for value in values), dtype=np.int64, count=count)
+
+        category_pos = positions(PRICE_CATEGORIES, categories)
+        type_pos = positions(MEDICATION_TYPES, medication_types)
+        valid = (rows >= 0) & (category_pos >= 0) & (type_pos >= 0)
+        rows, category_pos, type_pos = np.where(valid, rows, 0), np.where(valid, category_pos, 0), np.where(valid, type_pos, 0)
+
+        prices = self.prices[rows, type_pos, category_pos]
+        prices = prices - np.asarray(rebates, dtype=bool) * self.rebates[rows, type_pos]
+        prices[~valid] = np.nan
+        return prices
+
+    # Total for a cart of (medication, category, medication_type, rebate) items;
+    # None if any item cannot be priced
+    def cart_total(self, items):
+        if not items:
+            return 0.0
+        medications, categories, medication_types, rebates = zip(*items)
+        prices = self.price_many(medications, categories, medication_types, rebates)
+        if np.isnan(prices).any():
+            return None
+        return float(prices.sum())
+
+
+PRICING_ARRAYS = ("names", "keys", "key_rows", "prices", "rebates")
+
+# Directory holding the columnar copy of a catalog file (one per file version)
+def pricing_cache_dir(path):
+    stat = os.stat(path)
+    directory = os.path.join(os.path.dirname(os.path.abspath(path)), ".wellbot_cache")
+    return os.path.join(directory, f"{os.path.basename(path)}-{stat.st_size}-{stat.st_mtime_ns}")
+
+# Convert a CSV/Parquet catalog into .npy columns (done once per file version)
+def build_pricing_cache(path, cache_dir):
+    if path.endswith(".parquet"):
+        table = pd.read_parquet(path, columns=['Medication', *PRICING_COLUMNS])
+    else:
+        table = pd.read_csv(path, usecols=['Medication', *PRICING_COLUMNS])
+    engine = PricingEngine.from_table(table)
+    tmp_dir = f"{cache_dir}.{os.getpid()}.tmp"
+    os.makedirs(tmp_dir, exist_ok=True)
+    for name in PRICING_ARRAYS:
+        np.save(os.path.join(tmp_dir, f"{name}.npy"), getattr(engine, name))
+    try:
+        os.rename(tmp_dir, cache_dir)
+    except OSError:
+        # Another worker finished the same conversion first
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    # Drop columnar copies of older versions of this catalog
+    prefix = f"{os.path.basename(path)}-"
+    parent = os.path.dirname(cache_dir)
+    for entry in os.listdir(parent):
+        if entry.startswith(prefix) and os.path.join(parent, entry) != cache_dir and not entry.endswith(".tmp"):
+            shutil.rmtree(os.path.join(parent, entry), ignore_errors=True)
+
+# Pricing engine over memory-mapped columns of the catalog file; the pages are
+# shared by every worker process that maps the same cache
+def load_pricing_engine(path):
+    cache_dir = pricing_cache_dir(path)
+    if not os.path.isdir(cache_dir):
+        build_pricing_cache(path, cache_dir)
+    arrays = [np.load(os.path.join(cache_dir, f"{name}.npy"), mmap_mode="r") for name in PRICING_ARRAYS]
+    for array in arrays:
+        # Lookups are random access; skip the kernel's sequential read-ahead
+        mapping = getattr(array, "_mmap", None)
+        if mapping is not None and hasattr(mmap, "MADV_RANDOM"):
+            mapping.madvise(mmap.MADV_RANDOM)
+    return PricingEngine(*arrays)
+
+
+# Pricing catalog that reloads itself when the catalog file changes
+# (checked at most once every reload_interval seconds)
+class PricingCatalog:
+    def __init__(self, path, reload_interval=1.0):
+        self.path = path
+        self.reload_interval = reload_interval
+        self._engine = None
+        self._version = None
+        self._checked = 0.0
+        self._lock = threading.Lock()
+
+    def engine(self):
+        now = time.monotonic()
+        if self._engine is not None and now - self._checked < self.reload_interval:
+            return self._engine
+        with self._lock:
+            self._checked = now
+            try:
+                stat = os.stat(self.path)
+            except FileNotFoundError:
+                # Nothing is priced without a catalog, but medication names still
+                # resolve against the stock list; a catalog that appears later is loaded
+                if self._engine is None:
+                    self._engine = PricingEngine.empty()
+                return self._engine
+            version = (stat.st_size, stat.st_mtime_ns)
+            if version != self._version:
+                self._engine = load_pricing_engine(self.path)
+                self._version = version
+        return self._engine
+
+
+pricing_catalog = PricingCatalog(PRICING_CATALOG)
+
+def get_pricing_engine():
+    return pricing_catalog.engine()
+
+# Look up a drug price (brand aliases and typos in case are resolved if the name is not in the catalog)
+@metrics.timed("price_lookup")
+def get_drug_price(medication, category, medication_type, rebate=False):
+    engine = get_pricing_engine()
+    if engine.row(medication) < 0:
+        medication = get_name_index().resolve(medication) or medication
+    return engine.price(medication, category, medication_type, rebate)
+
+
+# Inventory service backed by SQLite in WAL mode.
+# Each SKU row keeps on_hand and reserved counters; reserve/commit/release are
+# single IMMEDIATE transactions with guarded row updates, so they stay atomic
+# across threads (one connection per thread) and across worker processes.
+class Inventory:
+    def __init__(self, path="inventory.db", initial_stock=None, hold_seconds=2 * 24 * 3600):
+        self.path = path
+        self.hold_seconds = hold_seconds
+        self.listeners = []
+        self._local = threading.local()
+        self._expiry = None
+        with self._transaction() as db:
+            db.execute("CREATE TABLE IF NOT EXISTS stock ("
+                       "medication TEXT PRIMARY KEY, on_hand INTEGER NOT NULL, reserved INTEGER NOT NULL DEFAULT 0)")
+            db.execute("CREATE TABLE IF NOT EXISTS reservations ("
+                       "id INTEGER PRIMARY KEY AUTOINCREMENT, medication TEXT NOT NULL, "
+                       "quantity INTEGER NOT NULL, expires REAL NOT NULL)")
+            if initial_stock:
+                db.executemany("INSERT OR IGNORE INTO stock (medication, on_hand) VALUES (?, ?)",
+                               list(initial_stock.items()))
+
+    def _connection(self):
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = self._local.db = connect_sqlite(self.path)
+        return db
+
+    def _transaction(self):
+        return sqlite_transaction(self._connection())
+
+    # Tell listeners (e.g. the alternatives index) about a new stock level
+    def _changed(self, db, medication):
+        if self.listeners:
+            available = db.execute("SELECT on_hand - reserved FROM stock WHERE medication = ?",
+                                   (medication,)).fetchone()[0]
+            for listener in self.listeners:
+                listener(medication, available)
+
+    # Units that can still be reserved, or None for an unknown medication
+    @metrics.timed("stock_lookup")
+    def available(self, medication):
+        row = self._connection().execute(
+            "SELECT on_hand - reserved FROM stock WHERE medication = ?", (medication,)).fetchone()
+        return row[0] if row else None
+
+    def __contains__(self, medication):
+        return self.available(medication) is not None
+
+    # {medication: available units} for every SKU
+    def levels(self):
+        return dict(self._connection().execute("SELECT medication, on_hand - reserved FROM stock"))
+
+    # True when another connection (another worker process) has committed since
+    # this thread last asked; PRAGMA data_version does not move for our own writes
+    def changed_elsewhere(self):
+        data_version = self._connection().execute("PRAGMA data_version").fetchone()[0]
+        changed = data_version != getattr(self._local, "data_version", None)
+        self._local.data_version = data_version
+        return changed
+
+    # Hold quantity units; returns a reservation id, or None if there is not enough stock
+    @metrics.timed("stock_reserve")
+    def reserve(self, medication, quantity=1):
+        with self._transaction() as db:
+            updated = db.execute(
+                "UPDATE stock SET reserved = reserved + ? WHERE medication = ? AND on_hand - reserved >= ?",
+                (quantity, medication, quantity)).rowcount
+            if not updated:
+                return None
+            self._changed(db, medication)
+            return db.execute("INSERT INTO reservations (medication, quantity, expires) VALUES (?, ?, ?)",
+                              (medication, quantity, time.time() + self.hold_seconds)).lastrowid
+
+    def _finish(self, reservation_id, on_hand_change):
+        with self._transaction() as db:
+            row = db.execute("SELECT medication, quantity FROM reservations WHERE id = ?",
+                             (reservation_id,)).fetchone()
+            if row is None:
+                return False
+            medication, quantity = row
+            db.execute("UPDATE stock SET on_hand = on_hand - ?, reserved = reserved - ? WHERE medication = ?",
+                       (quantity * on_hand_change, quantity, medication))
+            db.execute("DELETE FROM reservations WHERE id = ?", (reservation_id,))
+            self._changed(db, medication)
+            return True
+
+    # Take the reserved units out of stock (order shipped)
+    def commit(self, reservation_id):
+        return self._finish(reservation_id, 1)
+
+    # Give the reserved units back
+    def release(self, reservation_id):
+        return self._finish(reservation_id, 0)
+
+    # Release holds that were never committed
+    def release_expired(self):
+        expired = [row[0] for row in self._connection().execute(
+            "SELECT id FROM reservations WHERE expires < ?", (time.time(),))]
+        for reservation_id in expired:
+            self.release(reservation_id)
+        return len(expired)
+
+    # Release expired holds every interval seconds on a daemon thread, so a
+    # long-running bot or server gives abandoned holds back to stock
+    def start_expiry(self, interval=3600):
+        if self._expiry is not None:
+            return
+        self._expiry = threading.Event()
+
+        def sweep(stop):
+            while not stop.wait(interval):
+                try:
+                    self.release_expired()
+                except sqlite3.Error:
+                    continue
+
+        threading.Thread(target=sweep, args=(self._expiry,), name="inventory-expiry", daemon=True).start()
+
+    def stop_expiry(self):
+        if self._expiry is not None:
+            self._expiry.set()
+            self._expiry = None
+
+    def restock(self, medication, quantity):
+        with self._transaction() as db:
+            db.execute("INSERT INTO stock (medication, on_hand) VALUES (?, ?) "
+                       "ON CONFLICT(medication) DO UPDATE SET on_hand = on_hand + excluded.on_hand",
+                       (medication, quantity))
+            self._changed(db, medication)
+
+
+# WELLBOT_INVENTORY overrides the inventory database path
+INVENTORY_PATH = os.environ.get("WELLBOT_INVENTORY", "inventory.db")
+_inventory = None
+
+# Shared inventory, seeded from STOCK_DATA the first time the database is created
+def get_inventory():
+    global _inventory
+    if _inventory is None:
+        _inventory = Inventory(INVENTORY_PATH, dict(zip(STOCK_DATA['Medication'], STOCK_DATA['Stock'])))
+        _inventory.release_expired()
+        _inventory.start_expiry()
+    return _inventory
+
+
+# In-stock alternatives grouped by therapeutic class.
+# Each class keeps its in-stock medications in a list sorted by stock level
+# (highest first); the inventory pushes every level change here, so a
+# recommendation is a walk over the first k entries of one class. Listeners only
+# see this process's writes, so with an inventory attached the levels are
+# re-read from the database whenever another process has changed it.
+class AlternativesIndex:
+    def __init__(self, classes, levels=None, inventory=None):
+        self.classes = {NameIndex.normalize(medication): group for medication, group in classes.items()}
+        self.levels = {}
+        self.in_stock = defaultdict(list)
+        self.inventory = inventory
+        self._lock = threading.Lock()
+        if inventory is not None:
+            inventory.changed_elsewhere()
+            levels = inventory.levels()
+        for medication, units in (levels or {}).items():
+            self.update(medication, units)
+
+    def therapeutic_class(self, medication):
+        return self.classes.get(NameIndex.normalize(medication))
+
+    def update(self, medication, units):
+        group = self.therapeutic_class(medication)
+        if group is None:
+            return
+        with self._lock:
+            ranked = self.in_stock[group]
+            previous = self.levels.get(medication)
+            if previous is not None and previous > 0:
+                del ranked[bisect.bisect_left(ranked, (-previous, medication))]
+            if units > 0:
+                bisect.insort(ranked, (-units, medication))
+            self.levels[medication] = units
+
+    # Bring every level in line with the inventory database
+    def refresh(self):
+        for medication, units in self.inventory.levels().items():
+            if self.levels.get(medication) != units:
+                self.update(medication, units)
+
+    # Up to k in-stock medications of the same class, most stock first
+    def recommend(self, medication, k=3):
+        group = self.therapeutic_class(medication)
+        if group is None:
+            return []
+        if self.inventory is not None and self.inventory.changed_elsewhere():
+            self.refresh()
+        results = []
+        with self._lock:
+            for negative_units, alternative in self.in_stock[group]:
+                if alternative != medication:
+                    results.append((alternative, -negative_units))
+                    if len(results) == k:
+                        break
+        return results
+
+
+_alternatives_index = None
+
+# Alternatives index over the shared inventory, kept current by its change listener
+# and by re-reading the database after other workers' writes
+def get_alternatives_index():
+    global _alternatives_index
+    if _alternatives_index is None:
+        inventory = get_inventory()
+        _alternatives_index = AlternativesIndex(THERAPEUTIC_CLASSES, inventory=inventory)
+        inventory.listeners.append(_alternatives_index.update)
+    return _alternatives_index
+
+
+# Exclusive lock on a file shared by every worker process
+@contextlib.contextmanager
+def locked_file(path):
+    with open(path, "a+b") as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield f
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+# Prescription number allocator.
+# Each process leases a block of block_size numbers from a counter file under a
+# file lock, then hands them out from an itertools.count (a single atomic step
+# under the GIL, so threads never take a lock on the fast path). Numbers are
+# unique across processes and zero-padded so they sort in allocation order.
+class PrescriptionNumberAllocator:
+    def __init__(self, path="rx_sequence", block_size=10_000, prefix="RX", width=10):
+        self.path = path
+        self.block_size = block_size
+        self.prefix = prefix
+        self.width = width
+        self._lock = threading.Lock()
+        self._block = (itertools.count(), 0)
+        if hasattr(os, "register_at_fork"):
+            allocator = weakref.ref(self)
+            os.register_at_fork(after_in_child=lambda: allocator() is not None and allocator()._after_fork())
+
+    # A forked child must not hand out what is left of the parent's block
+    def _after_fork(self):
+        self._lock = threading.Lock()
+        self._block = (itertools.count(), 0)
+
+    # Reserve count consecutive numbers in the counter file; returns the first one
+    def lease(self, count):
+        with locked_file(self.path) as f:
+            f.seek(0)
+            content = f.read().strip()
+            start = int(content) if content else 1
+            f.seek(0)
+            f.truncate()
+            f.write(str(start + count).encode())
+            f.flush()
+            os.fsync(f.fileno())
+        return start
+
+    def next_number(self):
+        while True:
+            counter, end = self._block
+            number = next(counter)
+            if number < end:
+                return number
+            with self._lock:
+                if self._block[0] is counter:
+                    start = self.lease(self.block_size)
+                    self._block = (itertools.count(start), start + self.block_size)
+
+    def format(self, number):
+        return f"{self.prefix}{number:0{self.width}d}"
+
+    def allocate(self):
+        return self.format(self.next_number())
+
+    # count prescription numbers in one lease (bulk imports)
+    def allocate_many(self, count):
+        start = self.lease(count)
+        return [self.format(number) for number in range(start, start + count)]
+
+
+prescription_numbers = PrescriptionNumberAllocator(os.environ.get("WELLBOT_RX_SEQUENCE", "rx_sequence"))
+
+def generate_prescription_number():
+    return prescription_numbers.allocate()
+
+
+# Order tracking store.
+# Every status change is an event appended to delivery_events.log, which keeps
+# the full history. The current status of each prescription is indexed in
+# memory by prescription number, and there is a second index by status, so
+# "all On Hold orders" needs no scan. A checkpoint (delivery_status.json, the
+# statuses plus the log offset they cover) is rewritten in the background now
+# and then, so a restart only replays the events after it. Before each read the
+# log size is checked and events appended by other processes are tailed in, so
+# worker processes sharing the files stay in step. Each status keeps the
+# timestamp of its event and only a newer (or equally new) event replaces it, so
+# a courier event that arrives late is kept in the history but does not
+# overwrite a more recent status.
+class DeliveryTracker:
+    def __init__(self, log_path="delivery_events.log", checkpoint_path="delivery_status.json",
+                 checkpoint_every=100_000, batch_size=50_000):
+        self.log = AppendLog(log_path)
+        self.checkpoint_path = checkpoint_path
+        self.checkpoint_every = checkpoint_every
+        self.batch_size = batch_size
+        self._lock = threading.Lock()
+        self._status = None
+        self._timestamps = {}
+        self._by_status = defaultdict(set)
+        self._offset = 0
+        self._since_checkpoint = 0
+        self._checkpointer = None
+
+    def _ensure_loaded(self):
+        if self._status is not None:
+            return
+        with self._lock:
+            if self._status is not None:
+                return
+            try:
+                with open(self.checkpoint_path, "r") as f:
+                    checkpoint = json.load(f)
+            except (FileNotFoundError, json.JSONDecodeError):
+                checkpoint = {}
+            offset = checkpoint.get("offset", 0)
+            statuses = checkpoint.get("statuses", {})
+            timestamps = checkpoint.get("timestamps", {})
+            try:
+                log_size = os.path.getsize(self.log.path)
+            except FileNotFoundError:
+                log_size = 0
+            if offset > log_size:
+                # The checkpoint belongs to a different log; rebuild from the events
+                offset, statuses, timestamps = 0, {}, {}
+            self._status = statuses
+            self._timestamps = timestamps
+            for prescription_number, status in statuses.items():
+                self._by_status[status].add(prescription_number)
+            self._offset = offset
+            self._tail()
+
+    # Apply events appended to the log since self._offset (caller holds the lock).
+    # An incomplete last line is left for the next call; a line that cannot be
+    # decoded (a torn write) is skipped.
+    def _tail(self, chunk_size=1 << 24):
+        try:
+            if os.path.getsize(self.log.path) <= self._offset:
+                return
+        except FileNotFoundError:
+            return
+        with open(self.log.path, "rb") as f:
+            f.seek(self._offset)
+            while True:
+                data = f.read(chunk_size)
+                end = data.rfind(b"\n") + 1
+                if not end:
+                    return
+                self._offset += end
+                f.seek(self._offset)
+                self._apply_lines(data[:end].splitlines())
+
+    # Decode a batch of log lines in one json.loads call, line by line only if one is damaged
+    def _apply_lines(self, lines):
+        try:
+            events = json.loads(b"[" + b",".join(lines) + b"]")
+        except json.JSONDecodeError:
+            events = []
+            for line in lines:
+                try:
+                    events.append(json.loads(line))
+                except json.JSONDecodeError:
+                    continue
+        self._apply_many([(event["prescription_number"], event["status"], event.get("timestamp", 0.0))
+                          for event in events])
+        self._since_checkpoint += len(events)
+
+    # Apply (prescription_number, status, timestamp) events; an event older than
+    # the current status of its prescription is ignored
+    def _apply_many(self, events):
+        status_of = self._status
+        timestamps = self._timestamps
+        by_status = self._by_status
+        for prescription_number, status, timestamp in events:
+            if timestamp < timestamps.get(prescription_number, timestamp):
+                continue
+            timestamps[prescription_number] = timestamp
+            previous = status_of.get(prescription_number)
+            if previous == status:
+                continue
+            if previous is not None:
+                numbers = by_status[previous]
+                numbers.discard(prescription_number)
+                if not numbers:
+                    del by_status[previous]
+            status_of[prescription_number] = status
+            by_status[status].add(prescription_number)
+
+    def _refresh(self):
+        if self._status is None:
+            self._ensure_loaded()
+        else:
+            with self._lock:
+                self._tail()
+
+    def get(self, prescription_number, default=None):
+        self._refresh()
+        return self._status.get(prescription_number, default)
+
+    def __getitem__(self, prescription_number):
+        self._refresh()
+        return self._status[prescription_number]
+
+    def __setitem__(self, prescription_number, status):
+        self.update_many([(prescription_number, status)])
+
+    def __contains__(self, prescription_number):
+        self._refresh()
+        return prescription_number in self._status
+
+    def __len__(self):
+        self._refresh()
+        return len(self._status)
+
+    # Prescription numbers currently in status, in RX order
+    def with_status(self, status):
+        self._refresh()
+        with self._lock:
+            return sorted(self._by_status.get(status, ()))
+
+    # {status: number of prescriptions}
+    def counts(self):
+        self._refresh()
+        with self._lock:
+            return {status: len(numbers) for status, numbers in self._by_status.items()}
+
+    # Record status changes from an iterable of (prescription_number, status) or
+    # (prescription_number, status, timestamp), in batches; returns how many.
+    # A timestamp is epoch seconds or an ISO-8601 string; without one the event
+    # is stamped now.
+    def update_many(self, events):
+        self._ensure_loaded()
+        events = iter(events)
+        count = 0
+        encode = json.encoder.encode_basestring_ascii
+        for batch in iter(lambda: list(itertools.islice(events, self.batch_size)), []):
+            now = time.time()
+            batch = [(event[0], event[1], parse_event_timestamp(event[2]) if len(event) > 2 else now)
+                     for event in batch]
+            # Same lines json.dumps would write, without its per-record overhead
+            data = "".join(
+                f'{{"prescription_number": {encode(event[0])}, "status": {encode(event[1])}, '
+                f'"timestamp": {event[2]!r}}}\n'
+                for event in batch).encode("ascii")
+            with self._lock:
+                self._tail()
+                start = self._offset
+                written = self.log.append_encoded(data, len(batch))
+                if os.path.getsize(self.log.path) == start + written:
+                    # Nobody else appended in between: apply in memory, skip re-reading
+                    self._apply_many(batch)
+                    self._offset = start + written
+                    self._since_checkpoint += len(batch)
+                else:
+                    self._tail()
+            count += len(batch)
+        self._maybe_checkpoint()
+        return count
+
+    # Bulk status updates from a courier feed: CSV with prescription_number and
+    # status columns (timestamp optional) or NDJSON with the same fields. A
+    # malformed feed raises ValueError naming the file and line; events before
+    # the bad line have already been recorded.
+    def import_feed(self, path):
+        with open(path, "r", newline="") as f:
+            if path.endswith((".ndjson", ".jsonl")):
+                return self.update_many(_ndjson_feed_events(path, f))
+            return self.update_many(_csv_feed_events(path, f))
+
+    def _maybe_checkpoint(self):
+        if self._since_checkpoint < max(self.checkpoint_every, len(self._status)):
+            return
+        if self._checkpointer is not None and self._checkpointer.is_alive():
+            return
+        self._checkpointer = threading.Thread(target=self.checkpoint, daemon=True)
+        self._checkpointer.start()
+
+    def checkpoint(self):
+        with self._lock:
+            checkpoint = {"offset": self._offset, "statuses": dict(self._status),
+                          "timestamps": dict(self._timestamps)}
+            self._since_checkpoint = 0
+        write_json_atomic(self.checkpoint_path, checkpoint)
+
+    def close(self):
+        if self._checkpointer is not None:
+            self._checkpointer.join()
+        self.log.close()
+
+
+# Epoch seconds from a feed timestamp: a number, a numeric string or an
+# ISO-8601 date and time (a trailing Z or no offset at all means UTC)
+def parse_event_timestamp(value):
+    if isinstance(value, (int, float)):
+        return float(value)
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        moment = datetime.fromisoformat(value.strip().replace("Z", "+00:00"))
+    except ValueError:
+        raise ValueError(f"invalid timestamp {value!r}") from None
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return moment.timestamp()
+
+
+def _feed_error(path, line, problem):
+    return ValueError(f"courier feed {path}, line {line}: {problem}")
+
+
+def _feed_event(path, line, number, status, timestamp):
+    if not number or not status:
+        raise _feed_error(path, line, "missing prescription_number or status")
+    if not timestamp:
+        return number, status
+    try:
+        return number, status, parse_event_timestamp(timestamp)
+    except (TypeError, ValueError) as e:
+        raise _feed_error(path, line, e) from None
+
+
+def _ndjson_feed_events(path, f):
+    for line, text in enumerate(f, 1):
+        if not text.strip():
+            continue
+        try:
+            record = json.loads(text)
+        except json.JSONDecodeError as e:
+            raise _feed_error(path, line, f"not valid JSON ({e.msg})") from None
+        if not isinstance(record, dict):
+            raise _feed_error(path, line, "expected a JSON object")
+        yield _feed_event(path, line, record.get("prescription_number"), record.get("status"),
+                          record.get("timestamp"))
+
+
+def _csv_feed_events(path, f):
+    import csv
+    rows = csv.reader(f)
+    header = [column.strip() for column in next(rows, [])]
+    missing = [column for column in ("prescription_number", "status") if column not in header]
+    if missing:
+        raise _feed_error(path, 1, f"missing column(s) {', '.join(missing)} in header {header}")
+    number, status = header.index("prescription_number"), header.index("status")
+    timestamp = header.index("timestamp") if "timestamp" in header else None
+    width = max(number, status, -1 if timestamp is None else timestamp) + 1
+    for row in rows:
+        if not row:
+            continue
+        if len(row) < width:
+            raise _feed_error(path, rows.line_num, f"expected {len(header)} columns, got {len(row)}")
+        yield _feed_event(path, rows.line_num, row[number], row[status],
+                          None if timestamp is None else row[timestamp])
+
+
+# Delivery status of each prescription number
+delivery_status = DeliveryTracker()
+
+# Order statuses that need a call to the pharmacy
+ASSISTANCE_STATUSES = ('Canceled', 'On Hold', 'Rescheduled')
+CALL_CENTER = '514 123 4567'
+
+PHARMACY_SUPPORT = {
+    'phone': '1-866-640-3800',
+    'email': 'pharmacysupport@well.ca',
+    'hours': ['Monday-Friday: 9am - 10pm EST', 'Saturday: 9am - 4pm EST', 'Sunday: 10am - 5pm EST'],
+}
+
+# OpenFDA label sections returned by WellBotEngine.drug_info
+LABEL_SECTIONS = {
+    'dosage': 'dosage_and_administration',
+    'warnings': 'warnings',
+    'indications': 'indications_and_usage',
+    'interactions': 'drug_interactions',
+}
+
+# (heading, message when the label has no such section) for each rendered label section
+LABEL_SECTION_TEXT = {
+    'dosage': ("Dosage and Administration:", "Dosage information not available."),
+    'warnings': ("Allergy Information:", "Allergy information not available."),
+    'indications': ("General Information:", "General information not available."),
+    'interactions': ("\nDrug Interactions:", "Drug interactions information not available."),
+}
+
+# Prescriptions per page of WellBotEngine.list_prescriptions and --list-prescriptions
+LISTING_PAGE_SIZE = 100
+
+
+# Placeholder details for an incoming transfer until the sending pharmacy's record arrives
+def random_prescription_data():
+    medication = f"Medication_{random.randint(1, 100)}"
+    dosage = f"{random.randint(1, 20)}mg"
+    instructions = f"Take {random.randint(1, 3)} times daily"
+    refills = random.randint(0, 5)
+    return medication, dosage, instructions, refills
+
+
+# Rendered views: the text and JSON answers for a prescription or a label
+# section, formatted once and reused until the record changes. An entry is
+# keyed by what it shows and stamped with the version it was rendered from
+# (the repository's record version, or the label object itself), so a changed
+# record is simply a miss and gets rendered again.
+class ViewCache:
+    def __init__(self, maxsize=4096):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    # The view of key at version, rendering it with render(*args) on a miss
+    def get(self, key, version, render, *args):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and (entry[0] is version or entry[0] == version):
+                self._entries.move_to_end(key)
+                self.hits += 1
+                metrics.count("view_cache_hit")
+                return entry[1]
+            self.misses += 1
+        metrics.count("view_cache_miss")
+        view = render(*args)
+        with self._lock:
+            self._entries[key] = (version, view)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return view
+
+    # The cached view of key at version, or None; nothing is rendered, counted
+    # or reordered, so a full listing does not push the hot entries out
+    def peek(self, key, version):
+        entry = self._entries.get(key)
+        if entry is not None and (entry[0] is version or entry[0] == version):
+            return entry[1]
+        return None
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        return {"size": len(self._entries), "hits": self.hits, "misses": self.misses,
+                "evictions": self.evictions}
+
+
+prescription_views = ViewCache(maxsize=4096)
+label_views = ViewCache(maxsize=1024)
+
+
+def format_prescription(prescription):
+    lines = [f"Medication: {prescription['medication']}",
+             f"Dosage: {prescription['dosage']}",
+             f"Instructions: {prescription['instructions']}",
+             f"Refills: {prescription['refills']}"]
+    if 'sending_pharmacy' in prescription:
+        lines.append(f"Sending Pharmacy: {prescription['sending_pharmacy']}")
+    if 'fax_needed' in prescription:
+        lines.append(f"Fax Needed: {'Yes' if prescription['fax_needed'] else 'No'}")
+    if prescription.get('fax_needed') and 'telephone_number' in prescription:
+        lines.append(f"Telephone Number: {prescription['telephone_number']}")
+    return lines
+
+
+def prescription_text(prescription):
+    return "\n".join(format_prescription(prescription))
+
+
+def prescription_json(prescription):
+    return json.dumps(prescription, sort_keys=True)
+
+
+def render_prescription(prescription):
+    return {'text': prescription_text(prescription), 'json': prescription_json(prescription)}
+
+
+# Renderer per output format, for listings that need only one of them
+PRESCRIPTION_FORMATS = {'text': prescription_text, 'json': prescription_json}
+
+
+# Version stamp for a rendered label section. Index and disk cache hits build a
+# new label dict every time, so the stamp is the label's set_id and
+# effective_time (OpenFDA answers and the local index carry them), or failing
+# that the section's own text; never the whole label.
+def label_version(medication_info, items):
+    set_id = medication_info.get('set_id')
+    return (set_id, medication_info.get('effective_time')) if set_id else items
+
+
+def render_label_section(section, items):
+    heading, missing = LABEL_SECTION_TEXT[section]
+    lines = [heading, *(f"  - {item}" for item in items)] if items else [missing]
+    return {'text': "\n".join(lines),
+            'json': json.dumps({'section': section, 'heading': heading.strip(), 'items': items or None})}
+
+
+# Chatbot engine: everything the chatbot does, without input() or print().
+# Every method takes plain arguments and returns a dict with an 'ok' flag
+# (plus an 'error' code when it is False), so the CLI is a thin adapter and
+# scripted sessions can drive the engine in-process. The stores default to
+# the shared module-level ones.
+class WellBotEngine:
+    def __init__(self, store=None, users=None, numbers=None, inventory=None, delivery=None):
+        if store is None:
+            store = prescription_repository
+        elif not isinstance(store, PrescriptionRepository):
+            store = PrescriptionRepository(store)
+        self.store = store
+        self.users = users if users is not None else user_store
+        self.numbers = numbers if numbers is not None else prescription_numbers
+        self._inventory = inventory
+        self.delivery = delivery if delivery is not None else delivery_status
+
+    @property
+    def inventory(self):
+        return self._inventory if self._inventory is not None else get_inventory()
+
+    @staticmethod
+    def resolve(medication):
+        return get_name_index().resolve(medication) or medication
+
+    @staticmethod
+    def suggestions(medication):
+        return get_name_index().suggest(medication)
+
+    @metrics.timed("register")
+    def register(self, username, password):
+        if not self.users.register(username, password):
+            return {'ok': False, 'error': 'username_taken'}
+        return {'ok': True, 'username': username}
+
+    @metrics.timed("login")
+    def login(self, username, password):
+        if not self.users.verify(username, password):
+            return {'ok': False, 'error': 'invalid_credentials'}
+        return {'ok': True, 'username': username}
+
+    def prescription(self, prescription_number):
+        return self.store.get(prescription_number)
+
+    # Store a new prescription and hold a unit of stock when we carry the medication
+    @metrics.timed("order_prescription")
+    def order_prescription(self, medication, dosage, instructions, refills, fax_needed=False,
+                           telephone_number=None, sending_pharmacy='N/A', customer=None):
+        prescription_number = self.numbers.allocate()
+        prescription = {
+            'prescription_number': prescription_number,
+            'medication': medication,
+            'dosage': dosage,
+            'instructions': instructions,
+            'refills': refills,
+            'sending_pharmacy': sending_pharmacy,
+            'fax_needed': fax_needed,
+            'telephone_number': telephone_number,
+            'customer': customer,
+        }
+        medication_name = self.resolve(medication)
+        inventory = self.inventory
+        if medication_name in inventory:
+            prescription['reservation_id'] = inventory.reserve(medication_name)
+        self.store.put(prescription_number, prescription)
+        # Add a default delivery status for the new prescription
+        self.delivery[prescription_number] = 'Pending'
+        return {'ok': True, 'prescription_number': prescription_number, 'prescription': prescription}
+
+    # Incoming transfer; a fax from the sending pharmacy is always needed
+    @metrics.timed("transfer_prescription")
+    def transfer_prescription(self, sending_pharmacy, telephone_number, details=None, customer=None):
+        medication, dosage, instructions, refills = details or random_prescription_data()
+        return self.order_prescription(medication, dosage, instructions, refills, True,
+                                       telephone_number, sending_pharmacy, customer)
+
+    @metrics.timed("drug_price")
+    def drug_price(self, medication, category, medication_type, rebate=False):
+        price = get_drug_price(medication, category, medication_type, rebate)
+        if price is None:
+            return {'ok': False, 'error': 'not_priced', 'suggestions': self.suggestions(medication)}
+        return {'ok': True, 'medication': medication, 'category': category,
+                'medication_type': medication_type, 'rebate': rebate, 'price': price}
+
+    @metrics.timed("refill")
+    def refill(self, prescription_number, customer):
+        prescription = self.store.get(prescription_number)
+        if prescription is None:
+            return {'ok': False, 'error': 'unknown_prescription'}
+        medication_name = self.resolve(prescription['medication'])
+        inventory = self.inventory
+        # The unit held when the prescription was submitted ships first; once it is
+        # used (or its hold expired) every refill takes a unit of its own
+        held = prescription.get('reservation_id')
+        if held is not None:
+            prescription = {field: value for field, value in prescription.items() if field != 'reservation_id'}
+            self.store.put(prescription_number, prescription)
+        if held is None or not inventory.commit(held):
+            if medication_name in inventory:
+                reservation_id = inventory.reserve(medication_name)
+                if reservation_id is None:
+                    return {'ok': False, 'error': 'out_of_stock', 'medication': medication_name}
+                inventory.commit(reservation_id)
+        order = {
+            "prescription_number": prescription_number,
+            "customer": customer,
+            "medicine": prescription
+        }
+        return {'ok': True, 'order': order}
+
+    # Stock level of a medication, with same-class alternatives when it is out of stock
+    @metrics.timed("check_stock")
+    def check_stock(self, medication):
+        medication_name = self.resolve(medication)
+        available = self.inventory.available(medication_name)
+        if available is None:
+            return {'ok': False, 'error': 'not_stocked', 'medication': medication_name,
+                    'suggestions': self.suggestions(medication_name)}
+        result = {'ok': True, 'medication': medication_name, 'available': available}
+        if available <= 0:
+            alternatives_index = get_alternatives_index()
+            result['therapeutic_class'] = alternatives_index.therapeutic_class(medication_name)
+            result['alternatives'] = alternatives_index.recommend(medication_name)
+        return result
+
+    @metrics.timed("order_status")
+    def order_status(self, prescription_number):
+        prescription = self.store.get(prescription_number)
+        if prescription is None:
+            return {'ok': False, 'error': 'unknown_prescription'}
+        status = self.delivery.get(prescription_number, "Pending Delivery")
+        return {'ok': True, 'prescription_number': prescription_number, 'status': status,
+                'prescription': prescription, 'needs_assistance': status in ASSISTANCE_STATUSES}
+
+    @metrics.timed("update_delivery_status")
+    def update_delivery_status(self, prescription_number, status):
+        if prescription_number not in self.store:
+            return {'ok': False, 'error': 'unknown_prescription'}
+        self.delivery[prescription_number] = status
+        return {'ok': True, 'prescription_number': prescription_number, 'status': status}
+
+    # Prescription numbers by customer, medication, sending pharmacy and/or fax_needed
+    @metrics.timed("find_prescriptions")
+    def find_prescriptions(self, **criteria):
+        try:
+            prescription_numbers = self.store.find(**criteria)
+        except ValueError:
+            return {'ok': False, 'error': 'unknown_field', 'fields': list(PrescriptionRepository.INDEXED_FIELDS)}
+        return {'ok': True, 'criteria': criteria, 'prescription_numbers': prescription_numbers}
+
+    # Pre-rendered text and JSON for one prescription, re-rendered only after it changes
+    @metrics.timed("prescription_view")
+    def prescription_view(self, prescription_number):
+        prescription, version = self.store.get_versioned(prescription_number)
+        if prescription is None:
+            return {'ok': False, 'error': 'unknown_prescription'}
+        view = prescription_views.get(prescription_number, version, render_prescription, prescription)
+        return {'ok': True, 'prescription_number': prescription_number, **view}
+
+    # One page of prescriptions in number order, rendered in output_format
+    # ('text' or 'json') and optionally filtered like find_prescriptions; pass
+    # 'next' back as after for the following page ('next' is None on the last one).
+    # Views already cached are reused, the rest are rendered without caching.
+    @metrics.timed("list_prescriptions")
+    def list_prescriptions(self, after=None, limit=LISTING_PAGE_SIZE, output_format='text', **criteria):
+        try:
+            rows, following = self.store.page(after, limit, **criteria)
+        except ValueError:
+            return {'ok': False, 'error': 'unknown_field', 'fields': list(PrescriptionRepository.INDEXED_FIELDS)}
+        render = PRESCRIPTION_FORMATS[output_format]
+        prescriptions = []
+        for prescription_number, prescription, version in rows:
+            view = prescription_views.peek(prescription_number, version)
+            prescriptions.append({'prescription_number': prescription_number,
+                                  output_format: view[output_format] if view else render(prescription)})
+        return {'ok': True, 'prescriptions': prescriptions, 'next': following}
+
+    # Orders currently in a delivery status (e.g. every 'On Hold' order), from the status index
+    @metrics.timed("orders_with_status")
+    def orders_with_status(self, status):
+        return {'ok': True, 'status': status, 'prescription_numbers': self.delivery.with_status(status)}
+
+    # Label sections for a medication; a section is None when OpenFDA has no text for it
+    @metrics.timed("drug_info")
+    def drug_info(self, medication_name):
+        medication_info = fetch_medication_info(medication_name)
+        if not medication_info:
+            return {'ok': False, 'error': 'not_found', 'suggestions': self.suggestions(medication_name)}
+        openfda = medication_info.get('openfda', {})
+        result = {
+            'ok': True,
+            'brand_name': (openfda.get('brand_name') or [medication_name])[0],
+            'manufacturer': (openfda.get('manufacturer_name') or ['Unknown'])[0],
+        }
+        for section, field in LABEL_SECTIONS.items():
+            result[section] = medication_info.get(field)
+        return result
+
+    # Pre-rendered text and JSON for one LABEL_SECTIONS section of a medication's label
+    @metrics.timed("label_section")
+    def label_section(self, medication_name, section):
+        medication_info = fetch_medication_info(medication_name)
+        if not medication_info:
+            return {'ok': False, 'error': 'not_found', 'suggestions': self.suggestions(medication_name)}
+        key = (" ".join(medication_name.lower().split()), section)
+        items = medication_info.get(LABEL_SECTIONS[section])
+        view = label_views.get(key, label_version(medication_info, items), render_label_section, section, items)
+        return {'ok': True, 'section': section, **view}
+
+    # Record a rating and/or a free-text review; reviews are scored with VADER
+    @metrics.timed("submit_feedback")
+    def submit_feedback(self, rating=None, review=None, username=None):
+        result = {'ok': True}
+        if rating is not None:
+            store_rating(rating, username)
+            result['rating'] = rating
+        if review is not None:
+            sentiment = analyze_sentiment(review)
+            store_improvement(review, sentiment, username)
+            result['sentiment'] = sentiment
+        return result
+
+    @staticmethod
+    def support_contact():
+        return dict(PHARMACY_SUPPORT)
+
+    # Flush the prescription and user logs (waits for a running compaction)
+    def close(self):
+        self.store.close()
+        self.users.store.close()
+        if hasattr(self.delivery, "close"):
+            self.delivery.close()
+
+
+wellbot_engine = WellBotEngine()
+
+# Engine with its own connections to the users and prescriptions database, for
+# a worker process started by fork. Inventory, prescription numbers and
+# the delivery tracker (which tails its event log) are already safe to share
+# between processes.
+def shared_engine(db_path=SHARED_DB_PATH, inventory=None, delivery=None):
+    return WellBotEngine(store=SQLiteStore(db_path, "prescriptions"),
+                         users=UserStore(store=SQLiteStore(db_path, "users")),
+                         inventory=inventory,
+                         delivery=delivery if delivery is not None else DeliveryTracker())
+
+
+# Bulk import of incoming transfers (a sending pharmacy's export, CSV with a
+# header row or NDJSON). Columns: medication, dosage, instructions, refills,
+# and optionally sending_pharmacy, telephone_number, customer.
+# Rows are validated and normalized in chunks on a process pool, then every
+# batch_size rows get one block of prescription numbers and one store write.
+# Only the chunks in flight and the current batch are held in memory.
+#
+# Progress goes to a checkpoint file (default <file>.checkpoint). Before a
+# batch is written, the checkpoint records the numbers leased for it. An
+# interrupted import resumes at the first unfinished batch and rewrites it
+# under the same numbers, so each row is imported exactly once. Rejected rows
+# go to <file>.rejected.ndjson with their row number and the reason.
+
+DOSAGE_UNITS = r"mcg|mg|g|ml|l|iu|units?|%"
+DOSAGE_PATTERN = re.compile(rf"(\d+(?:\.\d+)?)\s*({DOSAGE_UNITS})(?:\s*/\s*(\d+(?:\.\d+)?)?\s*({DOSAGE_UNITS}))?",
+                            re.IGNORECASE)
+TRANSFER_FIELDS = ('medication', 'dosage', 'instructions', 'refills', 'sending_pharmacy', 'telephone_number',
+                   'customer')
+
+
+# "500 MG" -> "500mg", "10 mg / 5 mL" -> "10mg/5ml"; None when it is not a dose
+def parse_dosage(text):
+    match = DOSAGE_PATTERN.fullmatch(text.strip())
+    if match is None:
+        return None
+    amount, unit, per_amount, per_unit = match.groups()
+    dosage = f"{amount}{unit.lower()}"
+    if per_unit:
+        dosage += f"/{per_amount or ''}{per_unit.lower()}"
+    return dosage
+
+
+# Catalog name for a medication: exact name or alias, else a single-typo match,
+# else the name as given (the catalog does not list every drug we fill)
+def resolve_transfer_medication(name, name_index):
+    resolved = name_index.resolve(name)
+    if resolved is not None:
+        return resolved
+    for suggestion in name_index.suggest(name, k=1):
+        if edit_distance(name_index.normalize(name), name_index.normalize(suggestion), 1) <= 1:
+            return suggestion
+    return " ".join(name.split())
+
+
+_transfer_names = (None, {})
+
+# resolve_transfer_medication over the shared name index, remembering answers:
+# an export repeats the same few thousand medication names
+def transfer_medication_resolver():
+    global _transfer_names
+    name_index = get_name_index()
+    if _transfer_names[0] is not name_index:
+        _transfer_names = (name_index, {})
+    resolved = _transfer_names[1]
+
+    def resolve(name):
+        canonical = resolved.get(name)
+        if canonical is None:
+            canonical = resolved[name] = resolve_transfer_medication(name, name_index)
+        return canonical
+    return resolve
+
+
+# One import row (dict) -> (prescription, None) or (None, reason).
+# resolve maps a medication name to its catalog name (transfer_medication_resolver()).
+def normalize_transfer(row, resolve, default_pharmacy=None):
+    medication = (row.get('medication') or '').strip()
+    if not medication:
+        return None, "missing medication"
+    dosage = parse_dosage(str(row.get('dosage') or ''))
+    if dosage is None:
+        return None, f"unreadable dosage {row.get('dosage')!r}"
+    try:
+        refills = float(row.get('refills') or 0)
+    except (TypeError, ValueError):
+        return None, f"refills is not a number: {row.get('refills')!r}"
+    if refills < 0 or not refills.is_integer():
+        return None, f"refills must be a whole number >= 0: {row.get('refills')!r}"
+    sending_pharmacy = (row.get('sending_pharmacy') or default_pharmacy or '').strip()
+    if not sending_pharmacy:
+        return None, "missing sending pharmacy"
+    return {
+        'medication': resolve(medication),
+        'dosage': dosage,
+        'instructions': (row.get('instructions') or '').strip(),
+        'refills': int(refills),
+        'sending_pharmacy': sending_pharmacy,
+        'fax_needed': True,
+        'telephone_number': (row.get('telephone_number') or '').strip() or None,
+        'customer': (row.get('customer') or '').strip() or None,
+    }, None
+
+
+# Pool worker: (row number, raw row) pairs -> (row number, prescription, reason).
+# A raw row is a dict (CSV) or a JSON line (NDJSON).
+def _normalize_transfer_chunk(rows, default_pharmacy=None):
+    resolve = transfer_medication_resolver()
+    results = []
+    for row_number, row in rows:
+        if isinstance(row, str):
+            try:
+                row = json.loads(row)
+            except json.JSONDecodeError as exc:
+                results.append((row_number, None, f"invalid JSON: {exc.msg}"))
+                continue
+            if not isinstance(row, dict):
+                results.append((row_number, None, "not a JSON object"))
+                continue
+        prescription, reason = normalize_transfer(row, resolve, default_pharmacy)
+        results.append((row_number, prescription, reason))
+    return results
+
+
+# (row number, raw row) for every row of a transfer file, numbered from 1
+def iter_transfer_rows(path):
+    import csv
+    with open(path, newline="", encoding="utf-8") as f:
+        if path.endswith((".ndjson", ".jsonl")):
+            for row_number, line in enumerate(f, 1):
+                yield row_number, line
+        else:
+            reader = csv.reader(f)
+            header = [name.strip().lower() for name in next(reader, [])]
+            for row_number, row in enumerate(reader, 1):
+                yield row_number, dict(zip(header, row))
+
+
+def import_transfers(path, store=None, numbers=None, processes=None, batch_size=50_000, chunksize=2000,
+                     default_pharmacy=None, checkpoint_path=None):
+    store = store if store is not None else prescription_repository
+    numbers = numbers if numbers is not None else prescription_numbers
+    checkpoint_path = checkpoint_path or f"{path}.checkpoint"
+    source_size = os.path.getsize(path)
+    try:
+        with open(checkpoint_path) as f:
+            checkpoint = json.load(f)
+    except FileNotFoundError:
+        checkpoint = {'source_size': source_size, 'batch_size': batch_size,
+                      'rows': 0, 'imported': 0, 'rejected': 0, 'pending': None}
+    if checkpoint['source_size'] != source_size:
+        raise ValueError(f"{path} changed since {checkpoint_path} was written; delete the checkpoint to start over")
+    # A resumed import keeps its batch boundaries, so a pending batch lines up again
+    batch_size = checkpoint['batch_size']
+    done_rows = checkpoint['rows']
+    # Fork the workers with the name index already built
+    get_name_index()
+
+    rows = itertools.islice(iter_transfer_rows(path), done_rows, None)
+    normalize = functools.partial(_normalize_transfer_chunk, default_pharmacy=default_pharmacy)
+    results = itertools.chain.from_iterable(map_chunks(normalize, rows, processes, chunksize))
+    start = time.perf_counter()
+    seen = 0
+    with open(f"{path}.rejected.ndjson", "a") as rejected_log:
+        # Rejections written for a batch that never finished are dropped, since
+        # that batch is validated again below
+        if checkpoint.get('rejected_offset') is None:
+            checkpoint['rejected_offset'] = rejected_log.tell()
+        else:
+            rejected_log.truncate(checkpoint['rejected_offset'])
+        while True:
+            batch = list(itertools.islice(results, batch_size))
+            if not batch:
+                break
+            valid = [prescription for _, prescription, _ in batch if prescription is not None]
+            last_row = batch[-1][0]
+            pending = checkpoint['pending']
+            if pending is not None and pending['rows'] == last_row and pending['count'] == len(valid):
+                first = pending['first']
+            else:
+                first = numbers.lease(len(valid)) if valid else 0
+                checkpoint['pending'] = {'rows': last_row, 'first': first, 'count': len(valid)}
+                write_json_atomic(checkpoint_path, checkpoint)
+            items = {}
+            for number, prescription in enumerate(valid, first):
+                prescription_number = numbers.format(number)
+                items[prescription_number] = {'prescription_number': prescription_number, **prescription}
+            with metrics.timer("transfer_import_batch"):
+                store.put_many(items)
+            for row_number, prescription, reason in batch:
+                if prescription is None:
+                    rejected_log.write(json.dumps({'row': row_number, 'reason': reason}) + "\n")
+            rejected_log.flush()
+            checkpoint.update(rows=last_row, imported=checkpoint['imported'] + len(valid),
+                              rejected=checkpoint['rejected'] + len(batch) - len(valid), pending=None,
+                              rejected_offset=rejected_log.tell())
+            write_json_atomic(checkpoint_path, checkpoint)
+            seen += len(batch)
+    elapsed = time.perf_counter() - start
+    return {'rows': checkpoint['rows'], 'imported': checkpoint['imported'], 'rejected': checkpoint['rejected'],
+            'resumed_from': done_rows, 'rows_this_run': seen, 'seconds': elapsed}
+
+
+# OpenFDA drug label endpoint (point WELLBOT_OPENFDA_URL at a local stand-in for testing)
+OPENFDA_LABEL_URL = os.environ.get("WELLBOT_OPENFDA_URL", "https://api.fda.gov/drug/label.json")
+OPENFDA_TIMEOUT = 10
+
+# Sentinel for cache lookups, so a cached "not found" (None) is still a hit
+CACHE_MISS = object()
+
+
+# In-process LRU cache with a per-entry time to live
+class TTLCache:
+    def __init__(self, maxsize=512, ttl=3600):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return CACHE_MISS
+            value, expires = entry
+            if expires < time.monotonic():
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return CACHE_MISS
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, ttl=None):
+        expires = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._entries[key] = (value, expires)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        return {"size": len(self._entries), "hits": self.hits, "misses": self.misses,
+                "evictions": self.evictions, "expirations": self.expirations}
+
+
+# Persistent cache tier in SQLite so drug labels survive restarts
+class DiskCache:
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value TEXT, expires REAL)")
+        self._db.commit()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            row = self._db.execute("SELECT value, expires FROM cache WHERE key = ?", (key,)).fetchone()
+            if row is None or row[1] < time.time():
+                self.misses += 1
+                return CACHE_MISS
+            self.hits += 1
+            return json.loads(row[0])
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO cache VALUES (?, ?, ?)",
+                             (key, json.dumps(value), time.time() + ttl))
+            self._db.commit()
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses}
+
+
+# Two-tier cache for OpenFDA label lookups keyed by normalized brand name.
+# "Not found" answers are cached too, for a shorter time.
+class MedicationInfoCache:
+    def __init__(self, maxsize=512, ttl=24 * 3600, negative_ttl=3600, disk_path=None):
+        self.memory = TTLCache(maxsize, ttl)
+        self.disk_path = disk_path
+        self._disk = None
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+
+    # The SQLite tier is opened on first use, not at import
+    @property
+    def disk(self):
+        if self._disk is None and self.disk_path:
+            self._disk = DiskCache(self.disk_path)
+        return self._disk
+
+    @staticmethod
+    def normalize(medication_name):
+        return " ".join(medication_name.lower().split())
+
+    def get(self, medication_name):
+        key = self.normalize(medication_name)
+        value = self.memory.get(key)
+        if value is CACHE_MISS and self.disk is not None:
+            value = self.disk.get(key)
+            if value is not CACHE_MISS:
+                self.memory.set(key, value, self.ttl if value is not None else self.negative_ttl)
+        return value
+
+    def set(self, medication_name, medication_info):
+        key = self.normalize(medication_name)
+        ttl = self.ttl if medication_info is not None else self.negative_ttl
+        self.memory.set(key, medication_info, ttl)
+        if self.disk is not None:
+            self.disk.set(key, medication_info, ttl)
+
+    def stats(self):
+        stats = {"memory": self.memory.stats()}
+        if self.disk is not None:
+            stats["disk"] = self.disk.stats()
+        return stats
+
+
+# WELLBOT_LABEL_CACHE sets the on-disk cache file; an empty value keeps the cache in memory only
+medication_info_cache = MedicationInfoCache(disk_path=os.environ.get("WELLBOT_LABEL_CACHE", "label_cache.db"))
+
+OPENFDA_RETRIES = 3
+OPENFDA_BACKOFF = 0.5
+OPENFDA_MAX_CONCURRENCY = 4
+
+# HTTP session with a connection pool sized for the OpenFDA concurrency cap
+def create_http_session(pool_size=OPENFDA_MAX_CONCURRENCY):
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+_http_session = None
+
+# Shared HTTP session so OpenFDA calls reuse pooled connections
+def get_http_session():
+    global _http_session
+    if _http_session is None:
+        _http_session = create_http_session()
+    return _http_session
+
+# Query OpenFDA for one drug label.
+# Returns the label, or None when OpenFDA has no match (404 or no results), the
+# only answer that is cached as "not found". Rate limiting (429), server errors
+# and network failures are retried with exponential backoff and re-raised as
+# requests.RequestException once the retries run out; any other error status
+# (400, 401, 403, ...) is raised right away.
+@metrics.timed("openfda_request")
+def request_medication_label(medication_name, session=None, timeout=OPENFDA_TIMEOUT,
+                             retries=OPENFDA_RETRIES, backoff=OPENFDA_BACKOFF):
+    session = session or get_http_session()
+    params = {"search": f'openfda.brand_name:"{medication_name}"', "limit": 1}
+    for attempt in range(retries + 1):
+        try:
+            response = session.get(OPENFDA_LABEL_URL, params=params, timeout=timeout)
+            if response.status_code == 429 or response.status_code >= 500:
+                response.raise_for_status()
+        except requests.RequestException:
+            if attempt == retries:
+                metrics.count("openfda_failure")
+                raise
+            metrics.count("openfda_retry")
+            time.sleep(backoff * 2 ** attempt)
+            continue
+
+        if response.status_code == 200:
+            data = response.json()
+            if "results" in data and data["results"]:
+                return data["results"][0]
+            return None
+        # OpenFDA answers 404 when nothing matches
+        if response.status_code == 404:
+            return None
+        metrics.count("openfda_failure")
+        response.raise_for_status()
+        raise requests.HTTPError(f"Unexpected OpenFDA response {response.status_code}", response=response)
+
+# Label fields kept in the local index (the rest of each OpenFDA record is dropped)
+LABEL_FIELDS = ("set_id", "effective_time", "openfda", "dosage_and_administration", "warnings",
+                "indications_and_usage", "drug_interactions")
+LABEL_OPENFDA_FIELDS = ("brand_name", "generic_name", "manufacturer_name")
+LABEL_TEXT_FIELDS = ("indications_and_usage", "warnings", "drug_interactions")
+
+# Stream the records of an OpenFDA drug/label bulk download (.json or .json.zip)
+# one at a time. Only the current record and one read chunk are held in memory.
+def iter_label_records(path, chunk_size=1 << 20):
+    if zipfile.is_zipfile(path):
+        with zipfile.ZipFile(path) as archive:
+            for member in archive.namelist():
+                if member.endswith(".json"):
+                    with archive.open(member) as raw:
+                        yield from _iter_results(io.TextIOWrapper(raw, encoding="utf-8"), chunk_size)
+    else:
+        with open(path, "r", encoding="utf-8") as f:
+            yield from _iter_results(f, chunk_size)
+
+def _iter_results(f, chunk_size):
+    decoder = json.JSONDecoder()
+    buffer = ""
+    pos = 0
+    eof = False
+
+    # Make sure buffer[pos] is the next non-whitespace character (or we hit EOF)
+    def fill():
+        nonlocal buffer, pos, eof
+        while True:
+            while pos < len(buffer) and buffer[pos] in " \t\r\n":
+                pos += 1
+            if pos < len(buffer) or eof:
+                return
+            chunk = f.read(chunk_size)
+            buffer = buffer[pos:] + chunk
+            pos = 0
+            eof = not chunk
+
+    # Decode one complete JSON value starting at pos, reading more input as needed
+    def decode():
+        nonlocal buffer, pos, eof
+        while True:
+            fill()
+            try:
+                value, end = decoder.raw_decode(buffer, pos)
+                if end < len(buffer) or eof:
+                    pos = end
+                    return value
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+            chunk = f.read(chunk_size)
+            buffer = buffer[pos:] + chunk
+            pos = 0
+            eof = not chunk
+
+    def expect(char):
+        nonlocal pos
+        fill()
+        if buffer[pos:pos + 1] != char:
+            raise ValueError(f"Malformed label dump: expected {char!r} at {buffer[pos:pos + 20]!r}")
+        pos += 1
+
+    expect("{")
+    while True:
+        fill()
+        if buffer[pos:pos + 1] == "}":
+            return
+        key = decode()
+        expect(":")
+        if key != "results":
+            decode()  # meta and other small top-level values
+        else:
+            expect("[")
+            fill()
+            if buffer[pos:pos + 1] == "]":
+                pos += 1
+            else:
+                while True:
+                    yield decode()
+                    fill()
+                    if buffer[pos:pos + 1] == "]":
+                        pos += 1
+                        break
+                    expect(",")
+        fill()
+        if buffer[pos:pos + 1] == ",":
+            pos += 1
+
+
+# Local drug label index in SQLite, built from the OpenFDA bulk download.
+# Exact brand/generic lookups go through an indexed names table and free-text
+# search over names, indications, warnings and interactions through FTS5.
+# A label is kept once per set_id: importing a newer dump replaces the older
+# version of each label (by effective_time) instead of adding a second copy.
+class LabelIndex:
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS labels (id INTEGER PRIMARY KEY, record TEXT);
+            CREATE TABLE IF NOT EXISTS names (name TEXT, kind INTEGER, label_id INTEGER);
+            CREATE INDEX IF NOT EXISTS names_by_name ON names (name, kind);
+            CREATE INDEX IF NOT EXISTS names_by_label ON names (label_id);
+            CREATE VIRTUAL TABLE IF NOT EXISTS labels_fts USING fts5(
+                brand_name, generic_name, indications_and_usage, warnings, drug_interactions,
+                content='');
+        """)
+        # Indexes built before labels were keyed by set_id get the new columns
+        columns = {row[1] for row in self._db.execute("PRAGMA table_info(labels)")}
+        with self._db:
+            if "set_id" not in columns:
+                self._db.execute("ALTER TABLE labels ADD COLUMN set_id TEXT")
+                self._db.execute("ALTER TABLE labels ADD COLUMN effective_time TEXT")
+            self._db.execute("CREATE UNIQUE INDEX IF NOT EXISTS labels_by_set_id ON labels (set_id)")
+
+    @staticmethod
+    def _joined(values):
+        return " ".join(values) if isinstance(values, list) else (values or "")
+
+    # labels_fts column values for a kept record
+    def _fts_values(self, kept):
+        openfda = kept.get("openfda", {})
+        return (self._joined(openfda.get("brand_name")), self._joined(openfda.get("generic_name")),
+                *(self._joined(kept.get(field)) for field in LABEL_TEXT_FIELDS))
+
+    # Load labels in large transactions; returns the number of records imported
+    def import_records(self, records, batch_size=1000):
+        imported = 0
+        batch = []
+        for record in records:
+            batch.append(record)
+            if len(batch) >= batch_size:
+                imported += self._insert(batch)
+                batch = []
+        if batch:
+            imported += self._insert(batch)
+        return imported
+
+    def _insert(self, records):
+        db = self._db
+        with self._lock, db:
+            for record in records:
+                openfda = record.get("openfda", {})
+                kept = {field: record[field] for field in LABEL_FIELDS if field in record}
+                kept["openfda"] = {field: openfda[field] for field in LABEL_OPENFDA_FIELDS if field in openfda}
+                set_id = record.get("set_id") or record.get("id")
+                effective_time = str(record.get("effective_time") or "")
+                existing = set_id and db.execute("SELECT id, record, effective_time FROM labels WHERE set_id = ?",
+                                                 (set_id,)).fetchone()
+                if existing:
+                    label_id, previous, previous_time = existing
+                    if effective_time < (previous_time or ""):
+                        continue
+                    # Contentless FTS5 rows are deleted by repeating the indexed values
+                    db.execute("INSERT INTO labels_fts (labels_fts, rowid, brand_name, generic_name,"
+                               " indications_and_usage, warnings, drug_interactions)"
+                               " VALUES ('delete', ?, ?, ?, ?, ?, ?)",
+                               (label_id, *self._fts_values(json.loads(previous))))
+                    db.execute("DELETE FROM names WHERE label_id = ?", (label_id,))
+                    db.execute("UPDATE labels SET record = ?, effective_time = ? WHERE id = ?",
+                               (json.dumps(kept), effective_time, label_id))
+                else:
+                    label_id = db.execute("INSERT INTO labels (record, set_id, effective_time) VALUES (?, ?, ?)",
+                                          (json.dumps(kept), set_id, effective_time)).lastrowid
+                names = [(name.lower(), 0, label_id) for name in openfda.get("brand_name", [])]
+                names += [(name.lower(), 1, label_id) for name in openfda.get("generic_name", [])]
+                db.executemany("INSERT INTO names VALUES (?, ?, ?)", names)
+                db.execute(
+                    "INSERT INTO labels_fts (rowid, brand_name, generic_name, indications_and_usage,"
+                    " warnings, drug_interactions) VALUES (?, ?, ?, ?, ?, ?)",
+                    (label_id, *self._fts_values(kept)))
+        return len(records)
+
+    # Label for an exact brand name, falling back to an exact generic name
+    def lookup(self, medication_name):
+        with self._lock:
+            row = self._db.execute(
+                "SELECT labels.record FROM names JOIN labels ON labels.id = names.label_id"
+                " WHERE names.name = ? ORDER BY names.kind LIMIT 1",
+                (MedicationInfoCache.normalize(medication_name),)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    # Full-text search; returns up to limit matching labels, best match first
+    def search(self, query, limit=10):
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT labels.record FROM labels_fts JOIN labels ON labels.id = labels_fts.rowid"
+                " WHERE labels_fts MATCH ? ORDER BY rank LIMIT ?", (query, limit)).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    # Exact name lookup, falling back to the best full-text match of the name as a
+    # phrase in the brand or generic names (like OpenFDA's openfda.brand_name:"..."
+    # search, so "tylenol" finds "Tylenol Extra Strength")
+    def find(self, medication_name):
+        medication_info = self.lookup(medication_name)
+        if medication_info is not None:
+            return medication_info
+        phrase = MedicationInfoCache.normalize(medication_name).replace('"', '""')
+        if not phrase:
+            return None
+        try:
+            matches = self.search(f'{{brand_name generic_name}} : "{phrase}"', limit=1)
+        except sqlite3.OperationalError:
+            return None
+        return matches[0] if matches else None
+
+    def close(self):
+        self._db.close()
+
+
+# Local label index file (built with --import-labels); WELLBOT_LABEL_INDEX overrides the path
+LABEL_INDEX_PATH = os.environ.get("WELLBOT_LABEL_INDEX", "drug_labels.db")
+_label_index = None
+
+# Open the local label index if it has been built, otherwise None
+def get_label_index():
+    global _label_index
+    if _label_index is None and os.path.exists(LABEL_INDEX_PATH):
+        _label_index = LabelIndex(LABEL_INDEX_PATH)
+    return _label_index
+
+# Build or extend the local label index from OpenFDA bulk download files
+def import_label_dumps(paths, index_path=None):
+    index = LabelIndex(index_path or LABEL_INDEX_PATH)
+    total = 0
+    start = time.perf_counter()
+    for path in paths:
+        count = index.import_records(iter_label_records(path))
+        total += count
+        print(f"Imported {count} labels from {path}")
+    elapsed = time.perf_counter() - start
+    print(f"Imported {total} labels in {elapsed:.1f}s ({total / max(elapsed, 1e-9):.0f} labels/sec)")
+    index.close()
+    return total
+
+# Labels fetched ahead of the dialog step running on this thread, by normalized
+# name: the chat server looks them up on the event loop first (see
+# ChatServer._prefetch_label) and the step takes that outcome, a failed fetch
+# included, instead of going upstream a second time
+_step_labels = threading.local()
+
+@contextlib.contextmanager
+def prefetched_labels(labels):
+    _step_labels.labels = labels
+    try:
+        yield
+    finally:
+        _step_labels.labels = None
+
+# Look up a drug label: cache first, then the local label index, then OpenFDA
+@metrics.timed("medication_info")
+def fetch_medication_info(medication_name):
+    labels = getattr(_step_labels, "labels", None)
+    if labels:
+        key = MedicationInfoCache.normalize(medication_name)
+        if key in labels:
+            return labels[key]
+    medication_info = medication_info_cache.get(medication_name)
+    if medication_info is not CACHE_MISS:
+        metrics.count("label_cache_hit")
+        return medication_info
+
+    label_index = get_label_index()
+    if label_index is not None:
+        medication_info = label_index.find(medication_name)
+        if medication_info is not None:
+            metrics.count("label_index_hit")
+            return medication_info
+
+    try:
+        medication_info = request_medication_label(medication_name)
+    except requests.RequestException:
+        return None
+    medication_info_cache.set(medication_name, medication_info)
+    return medication_info
+
+
+# asyncio front end to OpenFDA for the server (ChatServer fetches the label a
+# dialog step is about to read through it) and batch lookups.
+# Upstream calls run on a pooled requests session in a small thread pool,
+# a semaphore caps how many are in flight, and concurrent lookups of the
+# same drug share one upstream request. Results go through the same cache as
+# fetch_medication_info.
+class AsyncOpenFDAClient:
+    def __init__(self, max_concurrency=OPENFDA_MAX_CONCURRENCY, timeout=OPENFDA_TIMEOUT,
+                 retries=OPENFDA_RETRIES, backoff=OPENFDA_BACKOFF, cache=None):
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.cache = cache or medication_info_cache
+        from concurrent.futures import ThreadPoolExecutor
+
+        self.session = create_http_session(max_concurrency)
+        self.upstream_calls = 0
+        self._executor = ThreadPoolExecutor(max_concurrency, thread_name_prefix="openfda")
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._inflight = {}
+
+    async def fetch(self, medication_name):
+        medication_info = self.cache.get(medication_name)
+        if medication_info is not CACHE_MISS:
+            return medication_info
+
+        label_index = get_label_index()
+        if label_index is not None:
+            medication_info = label_index.find(medication_name)
+            if medication_info is not None:
+                return medication_info
+
+        key = MedicationInfoCache.normalize(medication_name)
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._fetch_upstream(medication_name))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        try:
+            return await asyncio.shield(task)
+        except requests.RequestException:
+            return None
+
+    async def _fetch_upstream(self, medication_name):
+        async with self._semaphore:
+            self.upstream_calls += 1
+            loop = asyncio.get_running_loop()
+            medication_info = await loop.run_in_executor(
+                self._executor, request_medication_label, medication_name,
+                self.session, self.timeout, self.retries, self.backoff)
+        self.cache.set(medication_name, medication_info)
+        return medication_info
+
+    async def fetch_many(self, medication_names):
+        return await asyncio.gather(*(self.fetch(name) for name in medication_names))
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+        self.session.close()
+
+_sentiment_analyzer = None
+_sentiment_analyzer_lock = threading.Lock()
+
+# One VADER analyzer per process, created on first use (loading the lexicon is the expensive part)
+def get_sentiment_analyzer():
+    global _sentiment_analyzer
+    if _sentiment_analyzer is None:
+        with _sentiment_analyzer_lock:
+            if _sentiment_analyzer is None:
+                import nltk
+                from nltk.sentiment.vader import SentimentIntensityAnalyzer
+                if NLTK_DATA_DIR not in nltk.data.path:
+                    nltk.data.path.insert(0, NLTK_DATA_DIR)
+                # Resolve the lexicon locally; only a machine that has never had it downloads it
+                try:
+                    nltk.data.find("sentiment/vader_lexicon.zip")
+                except LookupError:
+                    nltk.download("vader_lexicon", download_dir=NLTK_DATA_DIR, quiet=True)
+                _sentiment_analyzer = SentimentIntensityAnalyzer()
+    return _sentiment_analyzer
+
+# Categorize sentiment based on compound score
+def sentiment_label(compound):
+    if compound >= 0.05:
+        return "Positive"
+    elif compound <= -0.05:
+        return "Negative"
+    else:
+        return "Neutral"
+
+# Sentiment Analysis using VADER (repeated texts are answered from an LRU cache,
+# so the sentiment_score timer only sees texts that were actually scored)
+@functools.lru_cache(maxsize=8192)
+@metrics.timed("sentiment_score")
+def analyze_sentiment(feedback):
+    return sentiment_label(get_sentiment_analyzer().polarity_scores(feedback)['compound'])
+
+def _analyze_chunk(reviews):
+    return [analyze_sentiment(review) for review in reviews]
+
+# Label a list or stream of reviews, in order. With processes > 1 the reviews
+# are scored in chunks across a process pool (worth it for large backlogs).
+def analyze_sentiments(reviews, processes=None, chunksize=2000):
+    if not processes or processes <= 1:
+        for review in reviews:
+            yield analyze_sentiment(review)
+        return
+    for labels in map_chunks(_analyze_chunk, reviews, processes, chunksize):
+        yield from labels
+
+
+# Feedback logs: newline-delimited JSON, one record per submission
+IMPROVEMENTS_LOG = "improvements.ndjson"
+RATINGS_LOG = "ratings.ndjson"
+
+_feedback_logs = {}
+
+# Append-only feedback log; a legacy JSON array file is carried over the first time
+def get_feedback_log(path, legacy_path):
+    log = _feedback_logs.get(path)
+    if log is None:
+        log = AppendLog(path)
+        if not os.path.exists(path) and os.path.exists(legacy_path):
+            try:
+                with open(legacy_path, "r") as f:
+                    legacy = json.load(f)
+            except json.JSONDecodeError:
+                legacy = []
+            records = []
+            for item in legacy:
+                record = {"timestamp": None, "username": None}
+                record.update(item if isinstance(item, dict) else {"rating": item})
+                records.append(record)
+            log.append_many(records)
+        _feedback_logs[path] = log
+    return log
+
+def store_improvement(suggestion, sentiment, username=None):
+    get_feedback_log(IMPROVEMENTS_LOG, "improvements.json").append(
+        {"timestamp": time.time(), "username": username, "suggestion": suggestion, "sentiment": sentiment})
+
+def store_rating(rating, username=None):
+    get_feedback_log(RATINGS_LOG, "ratings.json").append(
+        {"timestamp": time.time(), "username": username, "rating": rating})
+
+
+# Heavy-hitter counter (Misra-Gries) that keeps at most capacity terms, so
+# finding the most frequent terms of an unbounded stream uses constant memory.
+# Decrements are batched: when a new term arrives at a full counter, every count
+# drops by the median count, which frees at least half the slots at once, so the
+# rebuild is paid for by the next capacity/2 new terms. A count is at most
+# 2 * total / capacity below the true one.
+class TopTerms:
+    def __init__(self, capacity=2000):
+        self.capacity = capacity
+        self.counts = {}
+
+    def add(self, term):
+        counts = self.counts
+        if term in counts:
+            counts[term] += 1
+            return
+        counts[term] = 1
+        if len(counts) > self.capacity:
+            median = sorted(counts.values())[len(counts) // 2]
+            self.counts = {key: count - median for key, count in counts.items() if count > median}
+
+    def top(self, k=10):
+        return heapq.nlargest(k, self.counts.items(), key=lambda item: item[1])
+
+
+FEEDBACK_STOPWORDS = frozenset(
+    "a an and are as at be but by for from had has have i in is it its me my not of on or so "
+    "that the this to too was were with you your we our they very just".split())
+
+# Stream the records of an NDJSON feedback log, skipping anything unreadable
+def iter_feedback(path):
+    try:
+        f = open(path, "rb")
+    except FileNotFoundError:
+        return
+    with f:
+        for line in f:
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                continue
+
+# Single-pass analytics over the feedback logs.
+# Both logs are appended in time order, so they are merged by timestamp and
+# each time window is printed as soon as it closes; memory stays constant
+# however large the logs are.
+def feedback_report(improvements_path=IMPROVEMENTS_LOG, ratings_path=RATINGS_LOG,
+                    window_seconds=24 * 3600, rolling=100, top_k=10, out=None):
+    out = out or sys.stdout
+    start = time.perf_counter()
+    size = sum(os.path.getsize(path) for path in (improvements_path, ratings_path) if os.path.exists(path))
+
+    records = heapq.merge(iter_feedback(improvements_path), iter_feedback(ratings_path),
+                          key=lambda record: record.get("timestamp") or 0)
+    recent_ratings = deque(maxlen=rolling)
+    rating_total = rating_count = review_count = 0
+    sentiment_totals = Counter()
+    negative_terms = TopTerms()
+    window = None
+    window_reviews = Counter()
+    window_ratings = []
+
+    def close_window():
+        if window is None or not (window_reviews or window_ratings):
+            return
+        label = "undated" if window < 0 else time.strftime("%Y-%m-%d %H:%M", time.localtime(window * window_seconds))
+        average = f"{sum(window_ratings) / len(window_ratings):.2f}" if window_ratings else "-"
+        print(f"{label:<17} reviews {sum(window_reviews.values()):>7} (positive {window_reviews['Positive']}, "
+              f"neutral {window_reviews['Neutral']}, negative {window_reviews['Negative']})  "
+              f"ratings {len(window_ratings):>7} avg {average}", file=out)
+
+    for record in records:
+        timestamp = record.get("timestamp")
+        record_window = int(timestamp // window_seconds) if timestamp else -1
+        if record_window != window:
+            close_window()
+            window = record_window
+            window_reviews = Counter()
+            window_ratings = []
+
+        if "rating" in record:
+            try:
+                rating = float(record["rating"])
+            except (TypeError, ValueError):
+                continue
+            recent_ratings.append(rating)
+            rating_total += rating
+            rating_count += 1
+            window_ratings.append(rating)
+        elif "suggestion" in record:
+            sentiment = record.get("sentiment") or analyze_sentiment(record["suggestion"])
+            review_count += 1
+            sentiment_totals[sentiment] += 1
+            window_reviews[sentiment] += 1
+            if sentiment == "Negative":
+                for term in re.findall(r"[a-z']+", record["suggestion"].lower()):
+                    if len(term) > 2 and term not in FEEDBACK_STOPWORDS:
+                        negative_terms.add(term)
+    close_window()
+
+    elapsed = time.perf_counter() - start
+    print(f"\nRatings: {rating_count}, overall average "
+          f"{rating_total / rating_count if rating_count else 0:.2f}, "
+          f"last {len(recent_ratings)} average {sum(recent_ratings) / len(recent_ratings) if recent_ratings else 0:.2f}",
+          file=out)
+    print(f"Reviews: {review_count} (" + ", ".join(f"{label} {sentiment_totals[label]}"
+                                                for label in ("Positive", "Neutral", "Negative")) + ")", file=out)
+    print("Top negative feedback terms: " +
+          ", ".join(f"{term} ({count})" for term, count in negative_terms.top(top_k)), file=out)
+    print(f"Processed {rating_count + review_count} records ({size / 1e6:.1f} MB) in {elapsed:.2f}s "
+          f"({(rating_count + review_count) / max(elapsed, 1e-9):.0f} records/sec, "
+          f"{size / 1e6 / max(elapsed, 1e-9):.1f} MB/sec)", file=out)
+
+
+# Conversation state machine.
+# A session is a small JSON-serializable dict: the current dialog state, the
+# logged-in username, the answers collected so far in the current form and the
+# prescription numbers created since the ordering tab last listed them. Each incoming message is one
+# step() call that runs the state's handler and returns the reply text (any
+# output followed by the next state's prompt), so one process can multiplex
+# any number of sessions and park or resume them between messages.
+#
+# DIALOG maps each state to (prompt, handler). A handler is either a menu
+# table {choice: (next_state, message)} where the None entry catches anything
+# else, or a function (engine, session, message, out) -> next_state that
+# appends its output lines to out.
+
+AUTH_MENU = "\n1. Login\n2. Register\n3. Exit\nEnter your choice: "
+WELCOME_MENU = ("\nWelcome menu options:\n1. Medication Order\n2. Prescription Management\n"
+                "3. Medication Information Index\n4. Feedback/Improvement\n5. Exit\nEnter your choice: ")
+ORDER_MENU = ("1. Initiate Prescription Transfer (Incoming)\n2. Submit New Prescription\n"
+              "3. Get Drug Price\n4. Exit\nSelect an option (1/2/3): ")
+MANAGEMENT_MENU = ("\nPlease select an option: \n1. Refill Medication\n2. Check Medication Availability\n"
+                   "3. Check Order Status\n4. Exit\nSelect the number: ")
+INFO_MENU = ("\nHello and welcome, how can I help you today?\n\n"
+             "Select the type of information you'd like to know:\n1. Dosage Information\n"
+             "2. Allergy Information\n3. General Information/Interactions\n"
+             "4. Go back to Medication Selection\n5. Exit\nEnter your choice: ")
+FEEDBACK_MENU = ("\nFeedback/Improvement Options:\n1. Need further assistance (email/call pharmacy support)\n"
+                 "2. Rate our service (1-10)\n3. Review our service\n4. Exit\nEnter your choice: ")
+GOODBYE = "Thank you for using the pharmacy chatbot. Goodbye!"
+
+
+def new_session():
+    return {'state': 'auth_menu', 'username': None, 'form': {}, 'created': []}
+
+
+# Start a conversation: returns the new session and the greeting to show
+def start_session():
+    return new_session(), "Welcome to the Pharmacy Chatbot!\n" + DIALOG['auth_menu'][0]
+
+
+# Feed one customer message into a session; returns the reply text
+@metrics.timed("dialog_step")
+def step(session, message, engine=None):
+    engine = engine or wellbot_engine
+    message = message.strip()
+    handler = DIALOG[session['state']][1]
+    out = []
+    if isinstance(handler, dict):
+        next_state, reply = handler.get(message.lower(), handler[None])
+        if reply:
+            out.append(reply)
+    else:
+        next_state = handler(engine, session, message, out)
+    session['state'] = next_state
+    out.append(DIALOG[next_state][0])
+    return "\n".join(line for line in out if line)
+
+
+def format_suggestions(suggestions):
+    return [f"Did you mean: {', '.join(suggestions)}?"] if suggestions else []
+
+
+# Store the message as a form field and move on
+def _collect(field, next_state):
+    def handler(engine, session, message, out):
+        session['form'][field] = message
+        return next_state
+    return handler
+
+
+# Login and registration
+def _login(engine, session, message, out):
+    username = session['form'].pop('username')
+    if not engine.login(username, message)['ok']:
+        out.append("Invalid username or password.")
+        return 'auth_menu'
+    session['username'] = username
+    out.append(f"Welcome, {username}!")
+    return 'welcome_menu'
+
+def _register(engine, session, message, out):
+    username = session['form'].pop('username')
+    if not engine.register(username, message)['ok']:
+        out.append("Username already exists. Please choose a different username.")
+        return 'auth_menu'
+    session['username'] = username
+    out.append("Registration successful!")
+    out.append(f"Welcome, {username}!")
+    return 'welcome_menu'
+
+
+# Scenario 1: Prescription Ordering
+def _transfer(engine, session, message, out):
+    sending_pharmacy = session['form'].pop('sending_pharmacy')
+    result = engine.transfer_prescription(sending_pharmacy, message, customer=session['username'])
+    prescription_number = result['prescription_number']
+    session['created'].append(prescription_number)
+    out.append(f"Generated Prescription Number: {prescription_number}")
+    out.append(f"Prescription {prescription_number} initiated for transfer from {sending_pharmacy}. "
+               f"Telephone number: {message}")
+    return 'order_another'
+
+def _submit_prescription(engine, session, telephone_number=None):
+    form = session['form']
+    result = engine.order_prescription(form.pop('medication'), form.pop('dosage'), form.pop('instructions'),
+                                       form.pop('refills'), telephone_number is not None, telephone_number,
+                                       customer=session['username'])
+    session['created'].append(result['prescription_number'])
+
+def _new_fax(engine, session, message, out):
+    if message.lower() == 'y':
+        return 'new_telephone'
+    _submit_prescription(engine, session)
+    out.append("Prescription submission pending. Upload a picture of your prescription to your account.")
+    return 'order_another'
+
+def _new_telephone(engine, session, message, out):
+    _submit_prescription(engine, session, message)
+    out.append("Prescription submitted successfully.")
+    return 'order_another'
+
+def _price(engine, session, message, out):
+    form = session['form']
+    medication = form.pop('medication').lower()
+    category = form.pop('category').title()
+    medication_type = form.pop('medication_type').title()
+    result = engine.drug_price(medication, category, medication_type, message.lower() == 'y')
+    if result['ok']:
+        out.append(f"The price of {medication_type} {medication} under {category} Insurance is ${result['price']:.2f}")
+    else:
+        out.append("Invalid input or medication not found.")
+        out.extend(format_suggestions(result['suggestions']))
+    return 'order_another'
+
+# Leaving the ordering tab lists the prescriptions created during the visit
+def _order_another(engine, session, message, out):
+    if message.lower() == 'y':
+        return 'order_menu'
+    out.append("\nPrescription Database:")
+    for prescription_number in session['created']:
+        view = engine.prescription_view(prescription_number)
+        if not view['ok']:
+            continue
+        out.append(f"Prescription Number: {prescription_number}")
+        out.append(view['text'])
+        out.append("-" * 20)
+    session['created'] = []
+    return 'welcome_menu'
+
+
+# Scenario 2: Prescription Management
+def _refill_number(engine, session, message, out):
+    if engine.prescription(message) is not None:
+        session['form']['prescription_number'] = message
+        return 'refill_name'
+    if message.lower() == 'x':
+        out.append("Thank you for using WellBot!")
+        return 'management_menu'
+    return 'refill_retry'
+
+def _refill(engine, session, message, out):
+    prescription_number = session['form'].pop('prescription_number')
+    result = engine.refill(prescription_number, message)
+    if not result['ok']:
+        if result['error'] == 'out_of_stock':
+            out.append(f"\nSorry, {result['medication']} is currently out of stock. Your order could not be placed.")
+        else:
+            out.append("Invalid prescription number.")
+        return 'refill_another'
+    out.append(f"\nOrder Summary:\nPrescription Number: {prescription_number}\nCustomer: {message}\n"
+               f"Medicine: {result['order']['medicine']}")
+    out.append("\nOrder placed! We will send you an email with the delivery information.")
+    return 'refill_another'
+
+def _check_stock(engine, session, message, out):
+    medicine_name = message.capitalize()
+    if medicine_name == "X":
+        out.append("Exiting WellBot. Have a great day!")
+        return 'management_menu'
+    result = engine.check_stock(medicine_name)
+    medicine_name = result['medication']
+    if not result['ok']:
+        out.append(f"Sorry, we don't have {medicine_name} in our inventory. Please try again or enter 'x' to exit WellBot:")
+        out.extend(format_suggestions(result['suggestions']))
+        return 'stock_medication'
+    if result['available'] > 0:
+        out.append(f"{medicine_name} is available, we have {result['available']} units in stock.")
+    else:
+        out.append(f"Sorry, {medicine_name} is currently out of stock.")
+        # Recommend in-stock drugs from the same therapeutic class
+        if result['alternatives']:
+            out.append(f"Here are some available alternatives ({result['therapeutic_class']}):")
+            out.extend(f"- {med} ({units} units in stock)" for med, units in result['alternatives'])
+        else:
+            out.append("Unfortunately, we don't have a substitute in stock. Please ask our pharmacist for options.")
+    return 'stock_another'
+
+def _order_status(engine, session, message, out):
+    result = engine.order_status(message)
+    if not result['ok']:
+        out.append("Invalid prescription number. Please try again or enter 'x' to exit WellBot.")
+        if message.lower() == 'x':
+            out.append("Thank you for using WellBot!")
+            return 'management_menu'
+        return 'status_another'
+    out.append(f"\nThe order status for prescription number {message} is: {result['status']}")
+    out.append("\nPrescription Details:")
+    out.append(engine.prescription_view(message)['text'])
+    if result['needs_assistance']:
+        out.append(f"For further assistance, please contact our call center: {CALL_CENTER}")
+    return 'status_another'
+
+
+# Scenario 3: Medication Information Index
+def _info_medication(engine, session, message, out):
+    if message.lower() == 'x':
+        return 'welcome_menu'
+    result = engine.drug_info(message)
+    if not result['ok']:
+        out.append("Medication not found. Please try again or enter 'x' to go back to the main menu.")
+        out.extend(format_suggestions(result['suggestions']))
+        return 'info_medication'
+    session['form']['medication'] = message
+    out.append(f"Medication Name: {result['brand_name']}")
+    out.append(f"Manufacturer: {result['manufacturer']}")
+    return 'info_menu'
+
+# Label sections shown for each info menu choice (headings are in LABEL_SECTION_TEXT)
+INFO_SECTIONS = {
+    '1': ('dosage',),
+    '2': ('warnings',),
+    '3': ('indications', 'interactions'),
+}
+
+def _info_choice(engine, session, message, out):
+    if message == '4':
+        session['form'].pop('medication', None)
+        return 'info_medication'
+    if message == '5':
+        session['form'].pop('medication', None)
+        return 'welcome_menu'
+    if message not in INFO_SECTIONS:
+        out.append("Invalid choice.")
+        return 'info_more'
+    # The label comes from the medication info cache, so the session only keeps the name
+    for section in INFO_SECTIONS[message]:
+        result = engine.label_section(session['form']['medication'], section)
+        out.append(result['text'] if result['ok'] else LABEL_SECTION_TEXT[section][1])
+    return 'info_more'
+
+def _info_more(engine, session, message, out):
+    if message.lower() == 'no':
+        session['form'].pop('medication', None)
+        return 'welcome_menu'
+    return 'info_menu'
+
+
+# Scenario 4: Feedback/Improvement
+def _rating(engine, session, message, out):
+    engine.submit_feedback(rating=message, username=session['username'])
+    out.append(f"You rated our service: {message}")
+    return 'welcome_menu'
+
+def _review(engine, session, message, out):
+    result = engine.submit_feedback(review=message, username=session['username'])
+    out.append(f"Feedback sentiment: {result['sentiment']}")
+    out.append("Thank you for your input!")
+    return 'welcome_menu'
+
+SUPPORT_MESSAGE = "\n".join([
+    "You selected: Need further assistance.",
+    f"For further assistance call us toll-free at {PHARMACY_SUPPORT['phone']} "
+    f"or send an email to {PHARMACY_SUPPORT['email']}",
+    *PHARMACY_SUPPORT['hours'],
+])
+
+
+DIALOG = {
+    'auth_menu': (AUTH_MENU, {
+        '1': ('login_username', None),
+        '2': ('register_username', None),
+        '3': ('closed', GOODBYE),
+        None: ('auth_menu', "Invalid choice. Please choose a valid option."),
+    }),
+    'login_username': ("Enter your username: ", _collect('username', 'login_password')),
+    'login_password': ("Enter your password: ", _login),
+    'register_username': ("Enter a username: ", _collect('username', 'register_password')),
+    'register_password': ("Enter a password: ", _register),
+    'welcome_menu': (WELCOME_MENU, {
+        '1': ('order_menu', "\nWelcome to the ordering prescriptions tab!"),
+        '2': ('management_menu', None),
+        '3': ('info_medication', None),
+        '4': ('feedback_menu', "Thank you for providing feedback!"),
+        '5': ('closed', GOODBYE),
+        None: ('welcome_menu', "Invalid choice. Please choose a valid option."),
+    }),
+
+    'order_menu': (ORDER_MENU, {
+        '1': ('transfer_pharmacy', "\nInitiate Prescription Transfer (Incoming)"),
+        '2': ('new_medication', None),
+        '3': ('price_medication', None),
+        '4': ('welcome_menu', None),
+        None: ('order_another', "Invalid choice. Please select 1, 2, 3 or 4."),
+    }),
+    'transfer_pharmacy': ("Enter the name of the sending pharmacy: ", _collect('sending_pharmacy', 'transfer_telephone')),
+    'transfer_telephone': ("Enter the telephone number of the sending pharmacy: ", _transfer),
+    'new_medication': ("Enter the medication name: ", _collect('medication', 'new_dosage')),
+    'new_dosage': ("Enter the dosage: ", _collect('dosage', 'new_instructions')),
+    'new_instructions': ("Enter the instructions: ", _collect('instructions', 'new_refills')),
+    'new_refills': ("Enter the number of refills: ", _collect('refills', 'new_fax')),
+    'new_fax': ("Fax of prescription from doctor's office needed? (y/n): ", _new_fax),
+    'new_telephone': ("Enter the telephone number of the doctor's office: ", _new_telephone),
+    'price_medication': ("Enter the medication name: ", _collect('medication', 'price_category')),
+    'price_category': ("Select category (Public/Private Insurance): ", _collect('category', 'price_type')),
+    'price_type': ("Select medication type (Brand/Generic): ", _collect('medication_type', 'price_rebate')),
+    'price_rebate': ("Do you have a manufacturer rebate? (y/n): ", _price),
+    'order_another': ("Do you want to perform another action? (y/n): ", _order_another),
+
+    'management_menu': (MANAGEMENT_MENU, {
+        '1': ('refill_number', None),
+        '2': ('stock_medication', None),
+        '3': ('status_number', None),
+        '4': ('welcome_menu', None),
+        None: ('management_menu', "\nInvalid option. Please choose a valid option."),
+    }),
+    'refill_number': ("Please enter your prescription number: ", _refill_number),
+    'refill_retry': ("Invalid prescription number. Please try again or enter 'x' to exit WellBot: ", _refill_number),
+    'refill_name': ("Please enter your full name: ", _refill),
+    'refill_another': ("\nWould you like to place another order? (y/n): ", {
+        'y': ('refill_number', None), None: ('management_menu', None),
+    }),
+    'stock_medication': ("Please enter the name of the medicine you want to check: ", _check_stock),
+    'stock_another': ("\nWould you like to check another medicine? (y/n): ", {
+        'y': ('stock_medication', None),
+        None: ('management_menu', "Thank you for using WellBot!"),
+    }),
+    'status_number': ("Please enter your prescription number: ", _order_status),
+    'status_another': ("\nWould you like to check another order? (y/n): ", {
+        'y': ('status_number', None), None: ('management_menu', None),
+    }),
+
+    'info_medication': ("Enter the medication name: ", _info_medication),
+    'info_menu': (INFO_MENU, _info_choice),
+    'info_more': ("Would you like more info? (yes/no): ", _info_more),
+
+    'feedback_menu': (FEEDBACK_MENU, {
+        '1': ('welcome_menu', SUPPORT_MESSAGE),
+        '2': ('feedback_rating', None),
+        '3': ('feedback_review', None),
+        '4': ('welcome_menu', None),
+        None: ('feedback_menu', "Invalid choice."),
+    }),
+    'feedback_rating': ("How would you rate our service (1-10)? ", _rating),
+    'feedback_review': ("How was your experience using our service? ", _review),
+
+    'closed': ("", {None: ('closed', "This conversation has ended.")}),
+}
+
+
+# Main pharmacy chatbot function: the terminal front end to the dialog
+def pharmacy_chatbot(engine=None):
+    session, reply = start_session()
+    while True:
+        print(reply, end="")
+        if session['state'] == 'closed':
+            print()
+            return
+        reply = step(session, input(), engine)
+
+
+# Web chat front end: a small asyncio HTTP/1.1 + WebSocket server (stdlib only)
+# serving the DIALOG state machine.
+#
+#   POST   /sessions        start a conversation -> {"session_id", "reply"}
+#   POST   /sessions/<id>   {"message": "..."} -> {"reply", "state", "closed"}
+#   DELETE /sessions/<id>   end a conversation
+#   GET    /health          session and in-flight counts
+#   GET    /metrics         this process's metrics, Prometheus text (?format=json for JSON)
+#   GET    /ws              WebSocket; one conversation per connection, one
+#                           text frame per message and per reply
+#
+# Menu choices are table lookups and run on the event loop; handlers that may
+# touch the stores or OpenFDA run in a thread pool. At most max_pending of
+# those are in flight: HTTP requests beyond that get 503 and WebSocket
+# connections stop reading until a slot frees up, so TCP pushes back on the
+# client. Shutdown stops accepting, sends WebSocket clients a close frame,
+# lets in-flight steps finish and flushes the stores.
+#
+# HTTP sessions live in this process, or with session_store= in a SQLiteStore
+# shared by every worker of `--serve --processes N`, so any worker can take the
+# next request of a session. A request leases its shared session (a version-checked
+# write) before stepping, so a request racing another one for the same session
+# gets 409 before anything has happened, and can simply retry.
+
+# How long a worker may hold a shared session while stepping it
+SESSION_LEASE_SECONDS = 120
+
+WEBSOCKET_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+HTTP_REASONS = {200: "OK", 201: "Created", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+                409: "Conflict", 413: "Payload Too Large", 503: "Service Unavailable"}
+WS_TEXT, WS_CLOSE, WS_PING, WS_PONG = 0x1, 0x8, 0x9, 0xA
+
+
+def _ws_mask(payload, key):
+    if not payload:
+        return payload
+    n = len(payload)
+    mask = (key * (n // 4 + 1))[:n]
+    return (int.from_bytes(payload, "big") ^ int.from_bytes(mask, "big")).to_bytes(n, "big")
+
+# Encode one WebSocket frame; clients must mask what they send, servers must not
+def encode_ws_frame(opcode, payload, mask=False):
+    header = bytearray([0x80 | opcode])
+    mask_bit = 0x80 if mask else 0
+    length = len(payload)
+    if length < 126:
+        header.append(mask_bit | length)
+    elif length < 1 << 16:
+        header.append(mask_bit | 126)
+        header += length.to_bytes(2, "big")
+    else:
+        header.append(mask_bit | 127)
+        header += length.to_bytes(8, "big")
+    if mask:
+        key = os.urandom(4)
+        header += key
+        payload = _ws_mask(payload, key)
+    return bytes(header) + payload
+
+# Read one frame; returns (fin, opcode, payload)
+async def read_ws_frame(reader, max_size=64 * 1024):
+    head = await reader.readexactly(2)
+    length = head[1] & 0x7F
+    if length == 126:
+        length = int.from_bytes(await reader.readexactly(2), "big")
+    elif length == 127:
+        length = int.from_bytes(await reader.readexactly(8), "big")
+    if length > max_size:
+        raise ValueError(f"WebSocket frame of {length} bytes is over the {max_size} byte limit")
+    key = await reader.readexactly(4) if head[1] & 0x80 else None
+    payload = await reader.readexactly(length)
+    if key is not None:
+        payload = _ws_mask(payload, key)
+    return bool(head[0] & 0x80), head[0] & 0x0F, payload
+
+# Read one message, joining continuation frames and answering pings.
+# Returns (opcode, payload); opcode is WS_CLOSE when the peer closes.
+async def read_ws_message(reader, writer, max_size=64 * 1024, mask=False):
+    opcode, parts, size = None, [], 0
+    while True:
+        fin, frame_opcode, payload = await read_ws_frame(reader, max_size)
+        if frame_opcode == WS_PING:
+            writer.write(encode_ws_frame(WS_PONG, payload, mask))
+            continue
+        if frame_opcode == WS_PONG:
+            continue
+        if frame_opcode == WS_CLOSE:
+            return WS_CLOSE, payload
+        if frame_opcode != 0:
+            opcode = frame_opcode
+        size += len(payload)
+        if size > max_size:
+            raise ValueError(f"WebSocket message is over the {max_size} byte limit")
+        parts.append(payload)
+        if fin:
+            return opcode, b"".join(parts)
+
+
+class ChatServer:
+    def __init__(self, engine=None, host="127.0.0.1", port=8080, workers=8, max_pending=256,
+                 max_sessions=100_000, session_ttl=30 * 60, max_message=64 * 1024, session_store=None):
+        from concurrent.futures import ThreadPoolExecutor
+
+        self.engine = engine or wellbot_engine
+        self.host = host
+        self.port = port
+        self.max_pending = max_pending
+        self.max_sessions = max_sessions
+        self.session_ttl = session_ttl
+        self.max_message = max_message
+        # HTTP sessions by id, with their last activity and a lock so one
+        # session's messages are handled in order
+        self.sessions = {}
+        self.last_seen = {}
+        self._session_locks = {}
+        self.session_store = session_store
+        self._shared_sessions = 0
+        self.pending = 0
+        self.stats = Counter()
+        self._executor = ThreadPoolExecutor(workers, thread_name_prefix="wellbot")
+        self._slots = None
+        self._server = None
+        self._sweeper = None
+        self._closing = False
+        self.openfda = None
+        self._connections = set()
+        self._websockets = set()
+
+    # Listen on host:port, or on an already bound socket (pre-fork workers share one)
+    async def start(self, sock=None):
+        self._slots = asyncio.Semaphore(self.max_pending)
+        self.openfda = AsyncOpenFDAClient()
+        if sock is not None:
+            self._server = await asyncio.start_server(self._handle_connection, sock=sock)
+        else:
+            self._server = await asyncio.start_server(self._handle_connection, self.host, self.port, backlog=4096)
+        self.port = self._server.sockets[0].getsockname()[1]
+        if self.session_store is not None:
+            self._shared_sessions = await self._run(len, self.session_store)
+        self._sweeper = asyncio.ensure_future(self._expire_sessions())
+
+    # Run blocking work (storage, OpenFDA) in the thread pool, within the in-flight limit
+    async def _run(self, fn, *args):
+        async with self._slots:
+            self.pending += 1
+            try:
+                return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+            finally:
+                self.pending -= 1
+
+    # Run one dialog step for a session
+    async def reply(self, session, message):
+        self.stats["messages"] += 1
+        if isinstance(DIALOG[session['state']][1], dict):
+            return step(session, message, self.engine)
+        labels = await self._prefetch_label(session, message)
+        return await self._run(self._step, session, message, labels)
+
+    # A drug label the next step is about to read is fetched here first, on the
+    # event loop through the OpenFDA client: upstream calls are capped per
+    # process and concurrent sessions asking for the same drug share one call.
+    # Returns {normalized name: label or None} for _step, so a lookup that came
+    # back empty or failed is not retried from the worker thread.
+    async def _prefetch_label(self, session, message):
+        if session['state'] == 'info_medication':
+            medication_name = message.strip()
+        elif session['state'] == 'info_menu':
+            medication_name = session['form'].get('medication')
+        else:
+            return None
+        if not medication_name or medication_name.lower() == 'x':
+            return None
+        return {MedicationInfoCache.normalize(medication_name): await self.openfda.fetch(medication_name)}
+
+    def _step(self, session, message, labels=None):
+        with prefetched_labels(labels):
+            return step(session, message, self.engine)
+
+    def overloaded(self):
+        return self._slots.locked()
+
+    def session_count(self):
+        return self._shared_sessions if self.session_store is not None else len(self.sessions)
+
+    async def _expire_sessions(self):
+        while True:
+            await asyncio.sleep(min(60, self.session_ttl))
+            if self.session_store is not None:
+                await self._run(self.session_store.delete_stale, time.time() - self.session_ttl)
+                self._shared_sessions = await self._run(len, self.session_store)
+                continue
+            cutoff = time.monotonic() - self.session_ttl
+            for session_id in [sid for sid, seen in self.last_seen.items() if seen < cutoff]:
+                self._drop_session(session_id)
+
+    # One message for a shared session: lease it (_lease_shared), step, save it
+    # back and let go. The lease is taken with a version check before step() runs,
+    # so a request that loses the race has no side effects yet; a crashed
+    # worker's lease lapses after SESSION_LEASE_SECONDS.
+    # Returns (error response or None, session, leased version)
+    def _lease_shared(self, session_id):
+        session, version = self.session_store.get_versioned(session_id)
+        if session is None:
+            return (404, {"error": "Unknown or expired session"}), None, 0
+        now = time.time()
+        if session.pop('leased_until', 0) > now or not self.session_store.put_if_version(
+                session_id, dict(session, leased_until=now + SESSION_LEASE_SECONDS), version):
+            return (409, {"error": "Session is busy with another request, please retry"}), None, 0
+        return None, session, version + 1
+
+    def _step_shared(self, session_id, session, version, message, labels=None):
+        reply = self._step(session, message, labels)
+        closed = session['state'] == 'closed'
+        if closed:
+            self.session_store.delete(session_id)
+        else:
+            # Still ours unless the lease lapsed mid-step; the reply stands either way,
+            # since the step's side effects have happened
+            self.session_store.put_if_version(session_id, session, version)
+        return 200, {"reply": reply, "state": session['state'], "closed": closed}
+
+    def _drop_session(self, session_id):
+        self.sessions.pop(session_id, None)
+        self.last_seen.pop(session_id, None)
+        self._session_locks.pop(session_id, None)
+
+    async def _handle_connection(self, reader, writer):
+        self._connections.add(writer)
+        try:
+            while not self._closing:
+                request = await self._read_request(reader)
+                if request is None:
+                    break
+                method, path, headers, body = request
+                if path == "/ws" and headers.get("upgrade", "").lower() == "websocket":
+                    await self._websocket(reader, writer, headers)
+                    break
+                if isinstance(body, int):
+                    status, payload = body, {"error": HTTP_REASONS[body]}
+                else:
+                    status, payload = await self._route(method, path, body)
+                keep_alive = headers.get("connection", "").lower() != "close" and not self._closing
+                self._write_response(writer, status, payload, keep_alive)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError, ValueError):
+            pass
+        finally:
+            self._connections.discard(writer)
+            writer.close()
+
+    # Parse one HTTP request; body is an int status when it cannot be read
+    async def _read_request(self, reader):
+        try:
+            head = await reader.readuntil(b"\r\n\r\n")
+        except asyncio.IncompleteReadError:
+            return None
+        lines = head.decode("latin-1").split("\r\n")
+        method, path, _ = lines[0].split(" ", 2)
+        headers = {}
+        for line in lines[1:]:
+            if line:
+                name, _, value = line.partition(":")
+                headers[name.strip().lower()] = value.strip()
+        length = int(headers.get("content-length", 0))
+        if length > self.max_message:
+            return method, path, {**headers, "connection": "close"}, 413
+        body = await reader.readexactly(length) if length else b""
+        return method, path, headers, body
+
+    # A str payload is sent as plain text, anything else as JSON
+    def _write_response(self, writer, status, payload, keep_alive=True):
+        if isinstance(payload, str):
+            body, content_type = payload.encode("utf-8"), "text/plain; version=0.0.4"
+        else:
+            body, content_type = json.dumps(payload).encode("utf-8"), "application/json"
+        retry_after = "Retry-After: 1\r\n" if status == 503 else ""
+        writer.write(f"HTTP/1.1 {status} {HTTP_REASONS[status]}\r\n"
+                     f"Content-Type: {content_type}\r\nContent-Length: {len(body)}\r\n"
+                     f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n"
+                     f"{retry_after}\r\n".encode("latin-1") + body)
+
+    async def _route(self, method, path, body):
+        path, _, query = path.partition("?")
+        parts = path.strip("/").split("/")
+        if parts == ["health"]:
+            return 200, {"ok": True, "sessions": self.session_count(), "websockets": len(self._websockets),
+                         "pending": self.pending, "messages": self.stats["messages"]}
+        if parts == ["metrics"]:
+            if method != "GET":
+                return 405, {"error": "Method Not Allowed"}
+            return 200, metrics.snapshot() if "format=json" in query.split("&") else metrics.prometheus()
+        if parts[0] != "sessions" or len(parts) > 2:
+            return 404, {"error": "Not Found"}
+        if len(parts) == 1:
+            if method != "POST":
+                return 405, {"error": "Method Not Allowed"}
+            if self.overloaded() or self.session_count() >= self.max_sessions:
+                return 503, {"error": "Server busy, try again shortly"}
+            session_id = secrets.token_urlsafe(16)
+            session, greeting = start_session()
+            if self.session_store is not None:
+                await self._run(self.session_store.put, session_id, session)
+                self._shared_sessions += 1
+                return 201, {"session_id": session_id, "reply": greeting}
+            self.sessions[session_id] = session
+            self.last_seen[session_id] = time.monotonic()
+            self._session_locks[session_id] = asyncio.Lock()
+            return 201, {"session_id": session_id, "reply": greeting}
+
+        session_id = parts[1]
+        if method not in ("POST", "DELETE"):
+            return 405, {"error": "Method Not Allowed"}
+        if self.session_store is not None:
+            if method == "DELETE":
+                await self._run(self.session_store.delete, session_id)
+                return 200, {"ok": True}
+        else:
+            session = self.sessions.get(session_id)
+            if session is None:
+                return 404, {"error": "Unknown or expired session"}
+            if method == "DELETE":
+                self._drop_session(session_id)
+                return 200, {"ok": True}
+        try:
+            message = json.loads(body)["message"]
+        except (ValueError, KeyError, TypeError):
+            return 400, {"error": 'Expected a JSON body {"message": "..."}'}
+        if not isinstance(message, str):
+            return 400, {"error": "message must be a string"}
+        if self.overloaded():
+            return 503, {"error": "Server busy, try again shortly"}
+        if self.session_store is not None:
+            self.stats["messages"] += 1
+            error, session, version = await self._run(self._lease_shared, session_id)
+            if error is not None:
+                return error
+            labels = await self._prefetch_label(session, message)
+            return await self._run(self._step_shared, session_id, session, version, message, labels)
+        async with self._session_locks[session_id]:
+            reply = await self.reply(session, message)
+        self.last_seen[session_id] = time.monotonic()
+        closed = session['state'] == 'closed'
+        if closed:
+            self._drop_session(session_id)
+        return 200, {"reply": reply, "state": session['state'], "closed": closed}
+
+    async def _websocket(self, reader, writer, headers):
+        key = headers.get("sec-websocket-key")
+        if not key:
+            self._write_response(writer, 400, {"error": "Missing Sec-WebSocket-Key"}, keep_alive=False)
+            return
+        accept = base64.b64encode(hashlib.sha1((key + WEBSOCKET_GUID).encode("ascii")).digest()).decode("ascii")
+        writer.write(("HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+                      f"Sec-WebSocket-Accept: {accept}\r\n\r\n").encode("latin-1"))
+        self._websockets.add(writer)
+        try:
+            session, reply = start_session()
+            while True:
+                writer.write(encode_ws_frame(WS_TEXT, reply.encode("utf-8")))
+                await writer.drain()
+                if session['state'] == 'closed':
+                    writer.write(encode_ws_frame(WS_CLOSE, (1000).to_bytes(2, "big")))
+                    await writer.drain()
+                    return
+                opcode, payload = await read_ws_message(reader, writer, self.max_message)
+                if opcode == WS_CLOSE:
+                    if not self._closing:
+                        writer.write(encode_ws_frame(WS_CLOSE, payload[:2]))
+                    return
+                reply = await self.reply(session, payload.decode("utf-8", "replace"))
+        finally:
+            self._websockets.discard(writer)
+
+    async def shutdown(self, grace=10):
+        self._closing = True
+        self._server.close()
+        self._sweeper.cancel()
+        # 1001 "going away"
+        for writer in list(self._websockets):
+            writer.write(encode_ws_frame(WS_CLOSE, (1001).to_bytes(2, "big")))
+        deadline = time.monotonic() + grace
+        while self.pending and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        for writer in list(self._connections):
+            writer.close()
+        await self._server.wait_closed()
+        self._executor.shutdown(wait=True)
+        self.openfda.close()
+
+
+# Run a chat server until SIGINT/SIGTERM, then shut it down gracefully
+async def run_chat_server(server, sock=None):
+    await server.start(sock)
+    if sock is None:
+        print(f"WellBot chat server listening on http://{server.host}:{server.port} (WebSocket: /ws)", flush=True)
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except NotImplementedError:  # Windows
+            pass
+    await stop.wait()
+    await server.shutdown()
+    return server.stats['messages']
+
+
+def serve(host="127.0.0.1", port=8080, workers=8, engine=None, processes=1, db_path=SHARED_DB_PATH):
+    if processes > 1:
+        return serve_prefork(host, port, workers, processes, db_path)
+    engine = engine or wellbot_engine
+    try:
+        messages = asyncio.run(run_chat_server(ChatServer(engine, host, port, workers)))
+    finally:
+        engine.close()
+    print(f"WellBot chat server stopped after {messages} messages", flush=True)
+
+
+# Pre-fork deployment: the parent binds the listening socket, then forks
+# processes workers that all accept on that socket. Users, prescriptions
+# and HTTP sessions live in the shared SQLite database; inventory.db,
+# rx_sequence, the delivery event log and the feedback logs (O_APPEND, one
+# write per record) were already safe with several writers. SIGINT/SIGTERM to the parent
+# is passed on to the workers, which shut down gracefully.
+def serve_prefork(host, port, workers, processes, db_path=SHARED_DB_PATH):
+    global _inventory
+    import socket
+    if not hasattr(os, "fork"):
+        raise SystemExit("--processes needs os.fork (Linux/macOS); run a single process on Windows")
+
+    if db_path == SHARED_DB_PATH:
+        # Merge data left in the files of earlier versions before the workers start
+        for store in (user_store.store, prescription_store):
+            len(store)
+            store.close()
+    # Open the shared inventory once, so workers do not race to create and seed it
+    get_inventory()
+    sock = socket.create_server((host, port), backlog=4096)
+    print(f"WellBot chat server listening on http://{host}:{sock.getsockname()[1]} (WebSocket: /ws), "
+          f"{processes} worker processes", flush=True)
+
+    children = []
+    for _ in range(processes):
+        pid = os.fork()
+        if pid == 0:
+            status = 0
+            try:
+                # Fresh SQLite connections in the child; none may cross a fork
+                _inventory = None
+                engine = shared_engine(db_path)
+                server = ChatServer(engine, host, port, workers, session_store=SQLiteStore(db_path, "sessions"))
+                messages = asyncio.run(run_chat_server(server, sock))
+                engine.close()
+                # os._exit skips atexit, so write this worker's metrics and profile here
+                if metrics.dump_path:
+                    metrics.dump(metrics.dump_path)
+                profiler.stop()
+                print(f"worker {os.getpid()} handled {messages} messages", flush=True)
+            except BaseException:
+                import traceback
+                traceback.print_exc()
+                status = 1
+            finally:
+                os._exit(status)
+        children.append(pid)
+    sock.close()
+
+    def signal_workers(signum):
+        for pid in children:
+            try:
+                os.kill(pid, signum)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGINT, lambda signum, frame: signal_workers(signal.SIGTERM))
+    signal.signal(signal.SIGTERM, lambda signum, frame: signal_workers(signal.SIGTERM))
+    # SIGUSR2 toggles the profiler in every worker
+    if hasattr(signal, "SIGUSR2"):
+        signal.signal(signal.SIGUSR2, lambda signum, frame: signal_workers(signum))
+    failed = 0
+    for pid in children:
+        _, status = os.waitpid(pid, 0)
+        failed += status != 0
+    print(f"WellBot chat server stopped ({processes} workers, {failed} failed)", flush=True)
+
+
+# Write the prescription listing page by page, so output starts right away and
+# only one page of rendered views is held at a time
+def stream_prescriptions(engine, output_format="text", out=None, page_size=LISTING_PAGE_SIZE):
+    out = out or sys.stdout
+    after = None
+    while True:
+        page = engine.list_prescriptions(after, page_size, output_format)
+        for view in page['prescriptions']:
+            if output_format == "json":
+                out.write(view['json'] + "\n")
+            else:
+                out.write(f"Prescription Number: {view['prescription_number']}\n{view['text']}\n{'-' * 20}\n")
+        out.flush()
+        after = page['next']
+        if after is None:
+            return
+
+
+def main():
+    parser = argparse.ArgumentParser(description="WellBot: Well.ca's Pharmacy Chatbot")
+    parser.add_argument("--import-labels", nargs="+", metavar="DUMP",
+                        help="build the local drug label index from OpenFDA drug/label bulk downloads")
+    parser.add_argument("--feedback-report", action="store_true",
+                        help="print rating and review analytics from the feedback logs")
+    parser.add_argument("--window", type=float, default=24, metavar="HOURS",
+                        help="time window for --feedback-report (default: 24 hours)")
+    parser.add_argument("--courier-feed", metavar="FEED",
+                        help="apply bulk delivery status updates from a courier feed (.csv or .ndjson)")
+    parser.add_argument("--orders-with-status", metavar="STATUS",
+                        help="list the prescription numbers currently in a delivery status")
+    parser.add_argument("--list-prescriptions", nargs="?", const="text", choices=("text", "json"), metavar="FORMAT",
+                        help="print every prescription, a page at a time, as text or as one JSON object per line")
+    parser.add_argument("--serve", action="store_true",
+                        help="serve the chatbot over HTTP and WebSocket instead of the terminal")
+    parser.add_argument("--host", default="127.0.0.1", help="address for --serve (default: 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=8080, help="port for --serve (default: 8080, 0 picks a free port)")
+    parser.add_argument("--workers", type=int, default=8,
+                        help="threads for storage and OpenFDA calls in --serve mode (default: 8)")
+    parser.add_argument("--processes", type=int, default=1,
+                        help="worker processes for --serve, sharing the socket and the WELLBOT_DB database, "
+                             "or validation processes for --import-transfers (default: 1)")
+    parser.add_argument("--import-transfers", metavar="FILE",
+                        help="bulk import incoming prescription transfers from a CSV or NDJSON export "
+                             "(resumes from FILE.checkpoint after an interruption)")
+    parser.add_argument("--sending-pharmacy", metavar="NAME",
+                        help="sending pharmacy for --import-transfers rows that do not name one")
+    parser.add_argument("--metrics-dump", metavar="FILE",
+                        help="turn on instrumentation and write the metrics to FILE on exit "
+                             "(JSON for a .json file, Prometheus text otherwise)")
+    parser.add_argument("--profile", metavar="FILE",
+                        help="run the sampling profiler from startup and write folded stacks to FILE on exit "
+                             "(kill -USR2 <pid> toggles it at any time)")
+    args = parser.parse_args()
+
+    if args.metrics_dump:
+        metrics.enabled = True
+        metrics.dump_path = args.metrics_dump
+        atexit.register(lambda: metrics.dump(metrics.dump_path))
+    if args.profile:
+        profiler.path = args.profile
+        profiler.start()
+        atexit.register(profiler.stop)
+    install_profiler_signal()
+
+    if args.import_labels:
+        import_label_dumps(args.import_labels)
+        return
+    if args.feedback_report:
+        feedback_report(window_seconds=args.window * 3600)
+        return
+    if args.courier_feed:
+        start = time.perf_counter()
+        try:
+            count = delivery_status.import_feed(args.courier_feed)
+        except ValueError as e:
+            raise SystemExit(str(e))
+        finally:
+            delivery_status.close()
+        elapsed = time.perf_counter() - start
+        print(f"Applied {count} status events in {elapsed:.2f}s ({count / max(elapsed, 1e-9):.0f} events/sec)")
+        return
+    if args.import_transfers:
+        # Straight into the shared database, where a running bot or server (one or
+        # several worker processes) picks the rows up; a one-off import has no use
+        # for the lookup indexes
+        result = import_transfers(args.import_transfers, store=prescription_store, processes=args.processes,
+                                  default_pharmacy=args.sending_pharmacy)
+        prescription_store.close()
+        rate = result['rows_this_run'] / max(result['seconds'], 1e-9)
+        print(f"Imported {result['imported']} prescriptions, rejected {result['rejected']} rows "
+              f"(see {args.import_transfers}.rejected.ndjson); {result['rows_this_run']} rows in "
+              f"{result['seconds']:.2f}s ({rate:.0f} rows/sec)"
+              + (f", resumed after row {result['resumed_from']}" if result['resumed_from'] else ""))
+        return
+    if args.orders_with_status:
+        for prescription_number in delivery_status.with_status(args.orders_with_status):
+            print(prescription_number)
+        return
+    if args.list_prescriptions:
+        stream_prescriptions(WellBotEngine(), args.list_prescriptions)
+        return
+    if args.serve:
+        serve(args.host, args.port, args.workers, processes=args.processes)
+        return
+    print(f"\n{border}\n{title}\n{border}\n")
+    pharmacy_chatbot()
 
 # Call the main function
-pharmacy_chatbot()
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,1727 @@
+# -*- coding: utf-8 -*-
+"""
+# **WELLBOT BENCHMARKS**
+
+* Run from the repository root, e.g. `python benchmark.py users --sizes 10000 100000 1000000`
+* Every benchmark works on throw-away files in a temporary directory
+"""
+
+import argparse
+import csv
+import itertools
+import json
+import multiprocessing
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+
+import Wellbot
+
+
+def report(label, samples):
+    samples = sorted(samples)
+    p50 = samples[len(samples) // 2]
+    p99 = samples[min(len(samples) - 1, int(len(samples) * 0.99))]
+    print(f"{label:<40} mean {statistics.mean(samples) * 1e6:9.2f}us  "
+          f"p50 {p50 * 1e6:9.2f}us  p99 {p99 * 1e6:9.2f}us")
+
+
+# Login latency for growing user tables in the shared SQLite database. Filler
+# users are hashed with a single KDF iteration so the numbers show the index
+# cost, not the password hash cost.
+def bench_users(sizes, logins=2000):
+    for size in sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            db_path = os.path.join(tmp, "wellbot.db")
+            store = Wellbot.UserStore(store=Wellbot.SQLiteStore(db_path, "users"), iterations=1)
+            start = time.perf_counter()
+            batch = {}
+            for i in range(size):
+                username = f"user{i}"
+                batch[username] = {"name": username, **Wellbot.hash_password("pw", iterations=1)}
+                if len(batch) == 50_000:
+                    store.store.put_many(batch)
+                    batch = {}
+            store.store.put_many(batch)
+            store.store.close()
+            print(f"\n{size} users: populated in {time.perf_counter() - start:.2f}s")
+
+            start = time.perf_counter()
+            store = Wellbot.UserStore(store=Wellbot.SQLiteStore(db_path, "users"), iterations=1)
+            len(store)
+            print(f"startup load: {time.perf_counter() - start:.2f}s")
+
+            samples = []
+            for _ in range(logins):
+                username = f"user{random.randrange(size)}"
+                start = time.perf_counter()
+                assert store.verify(username, "pw")
+                samples.append(time.perf_counter() - start)
+            report(f"login ({size} users)", samples)
+
+            samples = []
+            for _ in range(logins):
+                start = time.perf_counter()
+                store.register(f"new{random.random()}", "pw")
+                samples.append(time.perf_counter() - start)
+            report(f"register ({size} users)", samples)
+            store.store.close()
+
+
+# Cost of one password hash at several KDF work factors
+def bench_kdf(iteration_counts):
+    for iterations in iteration_counts:
+        samples = []
+        for _ in range(5):
+            start = time.perf_counter()
+            Wellbot.hash_password("correct horse battery staple", iterations=iterations)
+            samples.append(time.perf_counter() - start)
+        report(f"pbkdf2-sha256 x{iterations}", samples)
+    print(f"calibrated iterations for ~50ms: {Wellbot.calibrate_kdf_iterations(0.05)}")
+
+    # Logging in as an unknown user costs the same KDF work as a wrong password
+    with tempfile.TemporaryDirectory() as tmp:
+        store = Wellbot.UserStore(store=Wellbot.SQLiteStore(os.path.join(tmp, "wellbot.db"), "users"))
+        store.register("known", "pw")
+        timings = {}
+        for username in ("known", "unknown"):
+            samples = []
+            for _ in range(5):
+                start = time.perf_counter()
+                assert not store.verify(username, "wrong")
+                samples.append(time.perf_counter() - start)
+            report(f"failed login, {username} user", samples)
+            timings[username] = statistics.median(samples)
+        assert timings["unknown"] > timings["known"] / 2, "unknown usernames fail measurably faster"
+
+
+# Random drug-like names built from common syllables
+def synthetic_drug_names(count, seed=0):
+    rng = random.Random(seed)
+    syllables = ["am", "ox", "ci", "lin", "met", "for", "min", "lo", "sar", "tan", "pra", "zole",
+                 "ator", "va", "sta", "tin", "di", "pine", "cef", "ro", "xi", "mab", "nib", "pril"]
+    names = set()
+    while len(names) < count:
+        names.add("".join(rng.choice(syllables) for _ in range(rng.randint(2, 5))).capitalize())
+    return sorted(names)
+
+# Introduce one or two random edits into a name
+def misspell(name, rng):
+    chars = list(name.lower())
+    for _ in range(rng.randint(1, 2)):
+        i = rng.randrange(len(chars))
+        edit = rng.choice(("delete", "insert", "replace"))
+        if edit == "delete" and len(chars) > 3:
+            del chars[i]
+        elif edit == "insert":
+            chars.insert(i, rng.choice("abcdefghijklmnopqrstuvwxyz"))
+        else:
+            chars[i] = rng.choice("abcdefghijklmnopqrstuvwxyz")
+    return "".join(chars)
+
+
+# Typo-tolerant name resolution latency at a given number of drug names
+def bench_names(sizes, queries=2000):
+    rng = random.Random(1)
+    for size in sizes:
+        names = synthetic_drug_names(size)
+        start = time.perf_counter()
+        index = Wellbot.NameIndex(names, Wellbot.BRAND_ALIASES)
+        print(f"\n{size} names: index built in {time.perf_counter() - start:.2f}s")
+
+        samples = {"resolve (exact)": [], "suggest (1-2 typos)": [], "complete (prefix)": []}
+        found = 0
+        for _ in range(queries):
+            name = rng.choice(names)
+            typo = misspell(name, rng)
+            start = time.perf_counter()
+            index.resolve(name)
+            samples["resolve (exact)"].append(time.perf_counter() - start)
+            start = time.perf_counter()
+            suggestions = index.suggest(typo, 5)
+            samples["suggest (1-2 typos)"].append(time.perf_counter() - start)
+            found += name in suggestions
+            # The intended name may only be crowded out by five names at least as close
+            distance = Wellbot.edit_distance(typo, name.lower())
+            assert distance > 2 or name in suggestions or (
+                len(suggestions) == 5 and all(Wellbot.edit_distance(typo, suggestion.lower()) <= distance
+                                              for suggestion in suggestions)), (typo, name, suggestions)
+            start = time.perf_counter()
+            index.complete(name[:3], 5)
+            samples["complete (prefix)"].append(time.perf_counter() - start)
+        for label, values in samples.items():
+            report(f"{label} ({size} names)", values)
+        print(f"intended name in top-5 suggestions: {found / queries:.1%}")
+
+    # Two substitutions, a substitution plus a missing letter, two missing letters
+    index = Wellbot.NameIndex(Wellbot.STOCK_DATA["Medication"], Wellbot.BRAND_ALIASES)
+    for typo, name in [("metfarmon", "Metformin"), ("atorbastatim", "Atorvastatin"),
+                       ("lysinoprol", "Lisinopril"), ("amoxcilin", "Amoxicillin"), ("lisnopil", "Lisinopril")]:
+        assert index.suggest(typo, 5)[:1] == [name], (typo, index.suggest(typo, 5))
+
+
+# Pricing table with the same columns as drug_prices.csv
+def synthetic_pricing_table(rows, seed=0):
+    rng = random.Random(seed)
+    table = {'Medication': synthetic_drug_names(rows, seed)}
+    for column in ('Brand_Public', 'Brand_Private', 'Brand_Manufacturer_Rebate',
+                   'Generic_Public', 'Generic_Private', 'Generic_Manufacturer_Rebate'):
+        table[column] = [round(rng.uniform(1, 50), 2) for _ in range(rows)]
+    return table
+
+
+# get_drug_price before the pricing engine: a pandas boolean scan per lookup,
+# plus a second scan for the rebate
+def dataframe_price(df, medication, category, medication_type, rebate):
+    try:
+        price = df.loc[df['Medication'].str.lower() == medication.lower(), f'{medication_type}_{category}'].values[0]
+    except IndexError:
+        return None
+    if rebate:
+        price -= df.loc[df['Medication'].str.lower() == medication.lower(), f'{medication_type}_Manufacturer_Rebate'].values[0]
+    return price
+
+
+# Single and batch price lookups: pandas scan vs. PricingEngine
+def bench_pricing(sizes, lookups=200, cart_size=1000):
+    import pandas as pd
+    rng = random.Random(2)
+    for size in sizes:
+        table = synthetic_pricing_table(size)
+        df = pd.DataFrame(table)
+        start = time.perf_counter()
+        engine = Wellbot.PricingEngine.from_table(table)
+        print(f"\n{size} catalog rows: engine built in {time.perf_counter() - start:.3f}s")
+
+        queries = [(rng.choice(table['Medication']), rng.choice(Wellbot.PRICE_CATEGORIES),
+                    rng.choice(Wellbot.MEDICATION_TYPES), rng.random() < 0.5) for _ in range(lookups)]
+        scan_lookups = queries[:max(5, lookups // (1 + size // 10_000))]
+        samples = []
+        for query in scan_lookups:
+            start = time.perf_counter()
+            dataframe_price(df, *query)
+            samples.append(time.perf_counter() - start)
+        report(f"pandas scan ({size} rows)", samples)
+
+        samples = []
+        for query in queries:
+            start = time.perf_counter()
+            engine.price(*query)
+            samples.append(time.perf_counter() - start)
+        report(f"engine.price ({size} rows)", samples)
+
+        cart = [(rng.choice(table['Medication']), rng.choice(Wellbot.PRICE_CATEGORIES),
+                 rng.choice(Wellbot.MEDICATION_TYPES), rng.random() < 0.5) for _ in range(cart_size)]
+        samples = []
+        for _ in range(20):
+            start = time.perf_counter()
+            engine.cart_total(cart)
+            samples.append((time.perf_counter() - start) / cart_size)
+        report(f"engine.cart_total per item ({size} rows)", samples)
+
+
+# Runs in a fresh interpreter: time and RSS growth for opening a catalog
+CATALOG_PROBE = """
+import json, os, sys, time
+sys.path.insert(0, {repo!r})
+import Wellbot
+
+# (resident, shared) bytes; mapped catalog pages count as shared
+def memory():
+    with open("/proc/self/statm") as f:
+        fields = f.read().split()
+    return int(fields[1]) * os.sysconf("SC_PAGE_SIZE"), int(fields[2]) * os.sysconf("SC_PAGE_SIZE")
+
+rss_before, shared_before = memory()
+start = time.perf_counter()
+engine = Wellbot.load_pricing_engine({path!r})
+engine.price({name!r}, "Public", "Brand")
+elapsed = time.perf_counter() - start
+rss_after, shared_after = memory()
+print(json.dumps({{"seconds": elapsed, "rss": rss_after - rss_before,
+                  "private": (rss_after - shared_after) - (rss_before - shared_before)}}))
+"""
+
+
+# Startup cost of the memory-mapped pricing catalog at several catalog sizes
+def bench_catalog(sizes):
+    import pandas as pd
+    repo = os.path.dirname(os.path.abspath(__file__))
+    for size in sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            table = synthetic_pricing_table(size)
+            path = os.path.join(tmp, "drug_prices.csv")
+            pd.DataFrame(table).to_csv(path, index=False)
+
+            start = time.perf_counter()
+            Wellbot.build_pricing_cache(path, Wellbot.pricing_cache_dir(path))
+            convert = time.perf_counter() - start
+
+            code = CATALOG_PROBE.format(repo=repo, path=path, name=table['Medication'][size // 2])
+            output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+            result = json.loads(output.stdout.strip().splitlines()[-1])
+            print(f"{size:>9} rows: convert {convert:7.2f}s  startup {result['seconds'] * 1000:7.2f}ms  "
+                  f"RSS +{result['rss'] / 1024:8.0f}KiB (private +{result['private'] / 1024:6.0f}KiB)")
+
+
+# Worker for the inventory stress test: reserve one unit at a time until done
+def reserve_worker(args):
+    path, medication, attempts, threads = args
+    inventory = Wellbot.Inventory(path)
+    granted = []
+
+    def run():
+        count = 0
+        for _ in range(attempts // threads):
+            if inventory.reserve(medication) is not None:
+                count += 1
+        granted.append(count)
+
+    workers = [threading.Thread(target=run) for _ in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return sum(granted)
+
+
+# Concurrent reservations against a single SKU from several processes x threads.
+# More reservations are attempted than there is stock; the test fails on oversell.
+def bench_inventory(processes, threads, attempts, stock):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "inventory.db")
+        Wellbot.Inventory(path, {"Amoxicillin": stock})
+        jobs = [(path, "Amoxicillin", attempts // processes, threads)] * processes
+        start = time.perf_counter()
+        with multiprocessing.Pool(processes) as pool:
+            granted = sum(pool.map(reserve_worker, jobs))
+        elapsed = time.perf_counter() - start
+
+        inventory = Wellbot.Inventory(path)
+        left = inventory.available("Amoxicillin")
+        print(f"{processes} processes x {threads} threads, {attempts} attempts on {stock} units")
+        print(f"granted {granted}, available afterwards {left}, "
+              f"{attempts / elapsed:.0f} reservation attempts/sec")
+        assert granted == min(stock, attempts) and left == stock - granted, "inventory oversold!"
+        print("no oversell")
+
+        # A hold that is never committed goes back to stock once it expires,
+        # both on a direct sweep and from the background expiry thread
+        inventory = Wellbot.Inventory(os.path.join(tmp, "holds.db"), {"Amoxicillin": 3}, hold_seconds=0)
+        inventory.reserve("Amoxicillin"), inventory.reserve("Amoxicillin")
+        assert inventory.available("Amoxicillin") == 1
+        assert inventory.release_expired() == 2 and inventory.available("Amoxicillin") == 3, "expired hold kept"
+        inventory.reserve("Amoxicillin")
+        inventory.start_expiry(interval=0.05)
+        deadline = time.monotonic() + 5
+        while inventory.available("Amoxicillin") != 3 and time.monotonic() < deadline:
+            time.sleep(0.05)
+        inventory.stop_expiry()
+        assert inventory.available("Amoxicillin") == 3, "expiry thread did not release the hold"
+        print("expired holds released")
+
+        # The first refill ships the unit held at submission; later refills take their own
+        engine_dir = os.path.join(tmp, "engine")
+        os.mkdir(engine_dir)
+        engine = scratch_engine(engine_dir, 1, stock=5)
+        prescription_number = engine.order_prescription("Amoxicillin", "500mg", "Take daily", 2)["prescription_number"]
+        assert engine.inventory.available("Amoxicillin") == 4
+        assert engine.refill(prescription_number, "user0")["ok"]
+        assert engine.inventory.available("Amoxicillin") == 4, "refill left the submission hold behind"
+        assert engine.inventory.release_expired() == 0
+        assert engine.refill(prescription_number, "user0")["ok"]
+        assert engine.inventory.available("Amoxicillin") == 3
+        print("refill commits the prescription's own hold")
+
+        # Another worker selling out an alternative (a separate connection, so no
+        # listener fires here) must drop it from this worker's recommendations
+        path = os.path.join(tmp, "alternatives.db")
+        inventory = Wellbot.Inventory(path, {"Lisinopril": 0, "Losartan": 2, "Amlodipine": 1})
+        alternatives = Wellbot.AlternativesIndex(Wellbot.THERAPEUTIC_CLASSES, inventory=inventory)
+        inventory.listeners.append(alternatives.update)
+        assert alternatives.recommend("Lisinopril") == [("Losartan", 2), ("Amlodipine", 1)]
+        other_worker = Wellbot.Inventory(path)
+        other_worker.reserve("Losartan", 2)
+        assert alternatives.recommend("Lisinopril") == [("Amlodipine", 1)], "recommended a sold-out alternative"
+        inventory.reserve("Amlodipine")
+        assert alternatives.recommend("Lisinopril") == []
+        print("alternatives follow other workers' stock changes")
+
+
+# Worker for the ID test: allocate count numbers and return them as an array
+def allocate_worker(args):
+    import numpy as np
+    path, count, block_size = args
+    allocator = Wellbot.PrescriptionNumberAllocator(path, block_size=block_size)
+    next_number = allocator.next_number
+    start = time.perf_counter()
+    numbers = np.fromiter((next_number() for _ in range(count)), dtype=np.int64, count=count)
+    return numbers, time.perf_counter() - start
+
+
+# Allocate total prescription numbers across several processes and prove uniqueness
+def bench_ids(total, processes, block_size):
+    import numpy as np
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "rx_sequence")
+        jobs = [(path, total // processes, block_size)] * processes
+        start = time.perf_counter()
+        with multiprocessing.Pool(processes) as pool:
+            results = pool.map(allocate_worker, jobs)
+        elapsed = time.perf_counter() - start
+
+        numbers = np.concatenate([numbers for numbers, _ in results])
+        unique = len(np.unique(numbers))
+        per_process = statistics.mean(count / seconds for count, seconds in
+                                      ((len(numbers), seconds) for numbers, seconds in results))
+        print(f"{len(numbers)} IDs from {processes} processes in {elapsed:.2f}s "
+              f"({len(numbers) / elapsed / 1e6:.2f}M/sec total, {per_process / 1e6:.2f}M/sec per process)")
+        assert unique == len(numbers), f"{len(numbers) - unique} duplicate prescription numbers!"
+        print("all prescription numbers unique")
+
+        allocator = Wellbot.PrescriptionNumberAllocator(path, block_size=block_size)
+        start = time.perf_counter()
+        for _ in range(1_000_000):
+            allocator.allocate()
+        print(f"formatted RX numbers: {1 / (time.perf_counter() - start):.2f}M/sec")
+
+        # A child forked after the parent leased a block must lease its own
+        if hasattr(os, "fork"):
+            allocator = Wellbot.PrescriptionNumberAllocator(os.path.join(tmp, "fork_sequence"), block_size=block_size)
+            parent_first = allocator.next_number()
+            read_end, write_end = os.pipe()
+            pid = os.fork()
+            if pid == 0:
+                os.close(read_end)
+                os.write(write_end, str(allocator.next_number()).encode())
+                os._exit(0)
+            os.close(write_end)
+            with os.fdopen(read_end) as f:
+                child_first = int(f.read())
+            os.waitpid(pid, 0)
+            assert not parent_first <= child_first < parent_first + block_size, \
+                "forked child reused the parent's block"
+            assert allocator.next_number() == parent_first + 1
+            print("forked child leases its own block")
+
+
+# Synthetic customer reviews; unique=False draws from a small pool so the cache is exercised
+def synthetic_reviews(count, unique=True, seed=0):
+    rng = random.Random(seed)
+    openings = ["The delivery was", "Pharmacist support was", "Ordering my refill was", "The website is",
+                "Customer service was", "Getting my prescription transferred was"]
+    opinions = ["great", "really slow", "fantastic and friendly", "terrible", "okay I guess", "confusing",
+                "quick and easy", "not good at all", "excellent", "frustrating"]
+    pool = count if unique else 500
+    reviews = [f"{rng.choice(openings)} {rng.choice(opinions)}. Order {i}" if unique
+               else f"{rng.choice(openings)} {rng.choice(opinions)}." for i in range(pool)]
+    return [reviews[i % pool] if unique else rng.choice(reviews) for i in range(count)]
+
+
+# Reviews/sec for the old per-review analyzer and the shared, cached and batch paths
+def bench_sentiment(count, processes):
+    from nltk.sentiment.vader import SentimentIntensityAnalyzer
+    reviews = synthetic_reviews(count)
+
+    sample = reviews[:200]
+    start = time.perf_counter()
+    for review in sample:
+        SentimentIntensityAnalyzer().polarity_scores(review)
+    print(f"new analyzer per review:     {len(sample) / (time.perf_counter() - start):10.0f} reviews/sec")
+
+    Wellbot.analyze_sentiment.cache_clear()
+    start = time.perf_counter()
+    for review in reviews:
+        Wellbot.analyze_sentiment(review)
+    print(f"shared analyzer, single:     {count / (time.perf_counter() - start):10.0f} reviews/sec")
+
+    Wellbot.analyze_sentiment.cache_clear()
+    duplicates = synthetic_reviews(count, unique=False)
+    start = time.perf_counter()
+    for review in duplicates:
+        Wellbot.analyze_sentiment(review)
+    print(f"shared analyzer, duplicates: {count / (time.perf_counter() - start):10.0f} reviews/sec "
+          f"({Wellbot.analyze_sentiment.cache_info().hits} cache hits)")
+
+    start = time.perf_counter()
+    labels = sum(1 for _ in Wellbot.analyze_sentiments(reviews, processes=processes))
+    print(f"batch, {processes} processes:          {labels / (time.perf_counter() - start):10.0f} reviews/sec")
+
+
+# Cold start: import profile plus wall clock from launch to the login menu prompt.
+# Exits non-zero when the median time to the first prompt is over budget.
+def bench_startup(runs, budget_ms):
+    repo = os.path.dirname(os.path.abspath(__file__))
+    script = os.path.join(repo, "Wellbot.py")
+
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import Wellbot"],
+                            cwd=repo, capture_output=True, text=True, check=True)
+    imports = []
+    for line in result.stderr.splitlines():
+        parts = line.split("|")
+        if len(parts) == 3 and parts[1].strip().isdigit():
+            imports.append((int(parts[1]), parts[2].rstrip()))
+    print("slowest imports (cumulative):")
+    for cumulative, name in sorted(imports, reverse=True)[:10]:
+        print(f"  {cumulative / 1000:8.1f}ms {name}")
+
+    samples = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for _ in range(runs):
+            start = time.perf_counter()
+            process = subprocess.Popen([sys.executable, "-u", script], cwd=tmp,
+                                       stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+            output = b""
+            while b"Enter your choice: " not in output:
+                chunk = process.stdout.read1(4096)
+                if not chunk:
+                    raise RuntimeError(f"WellBot exited before the first prompt: {output!r}")
+                output += chunk
+            samples.append(time.perf_counter() - start)
+            process.communicate(b"3\n", timeout=30)
+
+    median = statistics.median(samples) * 1000
+    print(f"time to first prompt: median {median:.1f}ms, best {min(samples) * 1000:.1f}ms "
+          f"(budget {budget_ms:.0f}ms)")
+    if median > budget_ms:
+        sys.exit(f"startup over budget: {median:.1f}ms > {budget_ms:.0f}ms")
+
+
+# A stand-in OpenFDA label so drug_info sessions never touch the network
+SAMPLE_LABEL = {
+    "set_id": "8d6c2e0a-0000-4000-8000-000000000001", "effective_time": "20250101",
+    "openfda": {"brand_name": ["Amoxil"], "manufacturer_name": ["WellBot Labs"]},
+    "dosage_and_administration": ["Take 500 mg every 12 hours."],
+    "warnings": ["Do not use if allergic to penicillin."],
+    "indications_and_usage": ["Bacterial infections."],
+    "drug_interactions": ["Probenecid."],
+}
+
+
+# One scripted customer session against the engine: log in, order, price,
+# stock check, order status, refill, label lookup and a rating
+def engine_session(engine, username, rng):
+    assert engine.login(username, "pw")["ok"]
+    medication = rng.choice(Wellbot.STOCK_DATA["Medication"])
+    order = engine.order_prescription(medication, "10mg", "Once daily", 2, rng.random() < 0.5, "555-0100")
+    number = order["prescription_number"]
+    engine.drug_price(medication.lower(), "Public", "Generic", rng.random() < 0.2)
+    engine.check_stock(medication)
+    assert engine.order_status(number)["ok"]
+    engine.refill(number, username)
+    assert engine.drug_info("Amoxicillin")["ok"]
+    engine.submit_feedback(rating=str(rng.randint(1, 10)), username=username)
+
+
+# WellBotEngine over throw-away stores in tmp, with users user0..user{users-1}
+# (password "pw") and a stand-in label so nothing touches the network
+def scratch_engine(tmp, users, stock):
+    # Users and prescriptions in one SQLite database, like the module-level stores
+    db_path = os.path.join(tmp, "wellbot.db")
+    user_store = Wellbot.UserStore(store=Wellbot.SQLiteStore(db_path, "users"), iterations=1)
+    user_store.store.put_many({f"user{i}": {"name": f"user{i}", **Wellbot.hash_password("pw", iterations=1)}
+                               for i in range(users)})
+    engine = Wellbot.WellBotEngine(
+        store=Wellbot.SQLiteStore(db_path, "prescriptions"),
+        users=user_store,
+        numbers=Wellbot.PrescriptionNumberAllocator(os.path.join(tmp, "rx_sequence")),
+        inventory=Wellbot.Inventory(os.path.join(tmp, "inventory.db"),
+                                    {name: stock for name in Wellbot.STOCK_DATA["Medication"]}),
+        delivery=Wellbot.DeliveryTracker(os.path.join(tmp, "delivery_events.log"),
+                                         os.path.join(tmp, "delivery_status.json")))
+    Wellbot.RATINGS_LOG = os.path.join(tmp, "ratings.ndjson")
+    Wellbot.medication_info_cache = Wellbot.MedicationInfoCache()
+    Wellbot.medication_info_cache.set("Amoxicillin", SAMPLE_LABEL)
+    # Warm the pricing engine and name index before timing
+    engine.drug_price("amoxicillin", "Public", "Generic")
+    engine.resolve("amoxicillin")
+    return engine
+
+
+# In-process throughput of scripted sessions through WellBotEngine
+def bench_engine(sessions, users, stock):
+    rng = random.Random(0)
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = scratch_engine(tmp, users, stock)
+        samples = []
+        start = time.perf_counter()
+        for i in range(sessions):
+            session_start = time.perf_counter()
+            engine_session(engine, f"user{i % users}", rng)
+            samples.append(time.perf_counter() - session_start)
+        elapsed = time.perf_counter() - start
+        engine.store.close()
+        report(f"session ({sessions} sessions)", samples)
+        print(f"{sessions / elapsed:.0f} sessions/sec in one process")
+
+
+# Customer messages for one conversation: log in, submit a prescription, check
+# stock, read a label section and leave
+def dialog_script(username, medication):
+    return ["1", username, "pw",
+            "1", "2", medication, "10mg", "Once daily", "1", "n", "n",
+            "2", "2", medication, "n", "4",
+            "3", "Amoxicillin", "1", "no",
+            "5"]
+
+
+# Many conversations multiplexed in one process, one message per session per
+# round. Halfway through, every session is serialized to JSON and resumed from
+# it, which also measures the size of a parked session.
+def bench_dialog(sessions, users, stock):
+    import tracemalloc
+    rng = random.Random(0)
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = scratch_engine(tmp, users, stock)
+        scripts = [dialog_script(f"user{i % users}", rng.choice(Wellbot.STOCK_DATA["Medication"]))
+                   for i in range(sessions)]
+        states = [Wellbot.start_session()[0] for _ in range(sessions)]
+        rounds = len(scripts[0])
+        samples = []
+        elapsed = 0.0
+        for round_number in range(rounds):
+            if round_number == rounds // 2:
+                parked = [json.dumps(session) for session in states]
+                tracemalloc.start()
+                before = tracemalloc.get_traced_memory()[0]
+                states = [json.loads(session) for session in parked]
+                per_session = (tracemalloc.get_traced_memory()[0] - before) / sessions
+                tracemalloc.stop()
+                print(f"parked session: {statistics.mean(map(len, parked)):.0f} bytes as JSON, "
+                      f"{per_session:.0f} bytes in memory")
+            start = time.perf_counter()
+            for session, script in zip(states, scripts):
+                message_start = time.perf_counter()
+                Wellbot.step(session, script[round_number], engine)
+                samples.append(time.perf_counter() - message_start)
+            elapsed += time.perf_counter() - start
+        engine.store.close()
+        assert all(session["state"] == "closed" for session in states), "a scripted conversation went off track"
+        report(f"message ({sessions} concurrent sessions)", samples)
+        print(f"{len(samples) / elapsed:.0f} messages/sec, {sessions / elapsed:.0f} conversations/sec in one process")
+
+# Local stand-in for the OpenFDA label endpoint that answers every query with SAMPLE_LABEL
+# (server.label_requests lists one entry per request served; delay slows every answer)
+def start_openfda_standin(delay=0.0):
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    body = json.dumps({"results": [SAMPLE_LABEL]}).encode("utf-8")
+    label_requests = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            label_requests.append(self.path)
+            time.sleep(delay)
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.label_requests = label_requests
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}/drug/label.json"
+
+
+# Stub OpenFDA label endpoint with a scripted answer per drug name.
+# responses maps a name to the statuses of its successive requests (the last one
+# repeats; "empty" is a 200 with no results); other names get the label. Names
+# in slow are answered after delay seconds. server.calls counts requests per name.
+def start_openfda_stub(responses, slow=(), delay=0.05):
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    from urllib.parse import parse_qs, urlsplit
+    label = json.dumps({"results": [SAMPLE_LABEL]}).encode("utf-8")
+    empty = json.dumps({"results": []}).encode("utf-8")
+    calls = Counter()
+    lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            search = parse_qs(urlsplit(self.path).query).get("search", [""])[0]
+            name = search.split(":", 1)[-1].strip('"').lower()
+            with lock:
+                calls[name] += 1
+                statuses = responses.get(name, [200])
+                status = statuses[min(calls[name], len(statuses)) - 1]
+            if name in slow:
+                time.sleep(delay)
+            body = empty if status == "empty" else label if status == 200 else b'{"error": {}}'
+            self.send_response(200 if status == "empty" else status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.calls = calls
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}/drug/label.json"
+
+
+# Drug label lookups against a stub OpenFDA: which answers are cached (labels,
+# 404 and empty results) and which are not (other errors), retries of 429/5xx,
+# cached vs. upstream latency, and coalescing in the async client
+def bench_openfda(lookups=1000):
+    import asyncio
+    retries = Wellbot.OPENFDA_RETRIES
+    # name: (status script, label expected, answer cached, upstream calls for the first lookup)
+    cases = {
+        "amoxicillin": ([200], True, True, 1),
+        "nosuchdrug": ([404], False, True, 1),
+        "emptydrug": (["empty"], False, True, 1),
+        "baddrug": ([400], False, False, 1),
+        "forbiddendrug": ([403], False, False, 1),
+        "flakydrug": ([503, 200], True, True, 2),
+        "throttleddrug": ([429], False, False, retries + 1),
+    }
+    server, url = start_openfda_stub({**{name: case[0] for name, case in cases.items()}, "outagedrug": [503]},
+                                     slow={"slowdrug1", "slowdrug2"})
+    with tempfile.TemporaryDirectory() as tmp:
+        Wellbot.OPENFDA_LABEL_URL = url
+        Wellbot.LABEL_INDEX_PATH = os.path.join(tmp, "drug_labels.db")
+        Wellbot.medication_info_cache = Wellbot.MedicationInfoCache(maxsize=max(512, lookups))
+        for name, (_, found, cached, first_calls) in cases.items():
+            medication_info = Wellbot.fetch_medication_info(name)
+            assert (medication_info is not None) == found, f"{name}: got {medication_info!r}"
+            assert server.calls[name] == first_calls, f"{name}: {server.calls[name]} upstream calls"
+            Wellbot.fetch_medication_info(name)
+            expected = first_calls if cached else 2 * first_calls
+            assert server.calls[name] == expected, f"{name}: cached={cached} but {server.calls[name]} calls"
+            print(f"{name:<14} {'label' if found else 'None':<6} {'cached' if cached else 'not cached':<11}"
+                  f"{first_calls} upstream call(s)")
+
+        samples = []
+        for i in range(lookups):
+            start = time.perf_counter()
+            Wellbot.fetch_medication_info(f"drug{i}")
+            samples.append(time.perf_counter() - start)
+        report("upstream lookup", samples)
+        samples = []
+        for i in range(lookups):
+            start = time.perf_counter()
+            Wellbot.fetch_medication_info(f"drug{i}")
+            samples.append(time.perf_counter() - start)
+        report("cached lookup", samples)
+
+        def upstream_calls_for(name):
+            before = server.calls[name]
+            Wellbot.fetch_medication_info(name)
+            return server.calls[name] - before
+
+        # Memory tier: labels expire after ttl, "not found" answers after the
+        # shorter negative_ttl, and the least recently used entry is evicted first
+        Wellbot.medication_info_cache = Wellbot.MedicationInfoCache(maxsize=2, ttl=0.6, negative_ttl=0.2)
+        assert upstream_calls_for("ttldrug") == 1 and upstream_calls_for("nosuchdrug") == 1
+        time.sleep(0.3)
+        assert upstream_calls_for("nosuchdrug") == 1, "negative answer outlived negative_ttl"
+        assert upstream_calls_for("ttldrug") == 0, "label expired before its ttl"
+        time.sleep(0.4)
+        assert upstream_calls_for("ttldrug") == 1, "label outlived its ttl"
+        assert Wellbot.medication_info_cache.memory.expirations == 2
+        Wellbot.medication_info_cache = Wellbot.MedicationInfoCache(maxsize=2)
+        upstream_calls_for("lrudrug1"), upstream_calls_for("lrudrug2")
+        upstream_calls_for("lrudrug1")
+        upstream_calls_for("lrudrug3")
+        assert upstream_calls_for("lrudrug1") == 0 and upstream_calls_for("lrudrug2") == 1, "evicted the wrong entry"
+        print("memory tier: ttl and negative ttl expiry, least recently used entry evicted")
+
+        # Disk tier: answers survive a restart (a new cache on the same file) until they expire
+        disk_path = os.path.join(tmp, "label_cache.db")
+        Wellbot.medication_info_cache = Wellbot.MedicationInfoCache(ttl=60, negative_ttl=0.2, disk_path=disk_path)
+        assert upstream_calls_for("diskdrug") == 1 and upstream_calls_for("nosuchdrug") == 1
+        Wellbot.medication_info_cache = Wellbot.MedicationInfoCache(ttl=60, negative_ttl=0.2, disk_path=disk_path)
+        assert upstream_calls_for("diskdrug") == 0 and upstream_calls_for("nosuchdrug") == 0, "lost on restart"
+        assert Wellbot.medication_info_cache.disk.hits == 2
+        time.sleep(0.3)
+        Wellbot.medication_info_cache = Wellbot.MedicationInfoCache(ttl=60, negative_ttl=0.2, disk_path=disk_path)
+        assert upstream_calls_for("nosuchdrug") == 1, "expired answer served from disk"
+        assert upstream_calls_for("diskdrug") == 0
+        print("disk tier: answers survive a restart, expired ones are fetched again")
+
+        async def concurrent_fetches():
+            client = Wellbot.AsyncOpenFDAClient(cache=Wellbot.MedicationInfoCache())
+            try:
+                results = await client.fetch_many([f"slowdrug{i % 2 + 1}" for i in range(100)])
+            finally:
+                client.close()
+            return results, client.upstream_calls
+
+        results, upstream_calls = asyncio.run(concurrent_fetches())
+        assert all(results) and upstream_calls == 2, f"{upstream_calls} upstream calls for 2 drugs"
+        print(f"async client: 100 concurrent lookups of 2 drugs, {upstream_calls} upstream calls")
+
+        # A chat message makes one capped upstream lookup: when OpenFDA is down the
+        # dialog step gets the failed prefetch instead of retrying on its own
+        async def chat_lookup(name):
+            chat = Wellbot.ChatServer(port=0, workers=2)
+            await chat.start()
+            try:
+                return await chat.reply(dict(Wellbot.new_session(), state="info_medication"), name)
+            finally:
+                await chat.shutdown(grace=0)
+
+        reply = asyncio.run(chat_lookup("outagedrug"))
+        assert "not found" in reply and server.calls["outagedrug"] == retries + 1, server.calls["outagedrug"]
+        print(f"chat lookup during an outage: {server.calls['outagedrug']} upstream call(s)")
+    server.shutdown()
+
+
+# A generated OpenFDA drug/label bulk download of count labels, all at one effective_time
+def write_label_dump(path, count, effective_time, wording):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write('{"meta": {"results": {"total": %d}}, "results": [' % count)
+        for i in range(count):
+            f.write(("," if i else "") + json.dumps({
+                "set_id": f"set-{i:08d}", "id": f"doc-{i:08d}-{effective_time}",
+                "effective_time": effective_time,
+                "openfda": {"brand_name": [f"Brand{i} Extra Strength"], "generic_name": [f"generic{i}"],
+                            "manufacturer_name": ["Wellbot Labs"], "route": ["ORAL"]},
+                "indications_and_usage": [f"{wording} relief of symptoms {i}"],
+                "warnings": ["Keep out of reach of children."],
+                "drug_interactions": ["None known."],
+                "dosage_and_administration": [f"Take {i % 3 + 1} tablets daily."],
+                "spl_product_data_elements": ["dropped"],
+            }))
+        f.write("]}")
+
+
+# Local label index: import a generated dump, re-import a newer version of
+# every label and an older one, and check that each set_id is kept once with
+# its newest label, that stale text is gone from the full-text index and that
+# re-importing costs about as much as the first import
+def bench_labels(count):
+    with tempfile.TemporaryDirectory() as tmp:
+        index_path = os.path.join(tmp, "drug_labels.db")
+        timings = {}
+        for effective_time, wording in [("20250101", "original"), ("20260101", "revised"),
+                                        ("20240101", "superseded")]:
+            dump = os.path.join(tmp, f"labels_{effective_time}.json")
+            write_label_dump(dump, count, effective_time, wording)
+            start = time.perf_counter()
+            assert Wellbot.import_label_dumps([dump], index_path) == count
+            timings[wording] = time.perf_counter() - start
+
+        index = Wellbot.LabelIndex(index_path)
+        labels, set_ids = index._db.execute("SELECT COUNT(*), COUNT(DISTINCT set_id) FROM labels").fetchone()
+        names = index._db.execute("SELECT COUNT(*) FROM names").fetchone()[0]
+        assert labels == set_ids == count, f"{labels} labels for {set_ids} set_ids"
+        assert names == 2 * count, f"{names} name rows for {count} labels"
+        i = count // 2
+        label = index.lookup(f"brand{i} extra strength")
+        assert label["indications_and_usage"] == [f"revised relief of symptoms {i}"], label
+        assert "spl_product_data_elements" not in label and "route" not in label["openfda"]
+        assert index.lookup(f"generic{i}") == label
+        assert index.find(f"brand{i}") == label, "full-text fallback missed the brand name"
+        assert index.find("nosuchbrand") is None
+        assert len(index.search("revised", limit=count)) == count and not index.search("original")
+        assert not index.search("superseded")
+        index.close()
+        assert timings["revised"] < 3 * timings["original"] + 0.5, f"re-import took {timings['revised']:.2f}s"
+        print(f"{count} labels: first import {timings['original']:.2f}s, newer re-import "
+              f"{timings['revised']:.2f}s, older re-import {timings['superseded']:.2f}s")
+
+
+# One conversation over a WebSocket; appends the latency of each reply to samples
+async def ws_conversation(host, port, script, samples):
+    import asyncio
+    import base64
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        key = base64.b64encode(os.urandom(16)).decode("ascii")
+        writer.write(f"GET /ws HTTP/1.1\r\nHost: {host}:{port}\r\nUpgrade: websocket\r\n"
+                     f"Connection: Upgrade\r\nSec-WebSocket-Key: {key}\r\n"
+                     "Sec-WebSocket-Version: 13\r\n\r\n".encode("latin-1"))
+        head = await reader.readuntil(b"\r\n\r\n")
+        if not head.startswith(b"HTTP/1.1 101"):
+            raise RuntimeError(f"WebSocket upgrade refused: {head.splitlines()[0]!r}")
+        await Wellbot.read_ws_message(reader, writer, mask=True)
+        for message in script:
+            start = time.perf_counter()
+            writer.write(Wellbot.encode_ws_frame(Wellbot.WS_TEXT, message.encode("utf-8"), mask=True))
+            opcode, _ = await Wellbot.read_ws_message(reader, writer, 1 << 20, mask=True)
+            samples.append(time.perf_counter() - start)
+            if opcode == Wellbot.WS_CLOSE:
+                raise RuntimeError("server closed the conversation early")
+        opcode, _ = await Wellbot.read_ws_message(reader, writer, mask=True)
+        writer.write(Wellbot.encode_ws_frame(Wellbot.WS_CLOSE, (1000).to_bytes(2, "big"), mask=True))
+    finally:
+        writer.close()
+
+
+async def http_request(reader, writer, method, path, payload=None):
+    body = json.dumps(payload).encode("utf-8") if payload is not None else b""
+    writer.write(f"{method} {path} HTTP/1.1\r\nHost: wellbot\r\nContent-Type: application/json\r\n"
+                 f"Content-Length: {len(body)}\r\n\r\n".encode("latin-1") + body)
+    head = (await reader.readuntil(b"\r\n\r\n")).decode("latin-1").lower()
+    status = int(head.split(" ", 2)[1])
+    length = int(head.split("content-length:", 1)[1].split("\r\n", 1)[0])
+    return status, json.loads(await reader.readexactly(length))
+
+
+# One conversation over keep-alive HTTP; 503 answers are counted and retried
+async def http_conversation(host, port, script, samples, rejected):
+    import asyncio
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        while True:
+            status, data = await http_request(reader, writer, "POST", "/sessions")
+            if status != 503:
+                break
+            rejected[0] += 1
+            await asyncio.sleep(0.05)
+        path = f"/sessions/{data['session_id']}"
+        for message in script:
+            start = time.perf_counter()
+            while True:
+                status, data = await http_request(reader, writer, "POST", path, {"message": message})
+                if status != 503:
+                    break
+                rejected[0] += 1
+                await asyncio.sleep(0.05)
+            samples.append(time.perf_counter() - start)
+            if status != 200:
+                raise RuntimeError(f"HTTP {status}: {data}")
+    finally:
+        writer.close()
+
+
+# Load generator: conversations against a chat server, at most concurrency at a time
+async def chat_load(host, port, transport, conversations, concurrency):
+    import asyncio
+    rng = random.Random(0)
+    samples, errors, rejected = [], Counter(), [0]
+    limit = asyncio.Semaphore(concurrency)
+
+    async def conversation(i):
+        script = ["2", f"load{i}", "pw"] + dialog_script(None, rng.choice(Wellbot.STOCK_DATA["Medication"]))[3:]
+        async with limit:
+            try:
+                if transport == "ws":
+                    await ws_conversation(host, port, script, samples)
+                else:
+                    await http_conversation(host, port, script, samples, rejected)
+            except (OSError, ValueError, RuntimeError, asyncio.IncompleteReadError) as e:
+                errors[type(e).__name__] += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(conversation(i) for i in range(conversations)))
+    return samples, errors, rejected[0], time.perf_counter() - start
+
+
+# Start `Wellbot.py --serve` on scratch stores in a subprocess, drive simulated
+# customers against it and shut it down with SIGTERM
+def bench_chat(transport, conversations, concurrency, workers, processes=1):
+    import asyncio
+    import signal
+    repo = os.path.dirname(os.path.abspath(__file__))
+    # A slow stand-in, so the first conversations' label lookups overlap
+    standin, openfda_url = start_openfda_standin(delay=0.05)
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ, WELLBOT_OPENFDA_URL=openfda_url, WELLBOT_LABEL_CACHE="",
+                   WELLBOT_KDF_ITERATIONS="1000",
+                   WELLBOT_PRICING_CATALOG=os.path.join(repo, "drug_prices.csv"))
+        server = subprocess.Popen([sys.executable, "-u", os.path.join(repo, "Wellbot.py"), "--serve",
+                                   "--port", "0", "--workers", str(workers), "--processes", str(processes)],
+                                  cwd=tmp, env=env, stdout=subprocess.PIPE, text=True)
+        try:
+            banner = server.stdout.readline()
+            port = int(banner.split("http://", 1)[1].split()[0].rsplit(":", 1)[1])
+            samples, errors, rejected, elapsed = asyncio.run(
+                chat_load("127.0.0.1", port, transport, conversations, concurrency))
+        finally:
+            server.send_signal(signal.SIGTERM)
+            output, _ = server.communicate(timeout=60)
+        standin.shutdown()
+
+    report(f"reply over {transport} ({concurrency} concurrent)", samples)
+    print(f"{len(samples) / elapsed:.0f} messages/sec, {conversations / elapsed:.0f} conversations/sec, "
+          f"{rejected} busy (503) retries, errors: {dict(errors) or 'none'}")
+    print(f"server: {output.strip().splitlines()[-1] if output.strip() else 'no output'} (exit code {server.returncode})")
+    # Every conversation reads the same label: one upstream call per worker process
+    label_requests = len(standin.label_requests)
+    print(f"OpenFDA stand-in: {label_requests} label requests for {conversations} conversations")
+    assert label_requests <= processes, "label lookups were not coalesced"
+
+# Worker for the scaling test: scripted sessions against the shared database
+def scaling_worker(args):
+    tmp, sessions, users, seed = args
+    engine = Wellbot.shared_engine(os.path.join(tmp, "wellbot.db"),
+                                   inventory=Wellbot.Inventory(os.path.join(tmp, "inventory.db")),
+                                   delivery=Wellbot.DeliveryTracker(os.path.join(tmp, "delivery_events.log"),
+                                                                    os.path.join(tmp, "delivery_status.json")))
+    engine.numbers = Wellbot.PrescriptionNumberAllocator(os.path.join(tmp, "rx_sequence"))
+    Wellbot.RATINGS_LOG = os.path.join(tmp, "ratings.ndjson")
+    Wellbot.medication_info_cache = Wellbot.MedicationInfoCache()
+    Wellbot.medication_info_cache.set("Amoxicillin", SAMPLE_LABEL)
+    engine.drug_price("amoxicillin", "Public", "Generic")
+    rng = random.Random(seed)
+    start = time.perf_counter()
+    for _ in range(sessions):
+        engine_session(engine, f"user{rng.randrange(users)}", rng)
+    elapsed = time.perf_counter() - start
+    engine.close()
+    return elapsed
+
+
+# Scripted sessions/sec with 1..N worker processes sharing one SQLite database
+# (the --serve --processes N storage setup)
+def bench_scaling(process_counts, sessions, users, stock):
+    with tempfile.TemporaryDirectory() as tmp:
+        seed_store = Wellbot.SQLiteStore(os.path.join(tmp, "wellbot.db"), "users")
+        seed_store.put_many({f"user{i}": {"name": f"user{i}", **Wellbot.hash_password("pw", iterations=1)}
+                             for i in range(users)})
+        seed_store.close()
+        Wellbot.Inventory(os.path.join(tmp, "inventory.db"),
+                          {name: stock for name in Wellbot.STOCK_DATA["Medication"]})
+
+        baseline = None
+        for processes in process_counts:
+            jobs = [(tmp, sessions, users, seed) for seed in range(processes)]
+            with multiprocessing.Pool(processes) as pool:
+                elapsed = max(pool.map(scaling_worker, jobs))
+            rate = processes * sessions / elapsed
+            baseline = baseline or rate
+            print(f"{processes:3d} processes: {rate:8.0f} sessions/sec  "
+                  f"{rate / baseline:5.2f}x (ideal {processes / process_counts[0]:.0f}x)")
+    print(f"({os.cpu_count()} CPUs available)")
+
+# Courier feed import, status lookups and status listings on the delivery tracker
+def bench_delivery(events, orders):
+    statuses = ["Processing", "Shipped", "Out for Delivery", "Delivered", "On Hold", "Canceled", "Rescheduled"]
+    rng = random.Random(0)
+    with tempfile.TemporaryDirectory() as tmp:
+        feed = os.path.join(tmp, "courier_feed.csv")
+        with open(feed, "w") as f:
+            f.write("prescription_number,status,timestamp\n")
+            now = time.time()
+            for i in range(events):
+                f.write(f"RX{rng.randrange(orders):010d},{rng.choice(statuses)},{now + i * 1e-3:.3f}\n")
+        paths = (os.path.join(tmp, "delivery_events.log"), os.path.join(tmp, "delivery_status.json"))
+
+        tracker = Wellbot.DeliveryTracker(*paths)
+        start = time.perf_counter()
+        count = tracker.import_feed(feed)
+        elapsed = time.perf_counter() - start
+        print(f"courier feed: {count} events in {elapsed:.2f}s ({count / elapsed:.0f} events/sec), "
+              f"{len(tracker)} orders tracked")
+
+        samples = []
+        for _ in range(10_000):
+            prescription_number = f"RX{rng.randrange(orders):010d}"
+            start = time.perf_counter()
+            tracker.get(prescription_number)
+            samples.append(time.perf_counter() - start)
+        report("status lookup", samples)
+
+        start = time.perf_counter()
+        on_hold = tracker.with_status("On Hold")
+        print(f"list 'On Hold': {len(on_hold)} orders in {(time.perf_counter() - start) * 1000:.1f}ms")
+
+        # A second tracker on the same files (another worker process) sees new events
+        other = Wellbot.DeliveryTracker(*paths)
+        start = time.perf_counter()
+        assert other.counts() == tracker.counts()
+        print(f"cold load by a second process: {time.perf_counter() - start:.2f}s")
+        tracker["RX9999999999"] = "Canceled"
+        assert other.get("RX9999999999") == "Canceled", "event from another writer not picked up"
+        tracker.close()
+        other.checkpoint()
+        start = time.perf_counter()
+        restarted = Wellbot.DeliveryTracker(*paths)
+        assert restarted.get("RX9999999999") == "Canceled"
+        print(f"restart from checkpoint: {time.perf_counter() - start:.2f}s")
+
+        # A courier event that arrives late does not overwrite a newer status,
+        # and ISO-8601 timestamps order the same way as epoch seconds
+        late = os.path.join(tmp, "late_feed.ndjson")
+        with open(late, "w") as f:
+            for number, status, timestamp in [("RX9999999998", "Delivered", "2026-05-02T10:00:00Z"),
+                                              ("RX9999999998", "Shipped", "2026-05-01T10:00:00+00:00"),
+                                              ("RX9999999998", "Out for Delivery", 1777629600.0)]:
+                f.write(json.dumps({"prescription_number": number, "status": status,
+                                    "timestamp": timestamp}) + "\n")
+        assert restarted.import_feed(late) == 3
+        assert restarted.get("RX9999999998") == "Delivered", "older event overwrote a newer status"
+        restarted.checkpoint()
+        assert Wellbot.DeliveryTracker(*paths).get("RX9999999998") == "Delivered"
+
+        # A malformed feed is reported with the file and line
+        for name, content, problem in [("no_status.csv", "prescription_number,timestamp\nRX1,1\n", "status"),
+                                       ("bad_time.csv", "prescription_number,status,timestamp\nRX1,Shipped,soon\n",
+                                        "line 2"),
+                                       ("short_row.csv", "prescription_number,status\nRX1\n", "line 2")]:
+            bad = os.path.join(tmp, name)
+            with open(bad, "w") as f:
+                f.write(content)
+            try:
+                restarted.import_feed(bad)
+            except ValueError as e:
+                assert name in str(e) and problem in str(e), e
+            else:
+                raise AssertionError(f"{name} accepted")
+        restarted.close()
+        print("late events and malformed feeds: ok")
+
+
+# Prescription lookups by number and by secondary key through the repository,
+# over the single-process log store and over the shared SQLite store, where a
+# second repository stands in for another worker process
+# RX0000000000.. prescriptions for count // 10 customers, 30% of them transfers
+def synthetic_prescriptions(count, seed=0):
+    rng = random.Random(seed)
+    medications = Wellbot.STOCK_DATA["Medication"]
+    pharmacies = [f"Pharmacy {i}" for i in range(200)]
+    items = {}
+    for i in range(count):
+        transfer = rng.random() < 0.3
+        items[f"RX{i:010d}"] = {
+            "prescription_number": f"RX{i:010d}", "medication": rng.choice(medications),
+            "dosage": "10mg", "instructions": "Once daily", "refills": rng.randint(0, 5),
+            "sending_pharmacy": rng.choice(pharmacies) if transfer else "N/A",
+            "fax_needed": transfer, "telephone_number": "555-0100" if transfer else None,
+            "customer": f"user{rng.randrange(count // 10 or 1)}",
+        }
+    return items
+
+
+def bench_prescriptions(count, lookups=10_000):
+    rng = random.Random(0)
+    medications = Wellbot.STOCK_DATA["Medication"]
+    items = synthetic_prescriptions(count)
+    batches = [dict(list(items.items())[i:i + 50_000]) for i in range(0, count, 50_000)]
+    with tempfile.TemporaryDirectory() as tmp:
+        stores = {
+            "log store": lambda: Wellbot.PrescriptionStore(os.path.join(tmp, "prescriptions.json"),
+                                                           os.path.join(tmp, "prescriptions.log")),
+            "sqlite store": lambda: Wellbot.SQLiteStore(os.path.join(tmp, "wellbot.db"), "prescriptions"),
+        }
+        for name, open_store in stores.items():
+            writer = open_store()
+            for batch in batches:
+                writer.put_many(batch)
+            writer.close()
+
+            store = open_store()
+            repository = Wellbot.PrescriptionRepository(store)
+            start = time.perf_counter()
+            len(repository)
+            print(f"\n{name}, {count} prescriptions: loaded and indexed in {time.perf_counter() - start:.2f}s")
+
+            numbers = [f"RX{rng.randrange(count):010d}" for _ in range(lookups)]
+            for label, lookup in (("get (store)", store.get), ("get (repository)", repository.get)):
+                samples = []
+                for prescription_number in numbers:
+                    start = time.perf_counter()
+                    lookup(prescription_number)
+                    samples.append(time.perf_counter() - start)
+                report(label, samples)
+            for field, values in (("customer", [f"user{rng.randrange(count // 10 or 1)}" for _ in range(lookups)]),
+                                  ("medication", [rng.choice(medications) for _ in range(min(lookups, 200))])):
+                samples = []
+                for value in values:
+                    start = time.perf_counter()
+                    repository.find(**{field: value})
+                    samples.append(time.perf_counter() - start)
+                report(f"find by {field}", samples)
+            start = time.perf_counter()
+            faxes = repository.find(fax_needed=True)
+            print(f"find fax_needed=True: {len(faxes)} prescriptions in {(time.perf_counter() - start) * 1000:.1f}ms")
+
+            if name == "sqlite store":
+                # A write by another worker is visible to this one on its next read
+                other = Wellbot.PrescriptionRepository(open_store())
+                other.put("RX9999999999", dict(items["RX0000000000"], prescription_number="RX9999999999",
+                                               customer="late-customer"))
+                assert repository.find(customer="late-customer") == ["RX9999999999"], \
+                    "write from another worker not picked up"
+                other.close()
+                print("write by another worker visible on the next read")
+            repository.close()
+
+
+# Rendering prescription and label answers: cached views vs. formatting on
+# every request, invalidation on change, and the paged listing vs. building it
+# all at once
+def bench_views(count, lookups=10_000, hot=1000):
+    import io
+    import tracemalloc
+    rng = random.Random(0)
+    items = synthetic_prescriptions(count)
+    with tempfile.TemporaryDirectory() as tmp:
+        store = Wellbot.SQLiteStore(os.path.join(tmp, "wellbot.db"), "prescriptions")
+        store.put_many(items)
+        engine = Wellbot.WellBotEngine(store=store)
+        Wellbot.medication_info_cache = Wellbot.MedicationInfoCache()
+        Wellbot.medication_info_cache.set("Amoxicillin", SAMPLE_LABEL)
+        len(engine.store)
+
+        numbers = [f"RX{rng.randrange(hot):010d}" for _ in range(lookups)]
+        for label, render in (("prescription text+JSON (rendered each time)",
+                               lambda number: Wellbot.render_prescription(engine.prescription(number))),
+                              ("prescription_view (cached)", engine.prescription_view)):
+            samples = []
+            for prescription_number in numbers:
+                start = time.perf_counter()
+                render(prescription_number)
+                samples.append(time.perf_counter() - start)
+            report(label, samples)
+
+        sections = [rng.choice(list(Wellbot.LABEL_SECTIONS)) for _ in range(lookups)]
+        for label, render in (("label section (rendered each time)",
+                               lambda section: Wellbot.render_label_section(section, engine.drug_info("Amoxicillin")[section])),
+                              ("label_section (cached)", lambda section: engine.label_section("Amoxicillin", section))):
+            samples = []
+            for section in sections:
+                start = time.perf_counter()
+                render(section)
+                samples.append(time.perf_counter() - start)
+            report(label, samples)
+        print(f"view caches: prescriptions {Wellbot.prescription_views.stats()}, labels {Wellbot.label_views.stats()}")
+
+        # A changed record is re-rendered on its next view
+        engine.store.put("RX0000000000", dict(items["RX0000000000"], dosage="20mg"))
+        assert "Dosage: 20mg" in engine.prescription_view("RX0000000000")['text'], "stale view after an update"
+        print("updated prescription re-rendered on its next view")
+
+        # Another process's writes: the row stamped at the change mark comes back
+        # on the next refresh, unchanged, and keeps its version and cached view
+        other = Wellbot.SQLiteStore(os.path.join(tmp, "wellbot.db"), "prescriptions")
+        other.put("RX0000000001", dict(items["RX0000000001"], refills=9))
+        engine.prescription_view("RX0000000001")
+        version = engine.store.get_versioned("RX0000000001")[1]
+        other.put("RX0000000002", dict(items["RX0000000002"], refills=9))
+        assert engine.store.get("RX0000000002")["refills"] == 9
+        assert engine.store.get_versioned("RX0000000001")[1] == version, "unchanged row got a new version"
+        hits = Wellbot.prescription_views.hits
+        assert "Refills: 9" in engine.prescription_view("RX0000000001")["text"]
+        assert Wellbot.prescription_views.hits == hits + 1
+        other.close()
+
+        # Label views are stamped with set_id and effective_time: an equal label in a
+        # new dict (an index or disk cache hit) is a view cache hit, a newer one is not
+        hits, misses = Wellbot.label_views.hits, Wellbot.label_views.misses
+        Wellbot.medication_info_cache.set("Amoxicillin", json.loads(json.dumps(SAMPLE_LABEL)))
+        engine.label_section("Amoxicillin", "dosage")
+        assert (Wellbot.label_views.hits, Wellbot.label_views.misses) == (hits + 1, misses)
+        Wellbot.medication_info_cache.set("Amoxicillin", dict(SAMPLE_LABEL, effective_time="20260101",
+                                                              dosage_and_administration=["Take 250 mg."]))
+        assert "250 mg" in engine.label_section("Amoxicillin", "dosage")["text"], "stale label view"
+        print("views kept across unchanged rows and equal labels, refreshed for newer ones")
+
+        def listing_at_once():
+            return "\n".join(f"Prescription Number: {number}\n" + Wellbot.prescription_text(engine.prescription(number))
+                             for number in engine.store.find())
+
+        # Written to a sink that only notes when the first page arrives
+        first_page = []
+        sink = io.TextIOBase()
+        sink.write = lambda text: first_page.append(time.perf_counter()) if not first_page else None
+        for label, run in (("listing built at once", listing_at_once),
+                           (f"paged listing ({Wellbot.LISTING_PAGE_SIZE} per page)",
+                            lambda: Wellbot.stream_prescriptions(engine, out=sink))):
+            first_page.clear()
+            start = time.perf_counter()
+            run()
+            elapsed = time.perf_counter() - start
+            # Peak memory in a second run, tracemalloc slows everything down
+            tracemalloc.start()
+            run()
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            first = f"first output after {(first_page[0] - start) * 1000:.2f}ms, " if first_page else ""
+            print(f"{label}: {first}all {count} in {elapsed * 1000:.0f}ms, peak {peak / 2 ** 20:.1f}MiB")
+        engine.store.close()
+
+
+# Latency histogram bucket edges, in seconds
+HISTOGRAM_EDGES = [25e-6, 50e-6, 100e-6, 250e-6, 500e-6, 1e-3, 2.5e-3, 5e-3, 10e-3, 25e-3, 50e-3, 100e-3, 250e-3]
+
+def histogram(samples):
+    counts = Counter(next((edge for edge in HISTOGRAM_EDGES if sample <= edge), None) for sample in samples)
+    buckets = [(f"<={edge * 1e6:.0f}us" if edge < 1e-3 else f"<={edge * 1e3:g}ms", counts[edge])
+               for edge in HISTOGRAM_EDGES] + [(f">{HISTOGRAM_EDGES[-1] * 1e3:g}ms", counts[None])]
+    return "  ".join(f"{label}:{count}" for label, count in buckets if count)
+
+
+# Terminal stand-in for pharmacy_chatbot: stdin replays one session's
+# messages, stdout only counts bytes. Each readline marks a message boundary
+# (time, plus traced memory and live blocks when tracemalloc is on).
+class ScriptedConsole:
+    def __init__(self, messages):
+        self.messages = iter(messages)
+        self.marks = []
+        self.written = 0
+
+    def mark(self):
+        import tracemalloc
+        if tracemalloc.is_tracing():
+            current, peak = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+            self.marks.append((time.perf_counter(), current, peak, sys.getallocatedblocks()))
+        else:
+            self.marks.append((time.perf_counter(),))
+
+    def readline(self):
+        self.mark()
+        message = next(self.messages, None)
+        return "" if message is None else message + "\n"
+
+    def write(self, text):
+        self.written += len(text)
+        return len(text)
+
+    def flush(self):
+        pass
+
+
+# One customer visit as (operation, messages) segments, each starting and
+# ending at the welcome menu: every scenario of the terminal bot once
+def session_script(username, rng, prescription_numbers):
+    medication = rng.choice(Wellbot.STOCK_DATA["Medication"])
+    fax = ["y", "555-0100"] if rng.random() < 0.5 else ["n"]
+    prescription_number = rng.choice(prescription_numbers)
+    return [
+        ("login", ["1", username, "pw"]),
+        ("new prescription", ["1", "2", medication, "10mg", "Once daily", "2", *fax, "n"]),
+        ("transfer", ["1", "1", f"Pharmacy {rng.randrange(100)}", "555-0199", "n"]),
+        ("drug price", ["1", "3", medication.lower(), rng.choice(["Public", "Private"]),
+                        rng.choice(["Brand", "Generic"]), rng.choice(["y", "n"]), "n"]),
+        ("refill", ["2", "1", prescription_number, username, "n", "4"]),
+        ("availability", ["2", "2", medication, "n", "4"]),
+        ("order status", ["2", "3", prescription_number, "n", "4"]),
+        ("drug info", ["3", rng.choice(Wellbot.STOCK_DATA["Medication"]), rng.choice("123"), "no"]),
+        ("rating", ["4", "2", str(rng.randint(1, 10))]),
+        ("review", ["4", "3", rng.choice(synthetic_reviews(50, unique=False))]),
+        ("logout", ["5"]),
+    ]
+
+
+# Run pharmacy_chatbot over one scripted session; returns per-operation
+# (operation, seconds, retained bytes, peak bytes, live blocks) and bytes printed
+def replay_session(engine, script):
+    messages = [message for _, segment in script for message in segment]
+    console = ScriptedConsole(messages)
+    stdin, stdout = sys.stdin, sys.stdout
+    sys.stdin = sys.stdout = console
+    try:
+        Wellbot.pharmacy_chatbot(engine)
+    except EOFError:
+        raise AssertionError(f"scripted session went off track: {script}") from None
+    finally:
+        sys.stdin, sys.stdout = stdin, stdout
+    console.mark()
+    marks = console.marks
+    results = []
+    first = 0
+    for operation, segment in script:
+        last = first + len(segment)
+        start, end = marks[first], marks[last]
+        if len(start) > 1:
+            peak = max(mark[2] for mark in marks[first + 1:last + 1]) - start[1]
+            results.append((operation, end[0] - start[0], end[1] - start[1], peak, end[3] - start[3]))
+        else:
+            results.append((operation, end[0] - start[0]))
+        first = last
+    return results, console.written
+
+
+# Pricing catalog of size rows (the stocked medications plus synthetic names) as CSV
+def write_pricing_catalog(path, size):
+    table = synthetic_pricing_table(max(size - len(Wellbot.STOCK_DATA["Medication"]), 0))
+    rng = random.Random(3)
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(table.keys())
+        for medication in Wellbot.STOCK_DATA["Medication"]:
+            writer.writerow([medication] + [round(rng.uniform(1, 50), 2) for _ in range(len(table) - 1)])
+        writer.writerows(zip(*table.values()))
+
+
+# End-to-end suite: scripted customer sessions replayed through the terminal
+# bot (stubbed stdin/stdout, local OpenFDA stand-in) at each combination of
+# user, prescription and catalog size. Per-operation latency histograms,
+# sessions/sec, then an allocation pass under tracemalloc over a sample of sessions.
+def bench_sessions(sessions, user_sizes, prescription_sizes, catalog_sizes, scripts_path=None,
+                   save_scripts=None, allocation_sessions=200):
+    import tracemalloc
+    server, url = start_openfda_standin()
+    Wellbot.OPENFDA_LABEL_URL = url
+    recorded = None
+    if scripts_path:
+        with open(scripts_path) as f:
+            recorded = [[(operation, messages) for operation, messages in script] for script in json.load(f)]
+    summary = []
+    try:
+        for users, prescriptions, catalog in itertools.product(user_sizes, prescription_sizes, catalog_sizes):
+            rng = random.Random(0)
+            with tempfile.TemporaryDirectory() as tmp:
+                catalog_path = os.path.join(tmp, "drug_prices.csv")
+                write_pricing_catalog(catalog_path, catalog)
+                Wellbot.pricing_catalog = Wellbot.PricingCatalog(catalog_path)
+                Wellbot.IMPROVEMENTS_LOG = os.path.join(tmp, "improvements.ndjson")
+                engine = scratch_engine(tmp, users, 1_000_000)
+                Wellbot.medication_info_cache = Wellbot.MedicationInfoCache()
+                # Existing prescriptions, numbered above anything the allocator hands out
+                numbers = [f"RX{9_000_000_000 + i:010d}" for i in range(max(prescriptions, 1))]
+                for i in range(0, len(numbers), 50_000):
+                    engine.store.put_many({number: {
+                        "prescription_number": number, "medication": rng.choice(Wellbot.STOCK_DATA["Medication"]),
+                        "dosage": "10mg", "instructions": "Once daily", "refills": 2, "sending_pharmacy": "N/A",
+                        "fax_needed": False, "telephone_number": None, "customer": f"user{rng.randrange(users)}",
+                    } for number in numbers[i:i + 50_000]})
+                Wellbot.analyze_sentiment("Warm up the sentiment analyzer.")
+
+                scripts = recorded or [session_script(f"user{i % users}", rng, numbers) for i in range(sessions)]
+                if save_scripts:
+                    with open(save_scripts, "w") as f:
+                        json.dump(scripts, f)
+                print(f"\n{users} users, {prescriptions} prescriptions, {catalog} catalog rows: "
+                      f"{len(scripts)} sessions")
+                by_operation = {}
+                session_samples = []
+                printed = 0
+                start = time.perf_counter()
+                for script in scripts:
+                    results, written = replay_session(engine, script)
+                    printed += written
+                    session_samples.append(sum(result[1] for result in results))
+                    for operation, seconds in results:
+                        by_operation.setdefault(operation, []).append(seconds)
+                elapsed = time.perf_counter() - start
+                for operation, samples in by_operation.items():
+                    report(operation, samples)
+                    print(f"    {histogram(samples)}")
+                report("whole session", session_samples)
+                rate = len(scripts) / elapsed
+                print(f"{rate:.0f} sessions/sec, {printed / len(scripts):.0f} bytes printed per session")
+
+                allocations = {}
+                tracemalloc.start()
+                try:
+                    for script in scripts[:allocation_sessions]:
+                        for operation, _, retained, peak, blocks in replay_session(engine, script)[0]:
+                            allocations.setdefault(operation, []).append((retained, peak, blocks))
+                finally:
+                    tracemalloc.stop()
+                print(f"allocations (mean of {min(len(scripts), allocation_sessions)} traced sessions):")
+                for operation, samples in allocations.items():
+                    retained, peak, blocks = (statistics.mean(column) for column in zip(*samples))
+                    print(f"    {operation:<20} peak {peak / 1024:8.1f}KiB  retained {retained / 1024:7.1f}KiB  "
+                          f"live blocks {blocks:+8.1f}")
+                engine.close()
+                summary.append((users, prescriptions, catalog, rate, statistics.median(session_samples)))
+    finally:
+        server.shutdown()
+    print(f"\n{'users':>9} {'prescriptions':>14} {'catalog':>9} {'sessions/sec':>13} {'p50 session':>12}")
+    for users, prescriptions, catalog, rate, p50 in summary:
+        print(f"{users:>9} {prescriptions:>14} {catalog:>9} {rate:>13.0f} {p50 * 1e3:>10.2f}ms")
+
+
+# Cost of the instrumentation itself: ns per call for a timed no-op function
+# and a timer block (metrics off and on), then scripted engine sessions with
+# metrics off, on, and on with the sampling profiler running
+def bench_metrics(calls, sessions, users, stock, rounds=3):
+    instrumented = Wellbot.Metrics()
+
+    def noop():
+        pass
+
+    timed_noop = instrumented.timed("noop")(noop)
+
+    def timer_block():
+        with instrumented.timer("noop"):
+            pass
+
+    for enabled in (False, True):
+        instrumented.enabled = enabled
+        for label, func in (("plain call", noop), ("@timed call", timed_noop), ("with timer()", timer_block)):
+            if label == "plain call" and enabled:
+                continue
+            start = time.perf_counter()
+            for _ in range(calls):
+                func()
+            per_call = (time.perf_counter() - start) / calls
+            print(f"{label:<14} metrics {'on ' if enabled else 'off'}  {per_call * 1e9:8.0f}ns per call")
+
+    rng = random.Random(0)
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = scratch_engine(tmp, users, stock)
+        for i in range(sessions // 10):
+            engine_session(engine, f"user{i % users}", rng)
+        # Configurations take turns over several rounds so drift hits them all alike; best round counts
+        labels = ("metrics off", "metrics on", "metrics on + profiler")
+        rates = {label: [] for label in labels}
+        for _ in range(rounds):
+            for label in labels:
+                Wellbot.metrics.enabled = label != "metrics off"
+                profiler = Wellbot.SamplingProfiler(path=os.path.join(tmp, "profile.folded"))
+                if label.endswith("profiler"):
+                    profiler.start()
+                start = time.perf_counter()
+                for i in range(sessions):
+                    engine_session(engine, f"user{i % users}", rng)
+                rates[label].append(sessions / (time.perf_counter() - start))
+                profiler.stop()
+        baseline = max(rates["metrics off"])
+        for label in labels:
+            rate = max(rates[label])
+            print(f"{label:<22} {rate:8.0f} sessions/sec  ({(baseline / rate - 1) * 100:+5.1f}% time per session)")
+        snapshot = Wellbot.metrics.snapshot()
+        print(f"{len(snapshot['operations'])} operations timed, "
+              f"{sum(timer['count'] for timer in snapshot['operations'].values())} observations; "
+              f"Prometheus dump is {len(Wellbot.metrics.prometheus())} bytes")
+        Wellbot.metrics.enabled = False
+        engine.close()
+
+
+# Incoming transfer export with some typos and a few unusable rows
+def write_transfer_export(path, rows, seed=0):
+    rng = random.Random(seed)
+    medications = Wellbot.STOCK_DATA["Medication"]
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(Wellbot.TRANSFER_FIELDS)
+        for i in range(rows):
+            medication = rng.choice(medications)
+            if rng.random() < 0.05:
+                medication = misspell(medication, rng)
+            dosage = rng.choice(["500 mg", "10MG", "2.5 ml", "10 mg / 5 mL", "250mg"])
+            refills = str(rng.randint(0, 5))
+            if rng.random() < 0.01:
+                dosage = "as directed"
+            if rng.random() < 0.01:
+                refills = "-1"
+            writer.writerow([medication, dosage, "Take as prescribed", refills, f"Pharmacy {rng.randrange(50)}",
+                             "555-0100", f"customer{rng.randrange(rows // 5 or 1)}"])
+
+
+# Run `Wellbot.py --import-transfers` in cwd; returns (the process, its summary line)
+def run_transfer_import(cwd, export, processes, kill_after_rows=None):
+    repo = os.path.dirname(os.path.abspath(__file__))
+    env = dict(os.environ, WELLBOT_PRICING_CATALOG=os.path.join(repo, "drug_prices.csv"))
+    process = subprocess.Popen([sys.executable, os.path.join(repo, "Wellbot.py"), "--import-transfers", export,
+                                "--processes", str(processes)], cwd=cwd, env=env, stdout=subprocess.PIPE, text=True)
+    if kill_after_rows is not None:
+        checkpoint = f"{export}.checkpoint"
+        while process.poll() is None:
+            try:
+                with open(checkpoint) as f:
+                    if json.load(f)["rows"] >= kill_after_rows:
+                        break
+            except (FileNotFoundError, ValueError):
+                pass
+            time.sleep(0.01)
+        process.kill()
+        process.wait()
+        return process, None
+    output = process.communicate()[0]
+    return process, output.strip().splitlines()[-1]
+
+
+# Bulk transfer import: rows/sec and peak RSS of the import process, then an
+# import killed partway through and resumed, checked for exactly-once rows
+def bench_transfers(rows, processes, batch_size_rows=50_000):
+    import resource
+    with tempfile.TemporaryDirectory() as tmp:
+        export = os.path.join(tmp, "transfers.csv")
+        start = time.perf_counter()
+        write_transfer_export(export, rows)
+        print(f"{rows} row export ({os.path.getsize(export) / 2 ** 20:.0f}MiB) written in "
+              f"{time.perf_counter() - start:.1f}s")
+
+        for count in processes:
+            cwd = os.path.join(tmp, f"full{count}")
+            os.mkdir(cwd)
+            copy = os.path.join(cwd, "transfers.csv")
+            os.link(export, copy)
+            _, summary = run_transfer_import(cwd, copy, count)
+            print(f"{count} validation processes: {summary}")
+        print(f"peak RSS of an import process: {resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024:.0f}MiB")
+
+        cwd = os.path.join(tmp, "resume")
+        os.mkdir(cwd)
+        copy = os.path.join(cwd, "transfers.csv")
+        os.link(export, copy)
+        run_transfer_import(cwd, copy, processes[-1], kill_after_rows=min(rows // 2, batch_size_rows))
+        with open(f"{copy}.checkpoint") as f:
+            interrupted = json.load(f)
+        # As if the kill landed after the next batch's rejections were logged
+        # but before its checkpoint; the resumed run must not keep them
+        with open(f"{copy}.rejected.ndjson", "a") as f:
+            f.write(json.dumps({'row': interrupted['rows'] + 1, 'reason': 'interrupted batch'}) + "\n")
+        _, summary = run_transfer_import(cwd, copy, processes[-1])
+        print(f"killed after row {interrupted['rows']}, resumed: {summary}")
+        with open(f"{copy}.checkpoint") as f:
+            checkpoint = json.load(f)
+        store = Wellbot.SQLiteStore(os.path.join(cwd, "wellbot.db"), "prescriptions")
+        assert checkpoint["rows"] == rows and len(store) == checkpoint["imported"], \
+            f"resumed import is not exactly-once: {len(store)} stored, checkpoint {checkpoint}"
+        with open(f"{copy}.rejected.ndjson") as f:
+            rejected_rows = [json.loads(line)["row"] for line in f]
+        assert len(rejected_rows) == len(set(rejected_rows)) == checkpoint["rejected"], \
+            f"rejected log has {len(rejected_rows)} entries, checkpoint {checkpoint['rejected']}"
+        print(f"exactly once: {len(store)} prescriptions stored, {checkpoint['rejected']} rows rejected")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="WellBot benchmarks")
+    sub = parser.add_subparsers(dest="benchmark", required=True)
+
+    users = sub.add_parser("users", help="login/registration latency vs. number of users")
+    users.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    users.add_argument("--logins", type=int, default=2000)
+
+    kdf = sub.add_parser("kdf", help="password hashing cost per KDF work factor")
+    kdf.add_argument("--iterations", type=int, nargs="+", default=[50_000, 100_000, 200_000, 400_000])
+
+    names = sub.add_parser("names", help="typo-tolerant medication name lookups")
+    names.add_argument("--sizes", type=int, nargs="+", default=[1_000, 100_000])
+    names.add_argument("--queries", type=int, default=2000)
+
+    pricing = sub.add_parser("pricing", help="drug price lookups: pandas scan vs. pricing engine")
+    pricing.add_argument("--sizes", type=int, nargs="+", default=[10, 10_000, 1_000_000])
+    pricing.add_argument("--lookups", type=int, default=200)
+
+    catalog = sub.add_parser("catalog", help="pricing catalog startup time and RSS vs. catalog size")
+    catalog.add_argument("--sizes", type=int, nargs="+", default=[10, 100_000, 1_000_000])
+
+    inventory = sub.add_parser("inventory", help="concurrent reservation stress test")
+    inventory.add_argument("--processes", type=int, default=4)
+    inventory.add_argument("--threads", type=int, default=4)
+    inventory.add_argument("--attempts", type=int, default=8000)
+    inventory.add_argument("--stock", type=int, default=5000)
+
+    ids = sub.add_parser("ids", help="prescription number allocation across processes")
+    ids.add_argument("--total", type=int, default=10_000_000)
+    ids.add_argument("--processes", type=int, default=4)
+    ids.add_argument("--block-size", type=int, default=100_000)
+
+    sentiment = sub.add_parser("sentiment", help="review sentiment scoring throughput")
+    sentiment.add_argument("--reviews", type=int, default=100_000)
+    sentiment.add_argument("--processes", type=int, default=4)
+
+    startup = sub.add_parser("startup", help="import time and wall clock to the first prompt")
+    startup.add_argument("--runs", type=int, default=5)
+    startup.add_argument("--budget-ms", type=float, default=500)
+
+    engine = sub.add_parser("engine", help="scripted in-process sessions through WellBotEngine")
+    engine.add_argument("--sessions", type=int, default=10_000)
+    engine.add_argument("--users", type=int, default=1000)
+    engine.add_argument("--stock", type=int, default=1_000_000)
+
+    dialog = sub.add_parser("dialog", help="messages/sec and per-session memory of the conversation state machine")
+    dialog.add_argument("--sessions", type=int, default=20_000)
+    dialog.add_argument("--users", type=int, default=1000)
+    dialog.add_argument("--stock", type=int, default=1_000_000)
+
+    chat = sub.add_parser("chat", help="load generator against the HTTP/WebSocket chat server")
+    chat.add_argument("--transport", choices=["ws", "http"], default="ws")
+    chat.add_argument("--conversations", type=int, default=5000)
+    chat.add_argument("--concurrency", type=int, default=2000)
+    chat.add_argument("--workers", type=int, default=8)
+    chat.add_argument("--processes", type=int, default=1)
+
+    scaling = sub.add_parser("scaling", help="sessions/sec vs. worker processes on the shared database")
+    scaling.add_argument("--processes", type=int, nargs="+", default=[1, 2, 4, 8])
+    scaling.add_argument("--sessions", type=int, default=2000, help="sessions per process")
+    scaling.add_argument("--users", type=int, default=1000)
+    scaling.add_argument("--stock", type=int, default=1_000_000)
+
+    delivery = sub.add_parser("delivery", help="courier feed import and order status lookups")
+    delivery.add_argument("--events", type=int, default=1_000_000)
+    delivery.add_argument("--orders", type=int, default=200_000)
+
+    prescriptions = sub.add_parser("prescriptions", help="prescription lookups by number and secondary key")
+    prescriptions.add_argument("--count", type=int, default=500_000)
+    prescriptions.add_argument("--lookups", type=int, default=10_000)
+
+    sessions = sub.add_parser("sessions", help="end-to-end scripted sessions through the terminal bot, per data size")
+    sessions.add_argument("--sessions", type=int, default=1000)
+    sessions.add_argument("--users", type=int, nargs="+", default=[1000])
+    sessions.add_argument("--prescriptions", type=int, nargs="+", default=[1000, 100_000])
+    sessions.add_argument("--catalog", type=int, nargs="+", default=[100, 100_000])
+    sessions.add_argument("--scripts", help="replay recorded session scripts (JSON) instead of generated ones")
+    sessions.add_argument("--save-scripts", help="write the generated session scripts to this JSON file")
+    sessions.add_argument("--allocation-sessions", type=int, default=200)
+
+    metrics = sub.add_parser("metrics", help="overhead of the instrumentation and the sampling profiler")
+    metrics.add_argument("--calls", type=int, default=1_000_000)
+    metrics.add_argument("--sessions", type=int, default=1000, help="sessions per configuration and round")
+    metrics.add_argument("--rounds", type=int, default=3)
+    metrics.add_argument("--users", type=int, default=1000)
+    metrics.add_argument("--stock", type=int, default=1_000_000)
+
+    transfers = sub.add_parser("transfers", help="bulk prescription transfer import: rows/sec, memory, resume")
+    transfers.add_argument("--rows", type=int, default=1_000_000)
+    transfers.add_argument("--processes", type=int, nargs="+", default=[1, 4])
+
+    openfda = sub.add_parser("openfda", help="drug label lookups against a stub OpenFDA: caching, retries, coalescing")
+    openfda.add_argument("--lookups", type=int, default=1000)
+
+    labels = sub.add_parser("labels", help="local drug label index: bulk import, newer-label upsert, lookups")
+    labels.add_argument("--count", type=int, default=20_000)
+
+    views = sub.add_parser("views", help="cached prescription/label rendering and the paged prescription listing")
+    views.add_argument("--count", type=int, default=100_000)
+    views.add_argument("--lookups", type=int, default=10_000)
+
+    args = parser.parse_args()
+    if args.benchmark == "users":
+        bench_users(args.sizes, args.logins)
+    elif args.benchmark == "kdf":
+        bench_kdf(args.iterations)
+    elif args.benchmark == "names":
+        bench_names(args.sizes, args.queries)
+    elif args.benchmark == "pricing":
+        bench_pricing(args.sizes, args.lookups)
+    elif args.benchmark == "catalog":
+        bench_catalog(args.sizes)
+    elif args.benchmark == "inventory":
+        bench_inventory(args.processes, args.threads, args.attempts, args.stock)
+    elif args.benchmark == "ids":
+        bench_ids(args.total, args.processes, args.block_size)
+    elif args.benchmark == "sentiment":
+        bench_sentiment(args.reviews, args.processes)
+    elif args.benchmark == "startup":
+        bench_startup(args.runs, args.budget_ms)
+    elif args.benchmark == "engine":
+        bench_engine(args.sessions, args.users, args.stock)
+    elif args.benchmark == "dialog":
+        bench_dialog(args.sessions, args.users, args.stock)
+    elif args.benchmark == "chat":
+        bench_chat(args.transport, args.conversations, args.concurrency, args.workers, args.processes)
+    elif args.benchmark == "scaling":
+        bench_scaling(args.processes, args.sessions, args.users, args.stock)
+    elif args.benchmark == "delivery":
+        bench_delivery(args.events, args.orders)
+    elif args.benchmark == "prescriptions":
+        bench_prescriptions(args.count, args.lookups)
+    elif args.benchmark == "sessions":
+        bench_sessions(args.sessions, args.users, args.prescriptions, args.catalog, args.scripts,
+                       args.save_scripts, args.allocation_sessions)
+    elif args.benchmark == "metrics":
+        bench_metrics(args.calls, args.sessions, args.users, args.stock, args.rounds)
+    elif args.benchmark == "transfers":
+        bench_transfers(args.rows, args.processes)
+    elif args.benchmark == "openfda":
+        bench_openfda(args.lookups)
+    elif args.benchmark == "labels":
+        bench_labels(args.count)
+    elif args.benchmark == "views":
+        bench_views(args.count, args.lookups)
+
+
+if __name__ == "__main__":
+    main()